@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Prompt Size Benchmark
+Compares the size of the field-positioning prompt layout before and after the
+compact encoding, on the bundled docs/ PDFs and a dense synthetic form
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from suite import field_analysis, make_synthetic_pdfs
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Analysis reports for bundled PDFs; other PDFs get one field per label ending in ":"
+REPORTS = {"License-Transfer-Form.pdf": PROJECT_ROOT / "field_analysis_report.json"}
+
+
+def legacy_layout(page_data):
+    """The original per-span encoding, kept here as the baseline."""
+    text_layout = ""
+    for page_num, blocks in page_data.items():
+        text_layout += f"\nPage {page_num} Text Layout:\n"
+        for i, block in enumerate(blocks):
+            text = block["text"].strip()
+            if text:
+                bbox = block["bbox"]
+                text_layout += (f"  Block {i}: '{text}' at position (x:{bbox[0]:.1f}, y:{bbox[1]:.1f}, "
+                                f"width:{bbox[2]-bbox[0]:.1f}, height:{bbox[3]-bbox[1]:.1f})\n")
+    return text_layout
+
+
+def label_fields(page_data):
+    """Stand-in analysis for a PDF without a report: one field per "Label:" span."""
+    return [
+        {"field_name": block["text"].strip().rstrip(":"), "field_type": "text", "description": "",
+         "page_number": page_number}
+        for page_number, blocks in page_data.items() for block in blocks
+        if block["text"].strip().endswith(":")
+    ]
+
+
+def measure(name, pdf_path, analysis, budget):
+    """Token estimates of each encoding of one PDF's layout."""
+    from form_generator import PDFFormGenerator
+    from layout_prompt import encode_layout, estimate_tokens
+
+    page_data = PDFFormGenerator(layout_cache=None).extract_text_with_positions(str(pdf_path))
+    if analysis is None:
+        analysis = label_fields(page_data)
+    sizes = {
+        "legacy": estimate_tokens(legacy_layout(page_data)),
+        "compact": estimate_tokens(encode_layout(page_data, analysis, context=None)),
+        "filtered": estimate_tokens(encode_layout(page_data, analysis)),
+        "budgeted": estimate_tokens(encode_layout(page_data, analysis, token_budget=budget)),
+    }
+    return {"name": name, "fields": len(analysis), "tokens": sizes}
+
+
+def main():
+    """Run the prompt size benchmark."""
+    parser = argparse.ArgumentParser(description="Measure positioning prompt layout sizes.")
+    parser.add_argument("--budget", type=int, default=500, help="Token budget for the budgeted encoding")
+    parser.add_argument("--pages", type=int, default=5, help="Pages in the synthetic form")
+    parser.add_argument("--fields", type=int, default=100, help="Fields in the synthetic form")
+    parser.add_argument("--unmatched", type=int, default=10,
+                        help="Synthetic fields sent to the LLM, as if the placer missed them")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+    sys.path.insert(0, str(PROJECT_ROOT / "src"))
+    from layout_prompt import CHARS_PER_TOKEN
+
+    results = []
+    for pdf_path in sorted((PROJECT_ROOT / "docs").glob("*.pdf")):
+        if pdf_path.stem.endswith("_fillable"):
+            continue
+        report = REPORTS.get(pdf_path.name)
+        analysis = json.loads(report.read_text(encoding="utf-8")) if report and report.exists() else None
+        results.append(measure(pdf_path.name, pdf_path, analysis, args.budget))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        flat_path, _ = make_synthetic_pdfs(Path(temp_dir), args.pages, args.fields)
+        # Spread the unmatched fields over the form, as the placer's misses would be
+        analysis = field_analysis(args.pages, args.fields)
+        step = max(1, len(analysis) // max(1, args.unmatched))
+        results.append(measure(f"synthetic {args.pages}p/{args.fields}f", flat_path,
+                               analysis[::step][:args.unmatched], args.budget))
+
+    print(f"Estimated layout tokens (~{CHARS_PER_TOKEN} chars/token); budgeted = --budget {args.budget}")
+    print(f"{'document':<28} {'fields':>6} {'legacy':>8} {'compact':>8} {'filtered':>9} {'budgeted':>9} {'saved':>7}")
+    for result in results:
+        tokens = result["tokens"]
+        saved = 1 - tokens["filtered"] / tokens["legacy"] if tokens["legacy"] else 0.0
+        print(f"{result['name']:<28} {result['fields']:>6} {tokens['legacy']:>8} {tokens['compact']:>8} "
+              f"{tokens['filtered']:>9} {tokens['budgeted']:>9} {saved:>6.0%}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
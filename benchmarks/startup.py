@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measures cold-start time of the command line tools and checks that heavy
+dependencies are not imported until they are needed
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# (name, command run from the project root)
+COMMANDS = [
+    ("read_fields", [sys.executable, "src/read_fields.py"]),
+    ("read_pdf_fields", [sys.executable, "read_pdf_fields.py"]),
+    ("import_package", [sys.executable, "-c", "import src"]),
+    ("import_field_analyzer", [sys.executable, "-c",
+                               "import sys; sys.path.insert(0, 'src'); import field_analyzer"]),
+    ("import_form_generator", [sys.executable, "-c",
+                               "import sys; sys.path.insert(0, 'src'); import form_generator"]),
+]
+
+# Modules that must stay out of sys.modules after importing the given module
+HEAVY_MODULES = ["langchain", "langchain_google_genai", "fitz", "dotenv", "numpy"]
+LAZY_IMPORT_CHECKS = ["pdf_reader", "pdf_writer", "field_analyzer", "form_generator", "config"]
+
+
+def time_command(command, runs: int):
+    """Run a command repeatedly and return its wall-clock times in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def heavy_imports(module_name: str):
+    """Return the heavy modules that get loaded by importing module_name."""
+    code = (
+        "import json, sys; sys.path.insert(0, 'src'); "
+        f"import {module_name}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    """Run the startup benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark CLI cold-start time.")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per command")
+    parser.add_argument("--budget-ms", type=float, default=300.0,
+                        help="Fail when the read_fields median exceeds this")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {"startup_ms": {}, "heavy_imports": {}}
+    for name, command in COMMANDS:
+        timings = time_command(command, args.runs)
+        results["startup_ms"][name] = {
+            "median": round(statistics.median(timings), 1),
+            "min": round(min(timings), 1),
+            "max": round(max(timings), 1),
+        }
+    for module_name in LAZY_IMPORT_CHECKS:
+        results["heavy_imports"][module_name] = heavy_imports(module_name)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'command':<24} {'median':>9} {'min':>9} {'max':>9}")
+        for name, stats in results["startup_ms"].items():
+            print(f"{name:<24} {stats['median']:>7.1f}ms {stats['min']:>7.1f}ms {stats['max']:>7.1f}ms")
+        print()
+        for module_name, loaded in results["heavy_imports"].items():
+            print(f"import {module_name:<16} heavy modules loaded: {', '.join(loaded) or 'none'}")
+
+    failures = []
+    read_fields_ms = results["startup_ms"]["read_fields"]["median"]
+    if read_fields_ms > args.budget_ms:
+        failures.append(f"read_fields median {read_fields_ms:.1f}ms exceeds {args.budget_ms:.0f}ms budget")
+    for module_name, loaded in results["heavy_imports"].items():
+        if loaded:
+            failures.append(f"importing {module_name} loads {', '.join(loaded)}")
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark Suite
+Generates synthetic PDF forms and measures throughput, latency percentiles and
+peak memory of the read, fill, extract, analyze and generate stages
+"""
+
+import argparse
+import json
+import math
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+STAGES = ["read", "fill", "extract", "analyze", "generate"]
+
+# Label words for synthetic fields, cycled so labels stay distinct across a page
+LABELS = ["Full Name", "Street Address", "City", "State", "Zip Code", "Phone Number",
+          "Email Address", "Date of Birth", "License Number", "Employer", "Job Title", "Signature Date"]
+LINE_SPACING = 28
+TOP_MARGIN = 72
+
+
+def field_layout(pages: int, fields: int):
+    """Yield (page_number, field_name, label, y) for each synthetic field, spread evenly over the pages."""
+    per_page = math.ceil(fields / pages)
+    for index in range(fields):
+        page_number, row = divmod(index, per_page)
+        label = f"{LABELS[index % len(LABELS)]} {index + 1}"
+        yield page_number + 1, f"field_{index + 1}", label, TOP_MARGIN + row * LINE_SPACING
+
+
+def make_synthetic_pdfs(directory: Path, pages: int, fields: int):
+    """
+    Write a flat form (labels followed by underscore blanks) and a fillable copy with text widgets.
+
+    Returns:
+        (flat_path, fillable_path)
+    """
+    import fitz  # PyMuPDF
+
+    per_page = math.ceil(fields / pages)
+    page_height = max(792, TOP_MARGIN * 2 + per_page * LINE_SPACING)
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page(width=612, height=page_height)
+    layout = list(field_layout(pages, fields))
+    for page_number, _, label, y in layout:
+        doc[page_number - 1].insert_text((72, y), f"{label}: " + "_" * 30, fontsize=10)
+    flat_path = directory / f"synthetic_{pages}p_{fields}f.pdf"
+    doc.save(str(flat_path))
+
+    for page_number, name, label, y in layout:
+        widget = fitz.Widget()
+        widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+        widget.field_name = name
+        widget.rect = fitz.Rect(72 + fitz.get_text_length(f"{label}: ", fontsize=10), y - 11, 300, y + 3)
+        doc[page_number - 1].add_widget(widget)
+    fillable_path = directory / f"synthetic_{pages}p_{fields}f_fillable.pdf"
+    doc.save(str(fillable_path))
+    doc.close()
+    return flat_path, fillable_path
+
+
+def field_analysis(pages: int, fields: int):
+    """Analysis records for the synthetic fields, as the stub analyzer returns them."""
+    return [
+        {"field_name": name, "field_type": "text", "description": label, "page_number": page_number,
+         "confidence": 0.9, "suggested_default": "", "required": False}
+        for page_number, name, label, _ in field_layout(pages, fields)
+    ]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def stage_runner(stage: str, flat_path: Path, fillable_path: Path, pages: int, fields: int, work_dir: Path):
+    """Build the callable timed for a stage; setup cost (imports, stubs) stays outside the timing."""
+    sys.path.insert(0, str(PROJECT_ROOT / "src"))
+    from stub_llm import StubLLM
+
+    analysis = field_analysis(pages, fields)
+    if stage == "read":
+        from pdf_reader import PDFReader
+
+        def run():
+            reader = PDFReader(str(fillable_path))
+            reader.load_pdf()
+            return len(reader.schema)
+    elif stage == "fill":
+        from pdf_writer import fill_pdf_form
+
+        values = {record["field_name"]: f"Value {i}" for i, record in enumerate(analysis)}
+
+        def run():
+            return fill_pdf_form(str(fillable_path), values, BytesIO())
+    elif stage == "extract":
+        from form_generator import PDFFormGenerator
+
+        generator = PDFFormGenerator(llm=StubLLM(), layout_cache=None)
+
+        def run():
+            return len(generator.extract_text_with_positions(str(flat_path)))
+    elif stage == "analyze":
+        from field_analyzer import PDFFieldAnalyzer
+
+        analyzer = PDFFieldAnalyzer(llm=StubLLM(json.dumps(analysis)), use_cache=False, layout_cache=None)
+
+        def run():
+            return len(analyzer.analyze_fields(str(flat_path)))
+    elif stage == "generate":
+        from form_generator import PDFFormGenerator
+
+        generator = PDFFormGenerator(llm=StubLLM(), layout_cache=None)
+        output_path = work_dir / "generated.pdf"
+
+        def run():
+            positions = generator.determine_field_positions(str(flat_path), analysis)
+            generator.create_fillable_form(str(flat_path), positions, str(output_path))
+            return len(positions)
+    else:
+        raise ValueError(f"Unknown stage '{stage}'")
+    return run
+
+
+def run_stage(args: argparse.Namespace) -> dict:
+    """Time one stage in this process (invoked in a fresh subprocess per stage)."""
+    work_dir = Path(args.work_dir)
+    run = stage_runner(args.worker, Path(args.flat), Path(args.fillable), args.pages, args.fields, work_dir)
+    baseline_rss = peak_rss_mb()
+    for _ in range(args.warmup):
+        run()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        iteration_started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - iteration_started) * 1000)
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": args.iterations,
+        "throughput_per_s": round(args.iterations / elapsed, 3),
+        "latency_ms": {
+            "p50": round(percentile(timings, 0.50), 3),
+            "p90": round(percentile(timings, 0.90), 3),
+            "p99": round(percentile(timings, 0.99), 3),
+            "mean": round(statistics.fmean(timings), 3),
+            "min": round(min(timings), 3),
+            "max": round(max(timings), 3),
+        },
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Describe stages whose median latency regressed by more than tolerance against a previous run."""
+    regressions = []
+    for stage, stats in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous is None:
+            continue
+        before, after = previous["latency_ms"]["p50"], stats["latency_ms"]["p50"]
+        if before > 0 and after > before * (1 + tolerance):
+            regressions.append(f"{stage}: p50 {before:.1f}ms -> {after:.1f}ms (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description="Benchmark the read, fill, extract, analyze and generate stages.")
+    parser.add_argument("--pages", type=int, default=5, help="Pages in the synthetic form")
+    parser.add_argument("--fields", type=int, default=100, help="Fields in the synthetic form")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed iterations per stage")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed iterations per stage")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Previous results JSON; exit 1 if a stage's p50 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed p50 slowdown against --compare, as a fraction (default 0.2)")
+    # Internal: run a single stage and print its stats as JSON
+    parser.add_argument("--worker", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--flat", help=argparse.SUPPRESS)
+    parser.add_argument("--fillable", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_stage(args)))
+        return
+
+    results = {
+        "meta": {
+            "pages": args.pages,
+            "fields": args.fields,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = Path(temp_dir)
+        flat_path, fillable_path = make_synthetic_pdfs(work_dir, args.pages, args.fields)
+        for stage in args.stages:
+            # One process per stage, so peak RSS belongs to that stage alone
+            command = [sys.executable, __file__, "--worker", stage, "--flat", str(flat_path),
+                       "--fillable", str(fillable_path), "--work-dir", temp_dir,
+                       "--pages", str(args.pages), "--fields", str(args.fields),
+                       "--iterations", str(args.iterations), "--warmup", str(args.warmup)]
+            completed = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+            results["stages"][stage] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print(f"{args.pages} pages, {args.fields} fields, {args.iterations} iterations")
+    print(f"{'stage':<10} {'ops/s':>9} {'p50':>10} {'p90':>10} {'p99':>10} {'peak RSS':>10}")
+    for stage, stats in results["stages"].items():
+        latency = stats["latency_ms"]
+        print(f"{stage:<10} {stats['throughput_per_s']:>9.1f} {latency['p50']:>8.1f}ms {latency['p90']:>8.1f}ms "
+              f"{latency['p99']:>8.1f}ms {stats['peak_rss_mb']:>8.1f}MB")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
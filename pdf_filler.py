@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+PDF Filler Command Line
+Runs the pdf-filler CLI from the project root, e.g.:
+
+    python pdf_filler.py fields docs/Sample-Fillable-PDF.pdf
+    python pdf_filler.py --serve-stdin < jobs.ndjson
+"""
+
+import sys
+from pathlib import Path
+
+# Add src directory to path to import our modules
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
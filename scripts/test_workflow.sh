@@ -31,4 +31,8 @@ uv sync
 echo "📖 Running PDF reader..."
 python src/read_fields.py
 
+# Run the round-trip and parser tests
+echo "🔁 Running unit tests..."
+uv run python -m unittest discover tests
+
 echo "✅ Test completed successfully!" 
\ No newline at end of file
@@ -3,13 +3,23 @@ PDF Form Filler Package
 A modular Python package for reading and filling PDF forms using PyPDF2
 """
 
-from .main import PDFFormFillerApp
-from .pdf_reader import PDFReader, display_fields, read_pdf_fields
-from .pdf_writer import PDFWriter, fill_pdf_form, fill_single_field
+import importlib
 
 __version__ = "0.1.0"
 __author__ = "PDF Filler Team"
 
+# Public names and the submodules that define them; submodules are only
+# imported when one of their names is first accessed
+_LAZY_ATTRIBUTES = {
+    "PDFReader": "pdf_reader",
+    "display_fields": "pdf_reader",
+    "read_pdf_fields": "pdf_reader",
+    "PDFWriter": "pdf_writer",
+    "fill_pdf_form": "pdf_writer",
+    "fill_single_field": "pdf_writer",
+    "PDFFormFillerApp": "main",
+}
+
 __all__ = [
     "PDFReader",
     "PDFWriter", 
@@ -18,4 +28,17 @@ __all__ = [
     "read_pdf_fields",
     "fill_pdf_form",
     "fill_single_field"
-] 
\ No newline at end of file
+] 
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
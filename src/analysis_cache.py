@@ -0,0 +1,112 @@
+"""
+Analysis Cache Module
+Content-addressed SQLite cache for LLM field analysis results
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / ".cache" / "field_analysis.sqlite3"
+
+
+class AnalysisCache:
+    """Stores parsed analysis results keyed by document text, prompt version and model."""
+
+    def __init__(self, db_path: str = str(DEFAULT_CACHE_PATH),
+                 ttl_seconds: float = 30 * 24 * 3600,
+                 max_entries: int = 10000):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            db_path: Path of the SQLite database file, or ":memory:"
+            ttl_seconds: How long an entry stays valid after it was written
+            max_entries: Least recently used entries beyond this count are evicted
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS analysis_accessed ON analysis (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(page_texts: Dict[int, str], prompt_version: str, model_name: str) -> str:
+        """Hash the extracted page text together with the prompt version and model name."""
+        digest = hashlib.sha256()
+        digest.update(f"{prompt_version}\0{model_name}\0".encode("utf-8"))
+        for page_number in sorted(page_texts):
+            digest.update(f"{page_number}\0".encode("utf-8"))
+            digest.update(page_texts[page_number].encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached records for a key, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM analysis WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM analysis WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE analysis SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(payload)
+
+    def put(self, key: str, records: List[Dict[str, Any]]) -> None:
+        """Store records under a key, then evict expired and least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (key, payload, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(records, ensure_ascii=False), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM analysis WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._conn.execute(
+                "DELETE FROM analysis WHERE key IN ("
+                "SELECT key FROM analysis ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
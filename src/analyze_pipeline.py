@@ -0,0 +1,253 @@
+"""
+Analyze Pipeline Module
+Analyzes a directory tree of PDFs with bounded concurrency, resuming interrupted runs from a manifest
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from field_analyzer import FieldCandidate, PDFFieldAnalyzer
+from instrumentation import configure_logging, get_logger, increment, span
+from layout_extraction import DEFAULT_LAYOUT_CACHE, extract_layout
+
+MANIFEST_NAME = "manifest.sqlite3"
+PROGRESS_EVERY = 100
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PipelineStats:
+    """What a directory run did."""
+    total: int = 0
+    skipped: int = 0
+    analyzed: int = 0
+    failed: int = 0
+    fields: int = 0
+
+
+class Manifest:
+    """Checkpoint of processed documents, committed as each one finishes."""
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the manifest database.
+
+        Args:
+            db_path: Path of the SQLite database file, or ":memory:"
+        """
+        self.db_path = db_path
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                report TEXT,
+                fields INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                finished_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def finished(self) -> Dict[str, Tuple[int, int]]:
+        """Size and modification time of every successfully analyzed document, by relative path."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM documents WHERE status = 'done'"
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def record(self, path: str, size: int, mtime_ns: int, status: str,
+               report: Optional[str] = None, fields: int = 0, error: Optional[str] = None) -> None:
+        """Store the outcome of one document ("done" or "failed")."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(path, size, mtime_ns, status, report, fields, error, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, status, report, fields, error, time.time()),
+            )
+            self._conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        """Number of documents per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def _extract_page_texts(pdf_path: str, layout_cache: Optional[str]) -> Dict[int, str]:
+    """Extract page text in a worker process."""
+    cache_dir = Path(layout_cache) if layout_cache is not None else None
+    return {layout.page_number: layout.text for layout in extract_layout(pdf_path, cache_dir)}
+
+
+def _write_report(analyzer: PDFFieldAnalyzer, candidates: List[FieldCandidate], report_path: Path) -> None:
+    """Write a report atomically, so an interrupted run never leaves a truncated one behind."""
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = report_path.with_name(report_path.name + ".tmp")
+    analyzer.save_analysis_report(candidates, str(temp_path))
+    os.replace(temp_path, report_path)
+
+
+async def analyze_directory_async(directory: str, output_dir: str,
+                                  analyzer: Optional[PDFFieldAnalyzer] = None,
+                                  pattern: str = "**/*.pdf",
+                                  extract_workers: Optional[int] = None,
+                                  llm_concurrency: int = 8,
+                                  pages_per_chunk: Optional[int] = None,
+                                  manifest_path: Optional[str] = None,
+                                  layout_cache: Optional[Path] = DEFAULT_LAYOUT_CACHE) -> PipelineStats:
+    """
+    Analyze every PDF under a directory, writing one JSON report per document.
+
+    Text extraction runs in a pool of extract_workers processes and the LLM requests
+    run concurrently on the event loop, at most llm_concurrency documents at a time.
+    Only a bounded window of documents is in flight, so memory stays flat however
+    large the tree is. Each finished document is committed to the manifest; a rerun
+    skips documents that are recorded as done and have not changed since.
+
+    Args:
+        directory: Directory tree of PDFs to analyze
+        output_dir: Reports are written here, mirroring the input tree (form.pdf -> form.json)
+        analyzer: Analyzer to use (defaults to one on the shared LLM gateway)
+        pattern: Glob pattern selecting PDFs, relative to the directory
+        extract_workers: Text extraction processes (defaults to the CPU count)
+        llm_concurrency: Documents with LLM requests in flight at once
+        pages_per_chunk: Split documents into page chunks of this size, or None for one prompt each
+        manifest_path: Checkpoint database (defaults to manifest.sqlite3 in output_dir)
+        layout_cache: Directory for cached page layouts, or None to always re-extract
+
+    Returns:
+        PipelineStats for this run
+    """
+    root = Path(directory).resolve()
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(manifest_path or str(output / MANIFEST_NAME))
+    analyzer = analyzer or PDFFieldAnalyzer(layout_cache=layout_cache)
+    extract_workers = extract_workers or os.cpu_count() or 1
+    cache_dir = str(layout_cache) if layout_cache is not None else None
+
+    finished = manifest.finished()
+    stats = PipelineStats()
+    started = time.perf_counter()
+    # Documents between being picked up and being recorded: enough to keep both stages busy
+    window = asyncio.Semaphore(extract_workers * 2 + llm_concurrency)
+    llm_slots = asyncio.Semaphore(llm_concurrency)
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(max_workers=extract_workers)
+
+    async def process(pdf_path: Path, relative: str, size: int, mtime_ns: int) -> None:
+        try:
+            with span("pipeline.document"):
+                page_texts = await loop.run_in_executor(pool, _extract_page_texts, str(pdf_path), cache_dir)
+                async with llm_slots:
+                    candidates = await analyzer.analyze_text_async(page_texts, pages_per_chunk, raise_errors=True)
+                report_path = output / Path(relative).with_suffix(".json")
+                _write_report(analyzer, candidates, report_path)
+            manifest.record(relative, size, mtime_ns, "done", str(report_path), len(candidates))
+            stats.analyzed += 1
+            stats.fields += len(candidates)
+            increment("pipeline.analyzed")
+        except Exception as e:
+            manifest.record(relative, size, mtime_ns, "failed", error=str(e) or type(e).__name__)
+            stats.failed += 1
+            increment("pipeline.failed")
+            logger.error(f"Error analyzing {relative}: {e}", extra={"data": {"path": relative}})
+        finally:
+            window.release()
+            done = stats.analyzed + stats.failed
+            if done % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                logger.info(f"Processed {done} documents ({done / elapsed:.1f}/s)",
+                            extra={"data": {"analyzed": stats.analyzed, "failed": stats.failed}})
+
+    tasks = set()
+    try:
+        for pdf_path in sorted(root.glob(pattern)):
+            if not pdf_path.is_file():
+                continue
+            stats.total += 1
+            relative = pdf_path.relative_to(root).as_posix()
+            stat = pdf_path.stat()
+            if finished.get(relative) == (stat.st_size, stat.st_mtime_ns):
+                stats.skipped += 1
+                continue
+            await window.acquire()
+            task = asyncio.create_task(process(pdf_path, relative, stat.st_size, stat.st_mtime_ns))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        pool.shutdown(wait=True, cancel_futures=True)
+        manifest.close()
+    return stats
+
+
+def analyze_directory(directory: str, output_dir: str, **options) -> PipelineStats:
+    """Synchronous wrapper around analyze_directory_async."""
+    return asyncio.run(analyze_directory_async(directory, output_dir, **options))
+
+
+def main():
+    """Command line entry point for directory analysis."""
+    parser = argparse.ArgumentParser(description="Analyze every PDF under a directory, resumably.")
+    parser.add_argument("directory", help="Directory tree of PDFs to analyze")
+    parser.add_argument("output_dir", help="Directory for per-document reports and the manifest")
+    parser.add_argument("--pattern", default="**/*.pdf", help="Glob pattern of PDFs (default: '**/*.pdf')")
+    parser.add_argument("--extract-workers", type=int, default=None,
+                        help="Text extraction processes (default: CPU count)")
+    parser.add_argument("--llm-concurrency", type=int, default=8,
+                        help="Documents with LLM requests in flight at once (default: 8)")
+    parser.add_argument("--pages-per-chunk", type=int, default=None,
+                        help="Analyze page chunks of this size instead of whole documents")
+    parser.add_argument("--manifest", default=None,
+                        help="Checkpoint database (default: <output_dir>/manifest.sqlite3)")
+    args = parser.parse_args()
+    configure_logging()
+
+    if not Path(args.directory).is_dir():
+        print(f"Error: Directory not found at {args.directory}")
+        sys.exit(1)
+
+    try:
+        stats = analyze_directory(args.directory, args.output_dir, pattern=args.pattern,
+                                  extract_workers=args.extract_workers, llm_concurrency=args.llm_concurrency,
+                                  pages_per_chunk=args.pages_per_chunk, manifest_path=args.manifest)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        sys.exit(130)
+    print(f"Analyzed {stats.analyzed} documents ({stats.fields} fields), skipped {stats.skipped} already done, "
+          f"{stats.failed} failed.")
+    sys.exit(1 if stats.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Appearance Module
+Generates /AP appearance streams for filled text and combo box fields
+"""
+
+import re
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+try:
+    from PyPDF2.generic import (ArrayObject, DecodedStreamObject,
+                                DictionaryObject, FloatObject, NameObject)
+except ImportError:
+    print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
+    sys.exit(1)
+
+from template_cache import CompiledTemplate, WidgetRef
+
+# Field flags (PDF 32000-1, 12.7.4.2-4)
+_MULTILINE = 1 << 12
+_PASSWORD = 1 << 13
+_COMBO = 1 << 17
+_COMB = 1 << 24
+
+# Helvetica advance widths for character codes 32-126, in 1/1000 em (Adobe AFM)
+_HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_DEFAULT_WIDTH = 556
+# WinAnsi glyphs that /Differences arrays often restate for ASCII codes
+_ASCII_GLYPHS = {39: "/quotesingle", 96: "/grave"}
+HELVETICA_WIDTHS: Tuple[int, ...] = (
+    (_DEFAULT_WIDTH,) * 32 + _HELVETICA_WIDTHS + (_DEFAULT_WIDTH,) * (256 - 32 - len(_HELVETICA_WIDTHS))
+)
+
+# Vertical metrics shared by the standard sans-serif fonts, in em
+_ASCENT = 0.718
+_DESCENT = 0.207
+_LINE_HEIGHT = 1.15
+
+_PADDING = 2.0  # Gap between the border and the text, in points
+_AUTO_SIZE_MAX = 12.0  # Largest size chosen for auto-sized (0 Tf) fields
+_AUTO_SIZE_MIN = 4.0
+
+_DA_FONT_PATTERN = re.compile(r"/([^\s/\[\]()<>{}%]+)\s+([-+]?[\d.]+)\s+Tf")
+_DA_COLOR_PATTERN = re.compile(r"((?:[-+]?[\d.]+\s+){1,4})(g|rg|k)\b")
+
+# Guards CompiledTemplate.appearance_layouts when templates are shared between threads
+_layout_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class FieldLayout:
+    """Everything about a widget's appearance that does not depend on its value."""
+    width: float
+    height: float
+    font_name: str  # Resource name used by /DA, e.g. "/Helv"
+    font_size: float  # 0 means auto-size to the box
+    font: Any  # Font reference from the AcroForm /DR, or None if /DA names a missing font
+    widths: Tuple[int, ...]  # Advance widths of character codes 0-255
+    encoding: str  # Python codec matching the font's codes: "cp1252" for WinAnsi fonts, else "ascii"
+    quadding: int  # 0 left, 1 centered, 2 right
+    multiline: bool
+    prefix: bytes  # Background, border and clip, drawn before the text
+    color: bytes  # Text colour operator from /DA
+
+    def text_width(self, text: bytes, size: float) -> float:
+        """Width of encoded text at a font size, in points."""
+        widths = self.widths
+        return sum(widths[code] for code in text) * size / 1000
+
+
+def parse_da(da: str) -> Tuple[Optional[str], float, str]:
+    """
+    Split a default appearance string such as "/Helv 0 Tf 0 g".
+
+    Returns:
+        (font resource name or None, font size, colour operator)
+    """
+    font = _DA_FONT_PATTERN.search(da)
+    color = _DA_COLOR_PATTERN.search(da)
+    color_operator = f"{' '.join(color.group(1).split())} {color.group(2)}" if color else "0 g"
+    if font is None:
+        return None, 0.0, color_operator
+    return f"/{font.group(1)}", float(font.group(2)), color_operator
+
+
+def _inherited(field: DictionaryObject, key: str, default: Any = None) -> Any:
+    node = field
+    while node is not None:
+        if key in node:
+            return node[key]
+        node = node.get("/Parent")
+        if node is not None:
+            node = node.get_object()
+    return default
+
+
+def _color(components: Any, operator: str) -> Optional[str]:
+    """Fill or stroke operator for an /MK colour array (1 gray, 3 RGB or 4 CMYK components)."""
+    if components is None:
+        return None
+    values = [float(value) for value in components.get_object()]
+    suffix = {1: "g", 3: "rg", 4: "k"}.get(len(values))
+    if suffix is None:
+        return None
+    if operator == "stroke":
+        suffix = suffix.upper()
+    return " ".join(_number(value) for value in values) + f" {suffix}"
+
+
+def _number(value: float) -> str:
+    return f"{value:.3f}".rstrip("0").rstrip(".") or "0"
+
+
+def _font_widths(font: Optional[DictionaryObject]) -> Optional[Tuple[int, ...]]:
+    """Advance widths of a simple font, or None if its codes are not single bytes."""
+    if font is None:
+        return HELVETICA_WIDTHS
+    if font.get("/Subtype") not in ("/Type1", "/TrueType", "/MMType1"):
+        return None
+    encoding = font.get("/Encoding")
+    encoding = encoding.get_object() if encoding is not None else None
+    if isinstance(encoding, DictionaryObject):
+        # /Differences that remap printable ASCII would make the drawn text wrong
+        code = 0
+        for entry in encoding.get("/Differences", ()):
+            if isinstance(entry, int):
+                code = entry
+                continue
+            if 32 <= code <= 126 and _ASCII_GLYPHS.get(code) != entry:
+                return None
+            code += 1
+    first_char = font.get("/FirstChar")
+    widths = font.get("/Widths")
+    if first_char is not None and widths is not None:
+        table = list(HELVETICA_WIDTHS)
+        for offset, width in enumerate(widths.get_object()):
+            if 0 <= int(first_char) + offset < 256:
+                table[int(first_char) + offset] = int(float(width))
+        return tuple(table)
+    if "Courier" in str(font.get("/BaseFont", "")):
+        return (600,) * 256
+    return HELVETICA_WIDTHS
+
+
+def _font_encoding(font: Optional[DictionaryObject]) -> str:
+    """
+    Codec for text drawn in a simple font.
+
+    Only WinAnsiEncoding fonts (and the Helvetica added for missing fonts) map
+    codes 128-255 the way cp1252 does; any other encoding is only trusted for ASCII.
+    """
+    if font is None:
+        return "cp1252"
+    encoding = font.get("/Encoding")
+    encoding = encoding.get_object() if encoding is not None else None
+    if isinstance(encoding, DictionaryObject):
+        code = 0
+        for entry in encoding.get("/Differences", ()):
+            if isinstance(entry, int):
+                code = entry
+                continue
+            if code >= 128:
+                return "ascii"
+            code += 1
+        encoding = encoding.get("/BaseEncoding")
+    return "cp1252" if encoding == "/WinAnsiEncoding" else "ascii"
+
+
+def build_layout(widget: DictionaryObject, acroform: Optional[DictionaryObject]) -> Optional[FieldLayout]:
+    """
+    Work out a text or combo box widget's appearance layout.
+
+    Returns None for widgets this module does not draw: buttons, signatures, list
+    boxes, comb and password fields, rotated widgets and fonts without single-byte
+    codes. Those are left to the viewer.
+    """
+    field = widget if "/T" in widget else widget["/Parent"].get_object()
+    field_type = _inherited(field, "/FT")
+    flags = int(_inherited(field, "/Ff", 0))
+    if field_type == "/Ch" and not flags & _COMBO:
+        return None
+    if field_type not in ("/Tx", "/Ch") or flags & (_PASSWORD | _COMB):
+        return None
+    characteristics = widget.get("/MK")
+    characteristics = characteristics.get_object() if characteristics is not None else DictionaryObject()
+    if int(characteristics.get("/R", 0)) % 360:
+        return None
+
+    acroform = acroform if acroform is not None else DictionaryObject()
+    da = widget.get("/DA") or _inherited(field, "/DA") or acroform.get("/DA") or "/Helv 0 Tf 0 g"
+    font_name, font_size, color = parse_da(str(da))
+    if font_name is None:
+        return None
+    resources = acroform.get("/DR")
+    fonts = resources.get_object().get("/Font") if resources is not None else None
+    fonts = fonts.get_object() if fonts is not None else DictionaryObject()
+    font_reference = fonts.raw_get(font_name) if font_name in fonts else None
+    font = font_reference.get_object() if font_reference is not None else None
+    widths = _font_widths(font)
+    if widths is None:
+        return None
+
+    x0, y0, x1, y1 = (float(value) for value in widget["/Rect"])
+    width, height = abs(x1 - x0), abs(y1 - y0)
+
+    # Background and border from /MK and /BS, then clip the text to the padded box
+    prefix: List[str] = ["/Tx BMC", "q"]
+    background = _color(characteristics.get("/BG"), "fill")
+    if background:
+        prefix.append(f"{background} 0 0 {_number(width)} {_number(height)} re f")
+    border = _color(characteristics.get("/BC"), "stroke")
+    border_style = widget.get("/BS")
+    border_width = float(border_style.get_object().get("/W", 1)) if border_style is not None else 1.0
+    if border and border_width > 0:
+        inset = border_width / 2
+        prefix.append(f"{border} {_number(border_width)} w {_number(inset)} {_number(inset)} "
+                      f"{_number(width - border_width)} {_number(height - border_width)} re s")
+    clip = max(border_width, 1.0)
+    prefix.append(f"{_number(clip)} {_number(clip)} {_number(width - 2 * clip)} "
+                  f"{_number(height - 2 * clip)} re W n")
+
+    return FieldLayout(
+        width=width,
+        height=height,
+        font_name=font_name,
+        font_size=font_size,
+        font=font_reference,
+        widths=widths,
+        encoding=_font_encoding(font),
+        quadding=int(widget.get("/Q", _inherited(field, "/Q", acroform.get("/Q", 0)))),
+        multiline=bool(flags & _MULTILINE),
+        prefix=("\n".join(prefix) + "\n").encode("ascii"),
+        color=color.encode("ascii"),
+    )
+
+
+def layout_for(template: CompiledTemplate, widget_ref: WidgetRef) -> Optional[FieldLayout]:
+    """The cached layout of a template's widget, built on first use."""
+    layouts = template.appearance_layouts
+    if widget_ref in layouts:
+        return layouts[widget_ref]
+    page_index, annot_index = widget_ref
+    widget = template.pages[page_index]["/Annots"][annot_index].get_object()
+    layout = build_layout(widget, template.acroform)
+    with _layout_lock:
+        layouts[widget_ref] = layout
+    return layout
+
+
+def _escape(text: bytes) -> bytes:
+    return text.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r")
+
+
+def _wrap(layout: FieldLayout, text: bytes, size: float, available: float) -> List[bytes]:
+    """Break text into lines at spaces (or mid-word if a word alone is too wide)."""
+    lines: List[bytes] = []
+    for paragraph in text.replace(b"\r\n", b"\n").replace(b"\r", b"\n").split(b"\n"):
+        line = b""
+        for word in paragraph.split(b" "):
+            candidate = line + b" " + word if line else word
+            if layout.text_width(candidate, size) <= available or not line:
+                line = candidate
+            else:
+                lines.append(line)
+                line = word
+            while len(line) > 1 and layout.text_width(line, size) > available:
+                cut = len(line) - 1
+                while cut > 1 and layout.text_width(line[:cut], size) > available:
+                    cut -= 1
+                lines.append(line[:cut])
+                line = line[cut:]
+        lines.append(line)
+    return lines
+
+
+def render(layout: FieldLayout, value: str) -> Optional[bytes]:
+    """
+    Content stream drawing a value into a widget's box.
+
+    Returns None if the value has characters the font's single-byte encoding
+    cannot show (anything beyond ASCII unless the font uses WinAnsiEncoding),
+    so the caller can leave the widget to the viewer.
+    """
+    try:
+        text = value.encode(layout.encoding)
+    except UnicodeEncodeError:
+        return None
+    available = layout.width - 2 * _PADDING
+    size = layout.font_size
+    if layout.multiline:
+        size = size or _AUTO_SIZE_MAX
+        lines = _wrap(layout, text, size, available)
+        y = layout.height - _PADDING - _ASCENT * size
+    else:
+        if not size:
+            size = min(_AUTO_SIZE_MAX, (layout.height - 2 * _PADDING) / _LINE_HEIGHT)
+            text_width = layout.text_width(text, size)
+            if text_width > available > 0:
+                size *= available / text_width
+            size = max(size, _AUTO_SIZE_MIN)
+        lines = [text.replace(b"\r", b" ").replace(b"\n", b" ")]
+        y = (layout.height - (_ASCENT + _DESCENT) * size) / 2 + _DESCENT * size
+
+    out = [layout.prefix, b"BT\n", f"{layout.font_name} {_number(size)} Tf ".encode("ascii"), layout.color, b"\n"]
+    x_previous = y_previous = 0.0
+    for line in lines:
+        x = _PADDING
+        if layout.quadding:
+            slack = available - layout.text_width(line, size)
+            x += slack / 2 if layout.quadding == 1 else slack
+        out.append(f"{_number(x - x_previous)} {_number(y - y_previous)} Td (".encode("ascii"))
+        out.append(_escape(line))
+        out.append(b") Tj\n")
+        x_previous, y_previous = x, y
+        y -= size * _LINE_HEIGHT
+    out.append(b"ET\nQ\nEMC")
+    return b"".join(out)
+
+
+def appearance_stream(layout: FieldLayout, content: bytes, font: Any) -> DecodedStreamObject:
+    """Wrap rendered content in a form XObject usable as a widget's normal appearance."""
+    stream = DecodedStreamObject()
+    stream[NameObject("/Type")] = NameObject("/XObject")
+    stream[NameObject("/Subtype")] = NameObject("/Form")
+    stream[NameObject("/BBox")] = ArrayObject(
+        [FloatObject(0), FloatObject(0), FloatObject(layout.width), FloatObject(layout.height)]
+    )
+    fonts = DictionaryObject()
+    fonts[NameObject(layout.font_name)] = font
+    resources = DictionaryObject()
+    resources[NameObject("/Font")] = fonts
+    stream[NameObject("/Resources")] = resources
+    stream.set_data(content)
+    return stream
+
+
+def standard_font() -> DictionaryObject:
+    """Helvetica font dictionary, for /DA fonts missing from the AcroForm /DR."""
+    font = DictionaryObject()
+    font[NameObject("/Type")] = NameObject("/Font")
+    font[NameObject("/Subtype")] = NameObject("/Type1")
+    font[NameObject("/BaseFont")] = NameObject("/Helvetica")
+    font[NameObject("/Encoding")] = NameObject("/WinAnsiEncoding")
+    return font
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Batch Filler Module
+Fills one PDF template with many records using a pool of worker processes
+"""
+
+import argparse
+import csv
+import json
+import os
+import string
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from instrumentation import configure_logging
+from merged_output import DEFAULT_FIELD_PREFIX, write_merged
+from pdf_writer import PDFWriter
+from template_cache import (CompiledTemplate, PdfSource, is_path_source,
+                            load_template, read_source_bytes)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of filling a single record in a batch."""
+    index: int
+    output_path: str
+    success: bool
+    error: str = ""
+
+
+@dataclass
+class InvalidRecord:
+    """A record line that could not be parsed; it keeps its place so later records keep their index."""
+    line: int
+    error: str
+
+
+def read_records(records_path: str) -> Iterator[Union[Dict[str, str], InvalidRecord]]:
+    """
+    Stream field-value records from a CSV or JSONL file.
+
+    Empty CSV cells and JSONL nulls are left out of the record. A JSONL line that
+    is not a JSON object is yielded as an InvalidRecord instead of ending the stream.
+
+    Args:
+        records_path: Path to a .csv file with a header row, or a .jsonl file with one object per line
+
+    Returns:
+        Iterator of field name to value dictionaries, or InvalidRecord for malformed lines
+    """
+    path = Path(records_path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.suffix.lower() == ".csv":
+            for row in csv.DictReader(f):
+                yield {name: value for name, value in row.items() if value not in (None, "")}
+        else:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    yield InvalidRecord(line_number, f"Invalid JSON on line {line_number}: {e}")
+                    continue
+                if not isinstance(data, dict):
+                    yield InvalidRecord(line_number, f"Line {line_number} is not a JSON object")
+                    continue
+                yield {name: str(value) for name, value in data.items() if value is not None}
+
+
+def valid_records(records: Iterable[Union[Dict[str, str], InvalidRecord]]) -> Iterator[Dict[str, str]]:
+    """
+    Pass records through, stopping at the first malformed one.
+
+    For merged output, where skipping a record would renumber every later copy.
+
+    Raises:
+        ValueError: At the first InvalidRecord
+    """
+    for index, record in enumerate(records):
+        if isinstance(record, InvalidRecord):
+            raise ValueError(f"Record {index}: {record.error}")
+        yield record
+
+
+def check_output_pattern(output_pattern: str) -> None:
+    """
+    Make sure an output pattern names a different file for each record.
+
+    Raises:
+        ValueError: If the pattern uses neither {index} nor any record field
+    """
+    if not any(field is not None for _, field, _, _ in string.Formatter().parse(output_pattern)):
+        raise ValueError(f"Output pattern {output_pattern!r} must contain {{index}} or a record field, "
+                         "otherwise every record overwrites the same file")
+
+
+def format_output_path(output_pattern: str, index: int, record: Dict[str, str]) -> str:
+    """Expand an output pattern such as 'out/form_{index:05d}.pdf' for one record."""
+    return output_pattern.format_map({**record, "index": index})
+
+
+def _plan_outputs(records: Iterable[Union[Dict[str, str], InvalidRecord]],
+                  output_pattern: str) -> Iterator[Tuple[int, Dict[str, str], str, str]]:
+    """Pair each record with its output path; yields (index, record, output_path, error)."""
+    claimed: Dict[str, int] = {}
+    for index, record in enumerate(records):
+        if isinstance(record, InvalidRecord):
+            yield index, {}, "", record.error
+            continue
+        try:
+            output_path = format_output_path(output_pattern, index, record)
+        except (KeyError, IndexError, ValueError) as e:
+            yield index, record, "", f"Invalid output pattern: {e}"
+            continue
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in claimed:
+            yield index, record, output_path, f"Duplicate output path: record {claimed[key]} already writes it"
+            continue
+        claimed[key] = index
+        yield index, record, output_path, ""
+
+
+# Set once per worker process by _init_worker
+_worker_template: Optional[CompiledTemplate] = None
+
+
+def _init_worker(template_source: Union[str, bytes]) -> None:
+    """Parse the template once when a worker process starts."""
+    global _worker_template
+    _worker_template = load_template(template_source)
+
+
+def _fill_record(index: int, record: Dict[str, str], output_path: str, flatten: bool = False) -> BatchResult:
+    """Fill one record against the worker's template and write it out."""
+    try:
+        writer = PDFWriter(_worker_template)
+        if not writer.load_pdf() or not writer.fill_multiple_fields(record):
+            return BatchResult(index, output_path, False, "Failed to fill form fields")
+        if flatten and not writer.flatten():
+            return BatchResult(index, output_path, False, "Failed to flatten form")
+
+        if not writer.save_pdf(output_path):
+            return BatchResult(index, output_path, False, "Failed to save PDF")
+        return BatchResult(index, output_path, True)
+
+    except Exception as e:
+        return BatchResult(index, output_path, False, str(e))
+
+
+def fill_batch(template: Union[PdfSource, CompiledTemplate],
+               records: Iterable[Dict[str, str]],
+               output_pattern: str,
+               workers: Optional[int] = None,
+               max_pending: Optional[int] = None,
+               flatten: bool = False) -> Iterator[BatchResult]:
+    """
+    Fill one template with many records, fanning the work out over worker processes.
+
+    Records are consumed lazily and at most max_pending fills are in flight at once,
+    so arbitrarily large record streams run in bounded memory (apart from the set
+    of output paths already claimed). Results are yielded in completion order; use
+    BatchResult.index to match them back to their records. A record that cannot be
+    parsed, or whose output path repeats an earlier record's, fails without being filled.
+
+    Args:
+        template: Template path, bytes, binary file object or compiled template to fill
+        records: Iterable of field name to value dictionaries
+        output_pattern: Output path pattern, formatted with the record fields and {index}
+        workers: Number of worker processes (defaults to the CPU count, 1 runs in-process)
+        max_pending: Maximum number of queued fills (defaults to 4 per worker)
+        flatten: Burn the values into the page content and drop the form fields
+
+    Returns:
+        Iterator of BatchResult objects, one per record
+
+    Raises:
+        ValueError: If output_pattern does not vary between records
+    """
+    check_output_pattern(output_pattern)
+    # Workers receive either a path or the raw bytes and compile their own copy
+    if isinstance(template, CompiledTemplate):
+        template_source = str(template.path) if template.path is not None else template.data
+    elif is_path_source(template):
+        template_source = str(template)
+    else:
+        template_source = read_source_bytes(template)
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+
+    if workers == 1:
+        _init_worker(template_source)
+        for index, record, output_path, error in _plan_outputs(records, output_pattern):
+            if error:
+                yield BatchResult(index, output_path, False, error)
+                continue
+            yield _fill_record(index, record, output_path, flatten)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(template_source,)) as executor:
+        pending = set()
+        for index, record, output_path, error in _plan_outputs(records, output_pattern):
+            if error:
+                yield BatchResult(index, output_path, False, error)
+                continue
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_fill_record, index, record, output_path, flatten))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main():
+    """Command line entry point for batch filling."""
+    parser = argparse.ArgumentParser(description="Fill one PDF template with many records.")
+    parser.add_argument("template", help="Path to the fillable PDF template")
+    parser.add_argument("records", help="CSV (with header row) or JSONL file of field values")
+    parser.add_argument("output_pattern",
+                        help="Output path pattern, e.g. 'out/form_{index:05d}.pdf' (with --merge, the output file)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--merge", action="store_true",
+                        help="Write every filled copy into one PDF instead of one file per record; "
+                             "stops at the first record that cannot be read or filled")
+    parser.add_argument("--field-prefix", default=DEFAULT_FIELD_PREFIX,
+                        help="With --merge, parent field name of each copy (default: 'copy_{index}')")
+    parser.add_argument("--flatten", action="store_true",
+                        help="Burn values into the page content and remove the form fields")
+    args = parser.parse_args()
+    configure_logging()
+
+    if not Path(args.template).exists():
+        print(f"Error: PDF file not found at {args.template}")
+        sys.exit(1)
+
+    if args.merge and args.flatten:
+        print("Error: --flatten cannot be combined with --merge")
+        sys.exit(1)
+
+    if args.merge:
+        try:
+            stats = write_merged(args.template, valid_records(read_records(args.records)), args.output_pattern,
+                                 field_prefix=args.field_prefix)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Merged {stats.copies} forms ({stats.pages} pages, {stats.shared_objects} shared objects) "
+              f"into {args.output_pattern}.")
+        return
+
+    try:
+        check_output_pattern(args.output_pattern)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    succeeded = 0
+    failed = 0
+    for result in fill_batch(args.template, read_records(args.records),
+                             args.output_pattern, workers=args.workers, flatten=args.flatten):
+        if result.success:
+            succeeded += 1
+        else:
+            failed += 1
+            print(f"Record {result.index} failed: {result.error}", file=sys.stderr)
+
+    print(f"Filled {succeeded} forms, {failed} failed.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Command Line Interface
+Single pdf-filler entry point with subcommands and a persistent stdin worker mode
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import sys
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import instrumentation
+from template_cache import load_template
+
+
+class Session:
+    """State kept warm between jobs: LLM-backed tools are created once, on first use."""
+
+    def __init__(self):
+        """Initialize an empty session."""
+        self._analyzer = None
+        self._generator = None
+
+    @property
+    def analyzer(self):
+        """The shared field analyzer."""
+        if self._analyzer is None:
+            from field_analyzer import PDFFieldAnalyzer
+            self._analyzer = PDFFieldAnalyzer()
+        return self._analyzer
+
+    @property
+    def generator(self):
+        """The shared form generator."""
+        if self._generator is None:
+            from form_generator import PDFFormGenerator
+            self._generator = PDFFormGenerator()
+        return self._generator
+
+
+def _require_file(path: str) -> None:
+    if not Path(path).exists():
+        raise FileNotFoundError(f"PDF file not found at {path}")
+
+
+def job_fields(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """List the form fields of a PDF."""
+    _require_file(params["pdf"])
+    return {"pdf": params["pdf"], **load_template(params["pdf"]).schema.to_dict()}
+
+
+def job_fill(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Fill a PDF form with field values and save it."""
+    from pdf_writer import fill_pdf_form
+
+    _require_file(params["pdf"])
+    if not fill_pdf_form(params["pdf"], params.get("values", {}), params["output"],
+                         incremental=bool(params.get("incremental", False)),
+                         flatten=bool(params.get("flatten", False))):
+        raise RuntimeError("Failed to fill form")
+    return {"output": params["output"]}
+
+
+def job_fill_batch(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Fill one template with every record of a CSV or JSONL file, optionally merged into one PDF."""
+    from batch_filler import fill_batch, read_records, valid_records
+
+    _require_file(params["template"])
+    if params.get("merge") and params.get("flatten"):
+        raise ValueError("flatten cannot be combined with merge")
+    if params.get("merge"):
+        from merged_output import DEFAULT_FIELD_PREFIX, write_merged
+
+        stats = write_merged(params["template"], valid_records(read_records(params["records"])),
+                             params["output_pattern"],
+                             field_prefix=params.get("field_prefix") or DEFAULT_FIELD_PREFIX)
+        return {"filled": stats.copies, "failed": 0, "errors": [], "merged": asdict(stats)}
+    succeeded = 0
+    errors = []
+    for result in fill_batch(params["template"], read_records(params["records"]),
+                             params["output_pattern"], workers=params.get("workers"),
+                             flatten=bool(params.get("flatten", False))):
+        if result.success:
+            succeeded += 1
+        else:
+            errors.append({"index": result.index, "error": result.error})
+    return {"filled": succeeded, "failed": len(errors), "errors": errors}
+
+
+def job_analyze(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Identify candidate fields in a PDF with the LLM analyzer."""
+    _require_file(params["pdf"])
+    analyzer = session.analyzer
+    candidates = analyzer.analyze_fields(params["pdf"], chunked=bool(params.get("chunked", False)))
+    if params.get("output"):
+        analyzer.save_analysis_report(candidates, params["output"])
+    return {"fields": [asdict(candidate) for candidate in candidates], "output": params.get("output")}
+
+
+def job_analyze_dir(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Analyze every PDF under a directory, resuming from the manifest of an earlier run."""
+    from analyze_pipeline import analyze_directory
+
+    if not Path(params["directory"]).is_dir():
+        raise FileNotFoundError(f"Directory not found at {params['directory']}")
+    stats = analyze_directory(params["directory"], params["output_dir"], analyzer=session.analyzer,
+                              pattern=params.get("pattern") or "**/*.pdf",
+                              extract_workers=params.get("extract_workers"),
+                              llm_concurrency=params.get("llm_concurrency") or 8,
+                              pages_per_chunk=params.get("pages_per_chunk"),
+                              manifest_path=params.get("manifest"))
+    return asdict(stats)
+
+
+def job_generate(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Create a fillable PDF from an analysis report."""
+    _require_file(params["pdf"])
+    generator = session.generator
+    generator.use_llm_fallback = not params.get("no_llm_fallback", False)
+    output_path = generator.generate_form_from_analysis(params["pdf"], params["analysis"],
+                                                        params.get("output"))
+    if output_path is None:
+        raise RuntimeError("No field positions could be determined")
+    return {"output": str(output_path)}
+
+
+def job_index(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Update the template schema index and/or look fields up in it."""
+    from schema_index import DEFAULT_INDEX_PATH, SchemaIndex
+
+    index = SchemaIndex(params.get("db") or str(DEFAULT_INDEX_PATH))
+    try:
+        result: Dict[str, Any] = {}
+        if params.get("directory"):
+            result["update"] = asdict(index.update(params["directory"]))
+        if params.get("find"):
+            matches = index.find_fields(params["find"], pattern=bool(params.get("pattern")))
+            result["matches"] = [asdict(match) for match in matches]
+        else:
+            result["templates"] = [asdict(record) for record in index.templates()]
+        return result
+    finally:
+        index.close()
+
+
+JOBS: Dict[str, Callable[[Dict[str, Any], Session], Dict[str, Any]]] = {
+    "fields": job_fields,
+    "fill": job_fill,
+    "fill-batch": job_fill_batch,
+    "analyze": job_analyze,
+    "analyze-dir": job_analyze_dir,
+    "generate": job_generate,
+    "index": job_index,
+}
+
+
+def run_job(command: str, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+    """Run one job by command name."""
+    job = JOBS.get(command)
+    if job is None:
+        raise ValueError(f"Unknown command '{command}'")
+    return job(params, session)
+
+
+def serve_stdin(session: Optional[Session] = None, stdin=None, stdout=None) -> int:
+    """
+    Process newline-delimited JSON jobs until end of input.
+
+    Each input line is an object like {"id": 1, "command": "fill", "pdf": ..., ...};
+    each output line is {"id": 1, "ok": true, "result": {...}} or
+    {"id": 1, "ok": false, "error": "..."}. Diagnostics go to stderr so stdout
+    carries only results. With instrumentation enabled, successful responses also
+    carry the job's span timings and counters under "trace".
+
+    Returns:
+        Number of failed jobs
+    """
+    session = session or Session()
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    failures = 0
+    for line in stdin:
+        if not line.strip():
+            continue
+        job_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Each job must be a JSON object")
+            job_id = request.pop("id", None)
+            command = request.pop("command", None)
+            instrumentation.recorder.reset()
+            with contextlib.redirect_stdout(sys.stderr):
+                result = run_job(command, request, session)
+            response = {"id": job_id, "ok": True, "result": result}
+            if instrumentation.is_enabled():
+                response["trace"] = instrumentation.recorder.snapshot()
+        except Exception as e:
+            failures += 1
+            response = {"id": job_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
+        stdout.flush()
+    return failures
+
+
+def _parse_values(args: argparse.Namespace) -> Dict[str, str]:
+    """Merge field values from --values (JSON file or '-' for stdin) and --set NAME=VALUE."""
+    values: Dict[str, str] = {}
+    if args.values:
+        if args.values == "-":
+            values.update(json.load(sys.stdin))
+        else:
+            with open(args.values, 'r', encoding='utf-8') as f:
+                values.update(json.load(f))
+    for assignment in args.set or []:
+        name, separator, value = assignment.partition("=")
+        if not separator:
+            raise ValueError(f"Expected NAME=VALUE, got '{assignment}'")
+        values[name] = value
+    return {str(name): str(value) for name, value in values.items()}
+
+
+def _print_fields(result: Dict[str, Any]) -> None:
+    fields = result["fields"]
+    if not fields:
+        print("No form fields found in this PDF.")
+        return
+    print(f"Found {len(fields)} form fields in {Path(result['pdf']).name}:")
+    print("=" * 60)
+    for i, field in enumerate(fields, 1):
+        print(f"{i}. Field Name: {field['name']}")
+        print(f"   Type: {field['type']}")
+        print(f"   Current Value: {field['value']}")
+        print()
+
+
+def _print_index(result: Dict[str, Any]) -> None:
+    update = result.get("update")
+    if update is not None:
+        print(f"Indexed: {update['added']} added, {update['updated']} updated, "
+              f"{update['unchanged']} unchanged, {update['removed']} removed, {update['failed']} failed")
+    for match in result.get("matches", []):
+        print(f"{match['path']}: {match['name']} ({match['type']}, page {match['page']})")
+    for record in result.get("templates", []):
+        print(f"{record['path']}: {record['field_count']} fields, {record['page_count']} pages")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the argument parser for every subcommand."""
+    parser = argparse.ArgumentParser(prog="pdf-filler", description="Read, fill, analyze and generate PDF forms.")
+    parser.add_argument("--serve-stdin", action="store_true",
+                        help="Keep one process running and execute newline-delimited JSON jobs from stdin")
+    parser.add_argument("--trace", action="store_true",
+                        help="Record per-stage timings and print a summary to stderr when done")
+    subparsers = parser.add_subparsers(dest="command")
+
+    fields = subparsers.add_parser("fields", help="List the form fields of a PDF")
+    fields.add_argument("pdf")
+    fields.add_argument("--json", action="store_true", help="Print fields as JSON")
+
+    fill = subparsers.add_parser("fill", help="Fill a PDF form")
+    fill.add_argument("pdf")
+    fill.add_argument("output")
+    fill.add_argument("--values", help="JSON file of field values, or '-' to read it from stdin")
+    fill.add_argument("--set", action="append", metavar="NAME=VALUE", help="Set one field (repeatable)")
+    fill.add_argument("--incremental", action="store_true",
+                      help="Append changes as an incremental update instead of rewriting the file")
+    fill.add_argument("--flatten", action="store_true",
+                      help="Burn values into the page content and remove the form fields")
+
+    batch = subparsers.add_parser("fill-batch", help="Fill one template with many records")
+    batch.add_argument("template")
+    batch.add_argument("records", help="CSV (with header row) or JSONL file of field values")
+    batch.add_argument("output_pattern", help="Output path pattern, e.g. 'out/form_{index:05d}.pdf'")
+    batch.add_argument("--workers", type=int, default=None,
+                       help="Number of worker processes (default: CPU count)")
+    batch.add_argument("--merge", action="store_true",
+                       help="Write every filled copy into one PDF (output_pattern is the output file); "
+                            "stops at the first record that cannot be read or filled")
+    batch.add_argument("--field-prefix", default=None,
+                       help="With --merge, parent field name of each copy (default: 'copy_{index}')")
+    batch.add_argument("--flatten", action="store_true",
+                       help="Burn values into the page content and remove the form fields")
+
+    analyze = subparsers.add_parser("analyze", help="Identify candidate fields with the LLM analyzer")
+    analyze.add_argument("pdf")
+    analyze.add_argument("--output", default="field_analysis_report.json", help="Report path")
+    analyze.add_argument("--chunked", action="store_true",
+                         help="Analyze page chunks concurrently instead of the whole document at once")
+
+    analyze_dir = subparsers.add_parser("analyze-dir", help="Analyze every PDF under a directory, resumably")
+    analyze_dir.add_argument("directory")
+    analyze_dir.add_argument("output_dir", help="Directory for per-document reports and the manifest")
+    analyze_dir.add_argument("--pattern", default=None, help="Glob pattern of PDFs (default: '**/*.pdf')")
+    analyze_dir.add_argument("--extract-workers", type=int, default=None,
+                             help="Text extraction processes (default: CPU count)")
+    analyze_dir.add_argument("--llm-concurrency", type=int, default=None,
+                             help="Documents with LLM requests in flight at once (default: 8)")
+    analyze_dir.add_argument("--pages-per-chunk", type=int, default=None,
+                             help="Analyze page chunks of this size instead of whole documents")
+    analyze_dir.add_argument("--manifest", default=None,
+                             help="Checkpoint database (default: <output_dir>/manifest.sqlite3)")
+
+    generate = subparsers.add_parser("generate", help="Create a fillable PDF from an analysis report")
+    generate.add_argument("pdf")
+    generate.add_argument("analysis", help="Field analysis JSON report")
+    generate.add_argument("--output", default=None, help="Output path (default: <name>_fillable.pdf)")
+    generate.add_argument("--no-llm-fallback", action="store_true",
+                          help="Only place fields geometrically; never call the LLM")
+
+    index = subparsers.add_parser("index", help="Index template schemas and find templates by field")
+    index.add_argument("directory", nargs="?", help="Directory of templates to (re)index")
+    index.add_argument("--find", metavar="FIELD",
+                       help="List templates with this field (exact name, case-insensitive)")
+    index.add_argument("--pattern", action="store_true",
+                       help="Treat --find as an SQL LIKE pattern (%% and _ wildcards, \\ escapes)")
+    index.add_argument("--db", default=None, help="Index database path (default: .cache/schema_index.sqlite3)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    instrumentation.configure_logging()
+    if args.trace:
+        instrumentation.enable()
+        atexit.register(lambda: print(instrumentation.format_summary(), file=sys.stderr))
+
+    session = Session()
+    if args.serve_stdin:
+        return 1 if serve_stdin(session) else 0
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("command", "serve_stdin", "trace")}
+    try:
+        if args.command == "fill":
+            params = {"pdf": args.pdf, "output": args.output, "values": _parse_values(args),
+                      "incremental": args.incremental, "flatten": args.flatten}
+        result = run_job(args.command, params, session)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.command == "fields" and not args.json:
+        _print_fields(result)
+    elif args.command == "fields":
+        print(json.dumps(result, indent=2))
+    elif args.command == "fill-batch":
+        print(f"Filled {result['filled']} forms, {result['failed']} failed.")
+        for error in result["errors"]:
+            print(f"Record {error['index']} failed: {error['error']}", file=sys.stderr)
+        return 1 if result["failed"] else 0
+    elif args.command == "analyze":
+        print(f"Found {len(result['fields'])} candidate fields; report saved to {result['output']}")
+    elif args.command == "analyze-dir":
+        print(f"Analyzed {result['analyzed']} documents ({result['fields']} fields), "
+              f"skipped {result['skipped']} already done, {result['failed']} failed.")
+        return 1 if result["failed"] else 0
+    elif args.command == "index":
+        _print_index(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,12 +6,20 @@ Handles environment variables and API key management.
 import os
 from pathlib import Path
 
-from dotenv import load_dotenv
+_environment_loaded = False
 
 
 # Load environment variables from .env file
 def load_environment():
-    """Load environment variables from .env file."""
+    """Load environment variables from .env file (only the first call does any work)."""
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    _environment_loaded = True
+
+    # python-dotenv is only imported once a setting is actually needed
+    from dotenv import load_dotenv
+
     # Look for .env file in the project root
     project_root = Path(__file__).parent.parent
     env_path = project_root / ".env"
@@ -22,17 +30,33 @@ def load_environment():
         # Try to load from current directory as fallback
         load_dotenv()
 
-# Load environment variables when module is imported
-load_environment()
+
+class _EnvSetting:
+    """Class attribute that reads an environment variable on access, loading .env first."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        load_environment()
+        return os.getenv(self.name)
+
 
 class Config:
     """Configuration class for the application."""
     
     # Google GenAI API Configuration
-    GOOGLE_GENAI_API_KEY = os.getenv("GOOGLE_GENAI_API_KEY")
+    GOOGLE_GENAI_API_KEY = _EnvSetting("GOOGLE_GENAI_API_KEY")
     
     # OpenAI API Configuration (if needed)
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_API_KEY = _EnvSetting("OPENAI_API_KEY")
+
+    # LLM gateway (src/llm_gateway.py): backend ("gemini" or "fake") and limits
+    LLM_BACKEND = _EnvSetting("PDF_FILLER_LLM_BACKEND")
+    LLM_REQUESTS_PER_SECOND = _EnvSetting("PDF_FILLER_LLM_RPS")
+    LLM_MAX_CONCURRENCY = _EnvSetting("PDF_FILLER_LLM_CONCURRENCY")
+    LLM_TIMEOUT = _EnvSetting("PDF_FILLER_LLM_TIMEOUT")
+    LLM_FAKE_LATENCY = _EnvSetting("PDF_FILLER_LLM_FAKE_LATENCY")
     
     @classmethod
     def validate_google_genai_key(cls):
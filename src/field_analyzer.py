@@ -3,16 +3,27 @@ PDF Field Analyzer using PyMuPDF and LangChain Google GenAI.
 Analyzes non-fillable PDFs to identify potential fillable fields.
 """
 
+import argparse
+import asyncio
 import json
-from dataclasses import dataclass
+import random
+from dataclasses import asdict, astuple, dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-import fitz  # PyMuPDF
-from langchain.schema import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+from analysis_cache import AnalysisCache
+from instrumentation import configure_logging, get_logger, increment, span
+from json_stream import JSONArrayParser, iter_json_array
+from layout_extraction import DEFAULT_LAYOUT_CACHE, extract_layout
+from llm_gateway import DEFAULT_MODEL, LLMGateway, get_gateway
 
-from config import Config
+# Bump whenever create_analysis_prompt changes so cached analyses are not reused
+PROMPT_VERSION = "2"
+
+# Rough characters-per-token ratio used to size chunks without a tokenizer
+CHARS_PER_TOKEN = 4
+
+logger = get_logger(__name__)
 
 
 @dataclass
@@ -30,21 +41,31 @@ class FieldCandidate:
 class PDFFieldAnalyzer:
     """Analyzes PDF documents to identify potential fillable fields using AI."""
     
-    def __init__(self):
-        """Initialize the PDF Field Analyzer."""
-        # Validate Google GenAI configuration
-        api_key = Config.get_google_genai_key()
+    def __init__(self, llm: Any = None, cache: Optional[AnalysisCache] = None, use_cache: bool = True,
+                 layout_cache: Optional[Path] = DEFAULT_LAYOUT_CACHE):
+        """
+        Initialize the PDF Field Analyzer.
+        
+        Args:
+            llm: Chat model to use; defaults to the shared LLM gateway (any object with invoke(), e.g. StubLLM)
+            cache: Analysis cache to use; defaults to the on-disk cache in .cache/
+            use_cache: Set to False to always call the model
+            layout_cache: Directory for cached page layouts, or None to always re-extract
+        """
+        if llm is None:
+            # The shared, rate-limited gateway; LangChain is only loaded once a request is sent
+            llm = get_gateway()
+        self.llm = llm
+        self.model_name = str(getattr(llm, "model", DEFAULT_MODEL))
         
-        # Initialize the LangChain Google GenAI model
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=api_key,
-            temperature=0.1
-        )
+        if use_cache and cache is None:
+            cache = AnalysisCache()
+        self.cache = cache if use_cache else None
+        self.layout_cache = layout_cache
     
     def extract_text_from_pdf(self, pdf_path: str) -> Dict[int, str]:
         """
-        Extract text from PDF using PyMuPDF.
+        Extract text from PDF using the shared single-pass layout extraction.
         
         Args:
             pdf_path: Path to the PDF file
@@ -52,16 +73,7 @@ class PDFFieldAnalyzer:
         Returns:
             Dictionary mapping page numbers to extracted text
         """
-        doc = fitz.open(pdf_path)
-        page_texts = {}
-        
-        for page_num in range(doc.page_count):
-            page = doc[page_num]
-            text = page.get_text()
-            page_texts[page_num + 1] = text  # 1-indexed page numbers
-        
-        doc.close()
-        return page_texts
+        return {layout.page_number: layout.text for layout in extract_layout(pdf_path, self.layout_cache)}
     
     def create_analysis_prompt(self, page_texts: Dict[int, str]) -> str:
         """
@@ -116,58 +128,338 @@ Respond only with the JSON array, no additional text.
 """
         return prompt
     
-    def analyze_fields(self, pdf_path: str) -> List[FieldCandidate]:
+    def analyze_fields(self, pdf_path: str, chunked: bool = False, pages_per_chunk: int = 1,
+                       token_budget: Optional[int] = None, max_concurrency: int = 4,
+                       max_retries: int = 3) -> List[FieldCandidate]:
         """
         Analyze a PDF to identify potential fillable fields.
         
         Args:
             pdf_path: Path to the PDF file
+            chunked: Analyze page chunks concurrently instead of sending one prompt
+            pages_per_chunk: Maximum pages per chunk in chunked mode
+            token_budget: Optional approximate token limit per chunk in chunked mode
+            max_concurrency: Maximum number of chunk requests in flight
+            max_retries: Retries per chunk after a failed request or unparseable response
+                (only unparseable responses with the gateway, which retries requests itself)
             
         Returns:
             List of FieldCandidate objects
+            
+        Raises:
+            RuntimeError: If chunked is set and an event loop is already running in this
+                thread (e.g. in a server or notebook); await analyze_fields_async there instead
         """
+        if chunked:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                raise RuntimeError("analyze_fields(chunked=True) cannot run inside a running event loop; "
+                                   "await analyze_fields_async() instead")
+            return asyncio.run(self.analyze_fields_async(
+                pdf_path, pages_per_chunk, token_budget, max_concurrency, max_retries
+            ))
+        
         # Extract text from PDF
         page_texts = self.extract_text_from_pdf(pdf_path)
         
-        # Create analysis prompt
-        prompt = self.create_analysis_prompt(page_texts)
+        # Reuse a previous analysis of identical text with the same prompt and model
+        cache_key, cached = self._lookup_cache(page_texts)
+        if cached is not None:
+            return cached
         
-        # Get AI analysis
-        message = HumanMessage(content=prompt)
-        response = self.llm.invoke([message])
+        # Stream the AI analysis, parsing each field as soon as the model completes it
+        messages = self._analysis_messages(page_texts)
+        parser = JSONArrayParser()
+        field_candidates: List[FieldCandidate] = []
+        with span("llm.call", model=self.model_name, purpose="analyze") as current:
+            try:
+                for candidate in self.iter_field_candidates(self._response_chunks(messages), parser):
+                    field_candidates.append(candidate)
+            except Exception as e:
+                if not field_candidates:
+                    raise
+                logger.error(f"AI response failed after {len(field_candidates)} fields, keeping them: {e}")
+            current.set_attribute("fields", len(field_candidates))
+        increment("llm.calls")
         
-        # Parse the JSON response
-        try:
-            # Clean the response content by removing markdown code blocks
-            content = response.content.strip()
-            if content.startswith('```json'):
-                content = content[7:]  # Remove ```json
-            if content.endswith('```'):
-                content = content[:-3]  # Remove ```
-            content = content.strip()
+        if not parser.started:
+            logger.error("AI response contained no JSON array")
+            return []
+        if parser.finished and not parser.skipped:
+            self._store_cache(cache_key, field_candidates)
+        return field_candidates
+    
+    def stream_fields(self, pdf_path: str) -> Iterator[FieldCandidate]:
+        """
+        Yield field candidates one at a time, as soon as the model's streamed response completes each one.
+        
+        Lets placement start before the model has finished. Malformed fields are skipped,
+        and if the response is cut off the fields completed before that are still yielded.
+        
+        Args:
+            pdf_path: Path to the PDF file
             
-            fields_data = json.loads(content)
+        Yields:
+            FieldCandidate objects in response order
+        """
+        page_texts = self.extract_text_from_pdf(pdf_path)
+        cache_key, cached = self._lookup_cache(page_texts)
+        if cached is not None:
+            yield from cached
+            return
+        
+        messages = self._analysis_messages(page_texts)
+        parser = JSONArrayParser()
+        field_candidates: List[FieldCandidate] = []
+        increment("llm.calls")
+        for candidate in self.iter_field_candidates(self._response_chunks(messages), parser):
+            field_candidates.append(candidate)
+            yield candidate
+        if parser.finished and not parser.skipped:
+            self._store_cache(cache_key, field_candidates)
+    
+    async def analyze_fields_async(self, pdf_path: str, pages_per_chunk: int = 1,
+                                   token_budget: Optional[int] = None, max_concurrency: int = 4,
+                                   max_retries: int = 3) -> List[FieldCandidate]:
+        """
+        Analyze a PDF in page chunks, running the chunk requests concurrently.
+        
+        Each chunk is cached and retried on its own, so one failing chunk only loses
+        the fields of its own pages. Wall time tracks the slowest chunk rather than
+        the whole document.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            pages_per_chunk: Maximum pages per chunk
+            token_budget: Optional approximate token limit per chunk
+            max_concurrency: Maximum number of chunk requests in flight
+            max_retries: Retries per chunk after a failed request or unparseable response
+                (only unparseable responses with the gateway, which retries requests itself)
+            
+        Returns:
+            Merged and deduplicated list of FieldCandidate objects
+        """
+        page_texts = self.extract_text_from_pdf(pdf_path)
+        return await self.analyze_text_async(page_texts, pages_per_chunk, token_budget,
+                                             max_concurrency, max_retries)
+    
+    async def analyze_text_async(self, page_texts: Dict[int, str], pages_per_chunk: Optional[int] = 1,
+                                 token_budget: Optional[int] = None, max_concurrency: int = 4,
+                                 max_retries: int = 3, raise_errors: bool = False) -> List[FieldCandidate]:
+        """
+        Analyze already extracted page text, e.g. text extracted in another process.
+        
+        Args:
+            page_texts: Dictionary of page numbers to text content
+            pages_per_chunk: Maximum pages per chunk, or None to send the whole document in one prompt
+            token_budget: Optional approximate token limit per chunk
+            max_concurrency: Maximum number of chunk requests in flight
+            max_retries: Retries per chunk after a failed request or unparseable response
+                (only unparseable responses with the gateway, which retries requests itself)
+            raise_errors: Raise the last error of a chunk whose attempts all failed,
+                instead of dropping that chunk's fields
             
-            # Convert to FieldCandidate objects
+        Returns:
+            List of FieldCandidate objects (merged and deduplicated when chunked)
+        """
+        if not any(text.strip() for text in page_texts.values()):
+            return []  # Nothing to analyze, e.g. a scanned document without a text layer
+        semaphore = asyncio.Semaphore(max_concurrency)
+        if pages_per_chunk is None:
+            return await self._analyze_chunk(page_texts, semaphore, max_retries, raise_errors)
+        chunks = self.split_into_chunks(page_texts, pages_per_chunk, token_budget)
+        results = await asyncio.gather(*[
+            self._analyze_chunk(chunk, semaphore, max_retries, raise_errors) for chunk in chunks
+        ])
+        return self.merge_candidates([candidate for result in results for candidate in result])
+    
+    def split_into_chunks(self, page_texts: Dict[int, str], pages_per_chunk: int = 1,
+                          token_budget: Optional[int] = None) -> List[Dict[int, str]]:
+        """
+        Group consecutive pages into chunks.
+        
+        A chunk closes when it holds pages_per_chunk pages or adding the next page
+        would exceed token_budget. Pages are never split, so a single page larger
+        than the budget becomes a chunk of its own.
+        
+        Args:
+            page_texts: Dictionary of page numbers to text content
+            pages_per_chunk: Maximum pages per chunk
+            token_budget: Optional approximate token limit per chunk
+            
+        Returns:
+            List of page-number-to-text dictionaries
+        """
+        chunks: List[Dict[int, str]] = []
+        current: Dict[int, str] = {}
+        current_tokens = 0
+        for page_number in sorted(page_texts):
+            text = page_texts[page_number]
+            tokens = len(text) // CHARS_PER_TOKEN
+            over_budget = token_budget is not None and current_tokens + tokens > token_budget
+            if current and (len(current) >= pages_per_chunk or over_budget):
+                chunks.append(current)
+                current, current_tokens = {}, 0
+            current[page_number] = text
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    async def _analyze_chunk(self, page_texts: Dict[int, str], semaphore: asyncio.Semaphore,
+                             max_retries: int, raise_errors: bool = False) -> List[FieldCandidate]:
+        """
+        Analyze one chunk with exponential backoff, returning [] (or raising) if every attempt fails.
+
+        With the gateway as the model, failed requests have already been retried by the
+        gateway, so only responses without a JSON array are retried here.
+        """
+        cache_key, cached = self._lookup_cache(page_texts)
+        if cached is not None:
+            return cached
+        
+        messages = self._analysis_messages(page_texts)
+        pages = f"{min(page_texts)}-{max(page_texts)}"
+        field_candidates: List[FieldCandidate] = []
+        # The gateway already retries failed requests, so only unparseable responses are retried here
+        retry_requests = not isinstance(self.llm, LLMGateway)
+        for attempt in range(max_retries + 1):
+            parser = JSONArrayParser()
             field_candidates = []
-            for field_data in fields_data:
-                candidate = FieldCandidate(
-                    field_name=field_data.get("field_name", ""),
-                    field_type=field_data.get("field_type", "text"),
-                    description=field_data.get("description", ""),
-                    page_number=field_data.get("page_number", 1),
-                    confidence=field_data.get("confidence", 0.0),
-                    suggested_default=field_data.get("suggested_default", ""),
-                    required=field_data.get("required", False)
-                )
-                field_candidates.append(candidate)
+            answered = False
+            try:
+                async with semaphore:
+                    with span("llm.call", model=self.model_name, purpose="analyze", pages=pages, attempt=attempt):
+                        # A whole response rather than a stream, so identical prompts are coalesced
+                        response = await self.llm.ainvoke(messages)
+                        field_candidates = list(self.iter_field_candidates([str(response.content)], parser))
+                    increment("llm.calls")
+                answered = True
+                if not parser.started:
+                    raise ValueError("AI response contained no JSON array")
+                if parser.finished and not parser.skipped:
+                    self._store_cache(cache_key, field_candidates)
+                return field_candidates
+            except Exception as e:
+                increment("llm.failures")
+                if attempt == max_retries or not (answered or retry_requests):
+                    logger.error(f"Error analyzing pages {pages} after {attempt + 1} attempts: {e}")
+                    if raise_errors:
+                        raise
+                    return field_candidates  # Whatever the last attempt completed before failing
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+        return field_candidates
+    
+    def _analysis_messages(self, page_texts: Dict[int, str]) -> List[Any]:
+        """Build the chat messages asking the model to analyze some page text."""
+        from langchain.schema import HumanMessage
+        with span("llm.prompt_build", pages=len(page_texts)) as current:
+            prompt = self.create_analysis_prompt(page_texts)
+            current.set_attribute("chars", len(prompt))
+        return [HumanMessage(content=prompt)]
+    
+    def _response_chunks(self, messages: List[Any]) -> Iterator[str]:
+        """Send messages to the model, yielding the response text as it streams in."""
+        if hasattr(self.llm, "stream"):
+            for chunk in self.llm.stream(messages):
+                yield str(chunk.content)
+        else:
+            yield str(self.llm.invoke(messages).content)
+    
+    def merge_candidates(self, field_candidates: List[FieldCandidate]) -> List[FieldCandidate]:
+        """
+        Combine candidates gathered from separate chunks.
+        
+        Only exact duplicates are dropped, so chunked analysis names and counts
+        fields the same way as a single request for the whole document would.
+        
+        Args:
+            field_candidates: Candidates from all chunks, in chunk order
+            
+        Returns:
+            List of distinct FieldCandidate objects in their original order
+        """
+        seen: Set[Tuple] = set()
+        merged = []
+        for candidate in field_candidates:
+            key = astuple(candidate)
+            if key not in seen:
+                seen.add(key)
+                merged.append(candidate)
+        return merged
+    
+    def _lookup_cache(self, page_texts: Dict[int, str]) -> Tuple[Optional[str], Optional[List[FieldCandidate]]]:
+        """Return the cache key for some page text and any cached candidates for it."""
+        if self.cache is None:
+            return None, None
+        cache_key = AnalysisCache.make_key(page_texts, PROMPT_VERSION, self.model_name)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            increment("analysis.cache_misses")
+            return cache_key, None
+        increment("analysis.cache_hits")
+        return cache_key, [FieldCandidate(**record) for record in cached]
+    
+    def _store_cache(self, cache_key: Optional[str], field_candidates: List[FieldCandidate]) -> None:
+        """Cache parsed candidates under a key from _lookup_cache."""
+        if cache_key is not None and self.cache is not None:
+            self.cache.put(cache_key, [asdict(candidate) for candidate in field_candidates])
+    
+    def parse_field_candidates(self, content: str) -> List[FieldCandidate]:
+        """
+        Parse a complete model response into FieldCandidate objects.
+        
+        Args:
+            content: Raw response text, optionally wrapped in a ```json code block
+            
+        Returns:
+            List of FieldCandidate objects; malformed entries are skipped
             
-            return field_candidates
+        Raises:
+            ValueError: If the response contains no JSON array at all
+        """
+        parser = JSONArrayParser()
+        field_candidates = list(self.iter_field_candidates([content], parser))
+        if not parser.started:
+            raise ValueError("AI response contained no JSON array")
+        return field_candidates
+    
+    def iter_field_candidates(self, chunks: Iterable[str],
+                              parser: Optional[JSONArrayParser] = None) -> Iterator[FieldCandidate]:
+        """
+        Parse a streamed model response, yielding each FieldCandidate as soon as its object closes.
+        
+        Args:
+            chunks: Pieces of the response text, in order
+            parser: Parser to use, so the caller can check skipped/truncated afterwards
             
-        except json.JSONDecodeError as e:
-            print(f"Error parsing AI response: {e}")
-            print(f"Response content: {response.content}")
-            return []
+        Yields:
+            FieldCandidate objects; malformed entries are skipped
+        """
+        for field_data in iter_json_array(chunks, parser):
+            candidate = self._candidate_from_dict(field_data)
+            if candidate is not None:
+                yield candidate
+    
+    def _candidate_from_dict(self, field_data: Any) -> Optional[FieldCandidate]:
+        """Convert one decoded array element into a FieldCandidate, or None if it does not fit."""
+        try:
+            return FieldCandidate(
+                field_name=str(field_data.get("field_name", "")),
+                field_type=str(field_data.get("field_type", "text")),
+                description=str(field_data.get("description", "")),
+                page_number=int(field_data.get("page_number") or 1),
+                confidence=float(field_data.get("confidence") or 0.0),
+                suggested_default=str(field_data.get("suggested_default", "") or ""),
+                required=bool(field_data.get("required", False))
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            increment("json_stream.skipped")
+            logger.warning(f"Skipping malformed field entry: {e}", extra={"data": {"entry": repr(field_data)[:200]}})
+            return None
     
     def save_analysis_report(self, field_candidates: List[FieldCandidate], output_path: str):
         """
@@ -217,13 +509,18 @@ Respond only with the JSON array, no additional text.
 
 
 def main():
-    """Main function to demonstrate the field analyzer."""
+    """Analyze one PDF (see analyze_pipeline.py for whole directories)."""
+    parser = argparse.ArgumentParser(description="Identify potential fillable fields in a PDF.")
+    parser.add_argument("pdf", nargs="?", default="docs/License-Transfer-Form.pdf", help="PDF to analyze")
+    parser.add_argument("--output", default="field_analysis_report.json", help="Report path")
+    args = parser.parse_args()
+    configure_logging()
     try:
         # Initialize the analyzer
         analyzer = PDFFieldAnalyzer()
         
-        # Analyze the sample PDF
-        pdf_path = "docs/License-Transfer-Form.pdf"
+        # Analyze the PDF
+        pdf_path = args.pdf
         
         if not Path(pdf_path).exists():
             print(f"Error: PDF file not found at {pdf_path}")
@@ -238,7 +535,7 @@ def main():
         analyzer.print_analysis_summary(field_candidates)
         
         # Save report
-        report_path = "field_analysis_report.json"
+        report_path = args.output
         analyzer.save_analysis_report(field_candidates, report_path)
         print(f"\nDetailed report saved to: {report_path}")
         
@@ -0,0 +1,346 @@
+"""
+Field Placement Module
+Deterministic geometric placement of form fields from the page layout, without an LLM
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from layout_extraction import BLANK_RUN, PageLayout, Rect, TextSpan
+
+
+@dataclass
+class FieldPosition:
+    """Represents the position and properties of a field on the PDF."""
+    field_name: str
+    field_type: str
+    x: float
+    y: float
+    width: float
+    height: float
+    page_number: int
+    description: str
+    required: bool = False
+
+
+@dataclass
+class Blank:
+    """A place on the page where a user is expected to write or tick."""
+    page_number: int
+    kind: str  # underscores, rule, box, checkbox or gap
+    rect: Rect
+    # x-intervals already given to fields, so captioned blanks can be shared
+    taken: List[Tuple[float, float]] = field(default_factory=list)
+
+    def is_free(self, x0: float, x1: float) -> bool:
+        """Check whether the interval [x0, x1] does not overlap a placed field."""
+        return all(x1 <= start or x0 >= end for start, end in self.taken)
+
+
+# Default field heights by type, used when a blank does not imply one
+DEFAULT_HEIGHTS = {"checkbox": 12.0, "signature": 20.0, "dropdown": 18.0}
+DEFAULT_HEIGHT = 16.0
+MIN_GAP_WIDTH = 60.0
+# Matches scoring below this are left for the LLM fallback
+MIN_MATCH_SCORE = 0.35
+
+_STOPWORDS = {
+    "a", "an", "and", "as", "at", "be", "by", "for", "from", "in", "is", "of", "on", "or",
+    "please", "the", "this", "to", "with", "your", "part", "field", "number", "no",
+}
+_PART_TOKEN = re.compile(r"^(part|section|page)?\d+$")
+
+
+def _stem(token: str) -> str:
+    """Very small suffix stripper so that print/printed and name/names compare equal."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(token) > len(suffix) + 3 and token.endswith(suffix):
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split labels and field names (snake_case or camelCase) into comparable tokens."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    tokens = re.split(r"[^A-Za-z0-9]+", text.lower())
+    return [_stem(token) for token in tokens
+            if token and token not in _STOPWORDS and not _PART_TOKEN.match(token)]
+
+
+class SpatialIndex:
+    """Uniform grid over page rectangles for fast neighbourhood queries."""
+
+    def __init__(self, cell_size: float = 64.0):
+        """Initialize an empty index with square cells of cell_size points."""
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int, int], List[Any]] = {}
+
+    def _cell_range(self, rect: Rect) -> Iterable[Tuple[int, int]]:
+        x0, y0, x1, y1 = rect
+        for cx in range(int(x0 // self.cell_size), int(x1 // self.cell_size) + 1):
+            for cy in range(int(y0 // self.cell_size), int(y1 // self.cell_size) + 1):
+                yield cx, cy
+
+    def insert(self, page_number: int, rect: Rect, item: Any) -> None:
+        """Add an item covering rect on a page."""
+        for cx, cy in self._cell_range(rect):
+            self._cells.setdefault((page_number, cx, cy), []).append((rect, item))
+
+    def query(self, page_number: int, rect: Rect) -> List[Any]:
+        """Return the items on a page whose rectangles intersect rect."""
+        found = []
+        seen = set()
+        for cx, cy in self._cell_range(rect):
+            for other, item in self._cells.get((page_number, cx, cy), ()):
+                if id(item) in seen:
+                    continue
+                if other[0] <= rect[2] and other[2] >= rect[0] and other[1] <= rect[3] and other[3] >= rect[1]:
+                    seen.add(id(item))
+                    found.append(item)
+        return found
+
+
+def _is_checkbox(rect: Rect) -> bool:
+    width, height = rect[2] - rect[0], rect[3] - rect[1]
+    return 6 <= width <= 24 and 6 <= height <= 24 and abs(width - height) <= 4
+
+
+def find_blanks(layout: PageLayout, geometry: Optional["PageGeometry"] = None) -> List[Blank]:
+    """Detect underscore runs, drawn rules, empty boxes and checkboxes on a page."""
+    from geometry import PageGeometry, contains_text, rect_array, underlined
+
+    geometry = geometry or PageGeometry.from_layout(layout)
+    page = layout.page_number
+    blanks = [Blank(page, "underscores", span[:4]) for span in layout.spans if BLANK_RUN.fullmatch(span.text)]
+    # A rule sitting directly under a piece of text is an underline, not a blank
+    underlines = underlined(rect_array(layout.rules, page), geometry.spans)
+    for rule, is_underline in zip(layout.rules, underlines):
+        if not is_underline:
+            blanks.append(Blank(page, "rule", (rule[0], rule[1] - DEFAULT_HEIGHT, rule[2], rule[1])))
+    filled = contains_text(rect_array(layout.boxes, page), geometry.spans)
+    for box, has_text in zip(layout.boxes, filled):
+        if _is_checkbox(box):
+            blanks.append(Blank(page, "checkbox", box))
+        elif box[3] - box[1] <= 60 and not has_text:
+            blanks.append(Blank(page, "box", box))
+    return blanks
+
+
+class GeometricPlacer:
+    """Places analysed fields next to their labels using only page geometry."""
+
+    def __init__(self, min_score: float = MIN_MATCH_SCORE):
+        """
+        Initialize the placer.
+
+        Args:
+            min_score: Minimum label match score after the reading-order adjustment;
+                fields without a match this good are reported as unmatched
+        """
+        self.min_score = min_score
+
+    def place(self, layouts: List[PageLayout],
+              field_analysis: List[Dict[str, Any]]) -> Tuple[List[FieldPosition], List[Dict[str, Any]]]:
+        """
+        Place fields from an analysis report on the pages they belong to.
+
+        Fields are handled in report order, which follows the document, and each
+        field prefers labels at or after the previously placed one, so repeated
+        labels such as "City:" resolve to the right section.
+
+        Args:
+            layouts: Page layouts from extract_layout
+            field_analysis: Field analysis records (field_name, field_type, description, page_number)
+
+        Returns:
+            Tuple of (placed field positions, analysis records that could not be placed)
+        """
+        import numpy as np
+
+        from geometry import PageGeometry
+
+        pages = {layout.page_number: layout for layout in layouts}
+        geometries = {layout.page_number: PageGeometry.from_layout(layout) for layout in layouts}
+        index = SpatialIndex()
+        for layout in layouts:
+            for blank in find_blanks(layout, geometries[layout.page_number]):
+                index.insert(layout.page_number, blank.rect, blank)
+
+        labels = [(layout.page_number, span) for layout in layouts for span in layout.spans
+                  if not BLANK_RUN.fullmatch(span.text) and tokenize(span.text)]
+        label_tokens = [Counter(tokenize(span.text)) for _, span in labels]
+        document_frequency = Counter(token for tokens in label_tokens for token in tokens)
+        idf = {token: math.log(1 + len(labels) / count) for token, count in document_frequency.items()}
+
+        # Label geometry and an inverted token index, so each field is scored against every label at once
+        label_pages = np.array([page_number for page_number, _ in labels], dtype=np.int64)
+        label_y0 = np.array([span.y0 for _, span in labels])
+        label_y1 = np.array([span.y1 for _, span in labels])
+        label_x0 = np.array([span.x0 for _, span in labels])
+        page_heights = np.array([pages[page_number].height for page_number, _ in labels])
+        label_norms = np.array([math.sqrt(sum(idf[token] ** 2 for token in tokens)) for tokens in label_tokens])
+        postings: Dict[str, List[int]] = {}
+        for position, tokens in enumerate(label_tokens):
+            for token in tokens:
+                postings.setdefault(token, []).append(position)
+        label_index = {token: np.array(rows, dtype=np.intp) for token, rows in postings.items()}
+
+        positions: List[FieldPosition] = []
+        unmatched: List[Dict[str, Any]] = []
+        cursor = (0, -math.inf)
+
+        for record in field_analysis:
+            weights = self._field_weights(record, idf)
+            scores = self._scores(weights, idf, label_index, label_norms)
+            scores *= self._order_factors(cursor, label_pages, label_y0, label_y1, page_heights)
+            eligible = scores >= self.min_score
+            page_hint = record.get("page_number")
+            if page_hint:
+                eligible &= label_pages == page_hint
+            rows = np.nonzero(eligible)[0]
+            rows = rows[np.lexsort((label_x0[rows], label_y0[rows], label_pages[rows], -scores[rows]))]
+
+            placed = None
+            for row in rows.tolist():
+                page_number, span = labels[row]
+                placed = self._place_at_label(record, pages[page_number], geometries[page_number], span, index)
+                if placed is not None:
+                    break
+            if placed is None:
+                unmatched.append(record)
+                continue
+            positions.append(placed)
+            cursor = (placed.page_number, placed.y)
+        return positions, unmatched
+
+    @staticmethod
+    def _order_factors(cursor: Tuple[int, float], pages: "np.ndarray", y0: "np.ndarray", y1: "np.ndarray",
+                       page_heights: "np.ndarray") -> "np.ndarray":
+        """Favour labels just after the previously placed field in reading order."""
+        import numpy as np
+
+        if cursor[1] == -math.inf:
+            return np.ones(len(pages))
+        behind = (pages < cursor[0]) | ((pages == cursor[0]) & (y1 < cursor[1]))
+        ahead = (pages - cursor[0]) * page_heights + y0 - cursor[1]
+        return np.where(behind, 0.5, 1.0 / (1.0 + np.maximum(0.0, ahead) / page_heights))
+
+    @staticmethod
+    def _field_weights(record: Dict[str, Any], idf: Dict[str, float]) -> Dict[str, float]:
+        """Token weights for a field: its name counts fully, its description half."""
+        weights: Dict[str, float] = {}
+        for token in tokenize(record.get("description", "")):
+            weights[token] = 0.5
+        for token in tokenize(record.get("field_name", "")):
+            weights[token] = 1.0
+        return {token: weight * idf.get(token, 0.0) for token, weight in weights.items()}
+
+    @staticmethod
+    def _scores(weights: Dict[str, float], idf: Dict[str, float], label_index: Dict[str, "np.ndarray"],
+                label_norms: "np.ndarray") -> "np.ndarray":
+        """Cosine similarity between the IDF-weighted token set of a field and of every label."""
+        import numpy as np
+
+        overlap = np.zeros(len(label_norms))
+        for token, weight in weights.items():
+            rows = label_index.get(token)
+            if rows is not None:
+                overlap[rows] += weight * idf[token]
+        field_norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if field_norm == 0:
+            return overlap
+        return overlap / (field_norm * label_norms)
+
+    def _place_at_label(self, record: Dict[str, Any], layout: PageLayout, geometry: "PageGeometry",
+                        label: TextSpan, index: SpatialIndex) -> Optional[FieldPosition]:
+        """Find a free blank belonging to a label and claim it for the field."""
+        field_type = record.get("field_type", "text")
+        page = layout.page_number
+        height = label.y1 - label.y0
+        middle = (label.y0 + label.y1) / 2
+
+        if field_type == "checkbox":
+            nearby = index.query(page, (label.x0 - 40, label.y0 - 2, label.x1 + 40, label.y1 + 2))
+            boxes = [blank for blank in nearby if blank.kind == "checkbox" and not blank.taken]
+            boxes.sort(key=lambda blank: min(abs(label.x0 - blank.rect[2]), abs(blank.rect[0] - label.x1)))
+            return self._claim(record, boxes[0], boxes[0].rect[0], boxes[0].rect[2]) if boxes else None
+
+        # 1. Blank on the same row, to the right of the label
+        row = index.query(page, (label.x1 - 2, middle - 1, layout.width, middle + 1))
+        row = [blank for blank in row if blank.kind != "checkbox" and blank.rect[0] >= label.x1 - 4]
+        for blank in sorted(row, key=lambda blank: blank.rect[0]):
+            if blank.is_free(blank.rect[0], blank.rect[2]):
+                if geometry.text_between(label.x1, blank.rect[0], middle):
+                    break
+                return self._claim(record, blank, blank.rect[0], blank.rect[2])
+
+        # 2. Caption under a blank, e.g. "(First Name)" below a shared line
+        above = index.query(page, (label.x0, label.y0 - 1.5 * height, label.x1, label.y0 + 2))
+        above = [blank for blank in above if blank.kind != "checkbox" and blank.rect[3] <= label.y0 + 3]
+        for blank in sorted(above, key=lambda blank: label.y0 - blank.rect[3]):
+            x0, x1 = self._caption_interval(geometry, blank, label)
+            if blank.is_free(x0, x1):
+                return self._claim(record, blank, x0, x1)
+
+        # 3. Empty space after a label ending with a colon
+        if label.text.rstrip().endswith(":"):
+            gap_end = geometry.next_text_x(label, middle)
+            if gap_end - label.x1 >= MIN_GAP_WIDTH:
+                gap = Blank(page, "gap", (label.x1 + 4, label.y0, gap_end - 4, label.y1))
+                index.insert(page, gap.rect, gap)
+                return self._claim(record, gap, gap.rect[0], gap.rect[2])
+
+        # 4. Box or line directly below the label
+        below = index.query(page, (label.x0, label.y1 - 2, label.x1, label.y1 + 1.5 * height))
+        below = [blank for blank in below if blank.kind in ("box", "rule")
+                 and label.y1 - 3 <= blank.rect[1] <= label.y1 + height]
+        for blank in sorted(below, key=lambda blank: blank.rect[1]):
+            if blank.is_free(blank.rect[0], blank.rect[2]):
+                return self._claim(record, blank, blank.rect[0], blank.rect[2])
+        return None
+
+    @staticmethod
+    def _caption_interval(geometry: "PageGeometry", blank: Blank, caption: TextSpan) -> Tuple[float, float]:
+        """Split a blank shared by several captions at the midpoints between them."""
+        centres = geometry.caption_centres(blank.rect, caption).tolist()
+        centre = (caption.x0 + caption.x1) / 2
+        x0, x1 = blank.rect[0], blank.rect[2]
+        for left, right in zip(centres, centres[1:]):
+            midpoint = (left + right) / 2
+            if right <= centre:
+                x0 = max(x0, midpoint)
+            elif left >= centre:
+                x1 = min(x1, midpoint)
+        return x0, x1
+
+    @staticmethod
+    def _claim(record: Dict[str, Any], blank: Blank, x0: float, x1: float) -> FieldPosition:
+        """Reserve part of a blank and build the field position for it."""
+        blank.taken.append((x0, x1))
+        field_type = record.get("field_type", "text")
+        bottom = blank.rect[3]
+        height = blank.rect[3] - blank.rect[1]
+        if blank.kind in ("rule", "gap"):
+            height = DEFAULT_HEIGHTS.get(field_type, DEFAULT_HEIGHT)
+        elif blank.kind == "checkbox":
+            height = min(height, x1 - x0)
+        return FieldPosition(
+            field_name=record.get("field_name", ""),
+            field_type=field_type,
+            x=x0,
+            y=bottom - height,
+            width=x1 - x0,
+            height=height,
+            page_number=blank.page_number,
+            description=record.get("description", ""),
+            required=record.get("required", False),
+        )
+
+
+def place_fields(layouts: List[PageLayout],
+                 field_analysis: List[Dict[str, Any]]) -> Tuple[List[FieldPosition], List[Dict[str, Any]]]:
+    """Convenience function to place fields with the default GeometricPlacer."""
+    return GeometricPlacer().place(layouts, field_analysis)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Fill Server Module
+Asyncio HTTP service that fills warm, pre-parsed PDF templates in a process pool
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from form_schema import FormSchema
+from instrumentation import configure_logging, get_logger
+from pdf_writer import fill_pdf_form_to_bytes
+from template_cache import get_template_cache, load_template
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+logger = get_logger(__name__)
+
+
+def _warm_worker(template_paths: List[str]) -> None:
+    """Compile every template once when a worker process starts."""
+    for template_path in template_paths:
+        load_template(template_path)
+
+
+def _fill_in_worker(template_path: str, field_values: Dict[str, str], incremental: bool) -> bytes:
+    """Fill a template inside a worker process and return the PDF bytes."""
+    pdf_bytes = fill_pdf_form_to_bytes(load_template(template_path), field_values, incremental)
+    if pdf_bytes is None:
+        raise RuntimeError("Failed to fill form")
+    return pdf_bytes
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class ServerMetrics:
+    """Counters and a rolling latency window for the fill endpoint."""
+
+    def __init__(self, window: int = 2048):
+        """Initialize empty metrics keeping the last window fill latencies."""
+        self.latencies_ms = deque(maxlen=window)
+        self.requests = 0
+        self.fills = 0
+        self.errors = 0
+        self.rejected = 0
+        self.queued = 0
+        self.in_flight = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current metrics as a JSON-serializable dictionary."""
+        latencies = sorted(self.latencies_ms)
+        return {
+            "requests": self.requests,
+            "fills": self.fills,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "latency_ms": {
+                "count": len(latencies),
+                "p50": _percentile(latencies, 0.50),
+                "p90": _percentile(latencies, 0.90),
+                "p99": _percentile(latencies, 0.99),
+                "max": latencies[-1] if latencies else 0.0,
+            },
+        }
+
+
+class FillServer:
+    """HTTP front end that keeps templates warm and fills them in a bounded process pool."""
+
+    def __init__(self, templates_dir: str, workers: Optional[int] = None, max_queue: int = 64):
+        """
+        Initialize the server.
+
+        Args:
+            templates_dir: Directory of PDF templates; each file's stem is its template id
+            workers: Number of fill worker processes (defaults to the CPU count)
+            max_queue: Maximum number of fills waiting for a worker before requests get 503
+        """
+        self.templates_dir = Path(templates_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.metrics = ServerMetrics()
+        self.template_paths: Dict[str, str] = {
+            path.stem: str(path.resolve()) for path in sorted(self.templates_dir.glob("*.pdf"))
+        }
+        # Only the compact schemas stay in this process; workers hold the compiled templates
+        self.schemas: Dict[str, FormSchema] = {}
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start_pool(self) -> None:
+        """Extract template schemas and start the warm worker pool."""
+        for template_id, template_path in self.template_paths.items():
+            self.schemas[template_id] = load_template(template_path).schema
+        # The parsed templates are not needed here once their schemas are extracted
+        get_template_cache().clear()
+        self.executor = self._new_executor()
+        # Keep every worker busy with one queued job behind it, no more
+        self._slots = asyncio.Semaphore(self.workers * 2)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Workers start on demand, while connections are open: a forked worker would inherit
+        # those sockets and keep them open after the server closes them, so start clean processes
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_warm_worker,
+            initargs=(list(self.template_paths.values()),),
+        )
+
+    def _replace_broken_pool(self, broken: ProcessPoolExecutor) -> None:
+        """Start a fresh pool after a worker died, unless another request already did."""
+        if self.executor is not broken:
+            return
+        logger.warning("A fill worker died; restarting the worker pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._new_executor()
+
+    def close(self) -> None:
+        """Shut the worker pool down."""
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def fill(self, template_id: str, field_values: Dict[str, str],
+                   incremental: bool) -> Tuple[int, str, bytes]:
+        """Fill a template in the pool, applying backpressure when the queue is full."""
+        if template_id not in self.template_paths:
+            return self._json(404, {"error": f"Unknown template '{template_id}'"})
+        if self.metrics.queued >= self.max_queue:
+            self.metrics.rejected += 1
+            return self._json(503, {"error": "Fill queue is full, retry later"})
+
+        started = time.perf_counter()
+        self.metrics.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.metrics.queued -= 1
+
+        self.metrics.in_flight += 1
+        executor = self.executor
+        try:
+            loop = asyncio.get_running_loop()
+            pdf_bytes = await loop.run_in_executor(
+                executor, _fill_in_worker,
+                self.template_paths[template_id], field_values, incremental,
+            )
+        except BrokenProcessPool:
+            # A broken pool rejects every later job, so replace it rather than fail forever
+            self.metrics.errors += 1
+            self._replace_broken_pool(executor)
+            return self._json(500, {"error": "Fill worker died; the worker pool was restarted"})
+        except Exception as e:
+            self.metrics.errors += 1
+            return self._json(500, {"error": str(e)})
+        finally:
+            self.metrics.in_flight -= 1
+            self._slots.release()
+
+        self.metrics.fills += 1
+        self.metrics.latencies_ms.append((time.perf_counter() - started) * 1000)
+        return 200, "application/pdf", pdf_bytes
+
+    def fields(self, template_id: str) -> Tuple[int, str, bytes]:
+        """Describe the fillable fields of a template."""
+        schema = self.schemas.get(template_id)
+        if schema is None:
+            return self._json(404, {"error": f"Unknown template '{template_id}'"})
+        return self._json(200, {"template": template_id, **schema.to_dict()})
+
+    @staticmethod
+    def _json(status: int, payload: Any) -> Tuple[int, str, bytes]:
+        return status, "application/json", json.dumps(payload).encode("utf-8")
+
+    async def route(self, method: str, target: str, body: bytes) -> Tuple[int, str, bytes]:
+        """Dispatch a request to its handler."""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+
+        if parts == ["metrics"] and method == "GET":
+            return self._json(200, self.metrics.snapshot())
+        if parts == ["templates"] and method == "GET":
+            return self._json(200, {"templates": sorted(self.template_paths)})
+        if len(parts) == 3 and parts[0] == "templates":
+            template_id, action = parts[1], parts[2]
+            if action == "fields" and method == "GET":
+                return self.fields(template_id)
+            if action == "fill" and method == "POST":
+                try:
+                    field_values = json.loads(body or b"{}")
+                except json.JSONDecodeError as e:
+                    return self._json(400, {"error": f"Invalid JSON body: {e}"})
+                if not isinstance(field_values, dict):
+                    return self._json(400, {"error": "Body must be a JSON object of field values"})
+                incremental = parse_qs(url.query).get("incremental", ["0"])[0] in ("1", "true")
+                field_values = {str(name): str(value) for name, value in field_values.items()}
+                return await self.fill(template_id, field_values, incremental)
+            if action in ("fields", "fill"):
+                return self._json(405, {"error": f"{method} not allowed"})
+        return self._json(404, {"error": "Not found"})
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        """Serve HTTP/1.1 requests on one connection until it is closed."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, *self._json(400, {"error": "Malformed request"}), False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                if "transfer-encoding" in headers:
+                    # Chunked bodies are not supported; without a length the body cannot be skipped either
+                    status = 400 if "content-length" in headers else 411
+                    await self._respond(writer, *self._json(status, {
+                        "error": "Transfer-Encoding is not supported; send the body with a Content-Length"
+                    }), False)
+                    break
+
+                content_length = headers.get("content-length") or "0"
+                if not (content_length.isascii() and content_length.isdigit()):
+                    await self._respond(writer, *self._json(400, {"error": "Invalid Content-Length"}), False)
+                    break
+                length = int(content_length)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, *self._json(413, {"error": "Body too large"}), False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version != "HTTP/1.0")
+                self.metrics.requests += 1
+                status, content_type, payload = await self.route(method.upper(), target, body)
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, content_type: str,
+                       payload: bytes, keep_alive: bool) -> None:
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + payload)
+        await writer.drain()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """Start the pool and serve requests until cancelled."""
+        self.start_pool()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving {len(self.template_paths)} templates on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+
+def main():
+    """Command line entry point for the fill server."""
+    parser = argparse.ArgumentParser(description="Serve PDF form filling over HTTP.")
+    parser.add_argument("--templates", default="docs", help="Directory of PDF templates")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of fill worker processes (default: CPU count)")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="Fills allowed to wait for a worker before returning 503")
+    args = parser.parse_args()
+    configure_logging()
+
+    server = FillServer(args.templates, workers=args.workers, max_queue=args.max_queue)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,47 +3,53 @@ PDF Form Generator using PyMuPDF and LangChain Google GenAI.
 Creates fillable PDF forms based on field analysis reports.
 """
 
+import itertools
 import json
 import re
-from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import fitz  # PyMuPDF
-from langchain.schema import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+from field_placement import FieldPosition, GeometricPlacer
+from instrumentation import configure_logging, get_logger, increment, span
+from json_stream import JSONArrayParser, iter_json_array
+from layout_extraction import DEFAULT_LAYOUT_CACHE, extract_layout
+from layout_prompt import GRID, encode_layout
 
-from config import Config
-
-
-@dataclass
-class FieldPosition:
-    """Represents the position and properties of a field on the PDF."""
-    field_name: str
-    field_type: str
-    x: float
-    y: float
-    width: float
-    height: float
-    page_number: int
-    description: str
-    required: bool = False
+logger = get_logger(__name__)
 
 
 class PDFFormGenerator:
     """Generates fillable PDF forms based on field analysis data."""
     
-    def __init__(self):
-        """Initialize the PDF Form Generator."""
-        # Validate Google GenAI configuration
-        api_key = Config.get_google_genai_key()
-        
-        # Initialize the LangChain Google GenAI model
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=api_key,
-            temperature=0.1
-        )
+    def __init__(self, llm: Any = None, placer: Optional[GeometricPlacer] = None,
+                 use_llm_fallback: bool = True, layout_cache: Optional[Path] = DEFAULT_LAYOUT_CACHE,
+                 prompt_token_budget: Optional[int] = None):
+        """
+        Initialize the PDF Form Generator.
+        
+        Args:
+            llm: Chat model used for fields the geometric placer cannot match
+                (defaults to the shared LLM gateway, created on first use)
+            placer: Geometric placer used before any LLM call
+            use_llm_fallback: Whether to ask the LLM about unmatched fields at all
+            layout_cache: Directory for cached page layouts, or None to always re-extract
+            prompt_token_budget: Approximate token limit for the page layout in positioning prompts
+        """
+        self._llm = llm
+        self.placer = placer or GeometricPlacer()
+        self.use_llm_fallback = use_llm_fallback
+        self.layout_cache = layout_cache
+        self.prompt_token_budget = prompt_token_budget
+    
+    @property
+    def llm(self) -> Any:
+        """The fallback chat model, created on first use."""
+        if self._llm is None:
+            # The shared, rate-limited gateway; LangChain is only loaded once a request is sent
+            from llm_gateway import get_gateway
+
+            self._llm = get_gateway()
+        return self._llm
     
     def load_field_analysis(self, analysis_path: str) -> List[Dict[str, Any]]:
         """
@@ -62,68 +68,51 @@ class PDFFormGenerator:
         """
         Extract text from PDF with position information.
         
+        Uses the shared single-pass layout extraction, so a PDF already analyzed
+        by PDFFieldAnalyzer is not parsed again.
+        
         Args:
             pdf_path: Path to the PDF file
             
         Returns:
-            Dictionary mapping page numbers to text blocks with positions
+            Dictionary mapping page numbers to text lines with "text" and "bbox" [x0, y0, x1, y1]
         """
-        doc = fitz.open(pdf_path)
-        page_data = {}
-        
-        for page_num in range(doc.page_count):
-            page = doc[page_num]
-            # Get text blocks with position data
-            text_blocks = page.get_text("dict")["blocks"]
-            
-            formatted_blocks = []
-            for block in text_blocks:
-                if "lines" in block:  # Text block
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            formatted_blocks.append({
-                                "text": span["text"],
-                                "bbox": span["bbox"],  # [x0, y0, x1, y1]
-                                "font": span["font"],
-                                "size": span["size"]
-                            })
-            
-            page_data[page_num + 1] = formatted_blocks
-        
-        doc.close()
-        return page_data
+        return {
+            layout.page_number: [
+                {"text": text_span.text, "bbox": [text_span.x0, text_span.y0, text_span.x1, text_span.y1]}
+                for text_span in layout.spans
+            ]
+            for layout in extract_layout(pdf_path, self.layout_cache)
+        }
     
     def create_position_prompt(self, page_data: Dict[int, List[Dict]], 
-                             field_analysis: List[Dict[str, Any]]) -> str:
+                             field_analysis: List[Dict[str, Any]],
+                             token_budget: Optional[int] = None) -> str:
         """
         Create a prompt for AI to determine field positions.
         
         Args:
             page_data: Text blocks with positions from PDF
             field_analysis: List of identified fields
+            token_budget: Approximate token limit for the page layout (defaults to prompt_token_budget)
             
         Returns:
             Formatted prompt string
         """
-        # Format the text blocks for the prompt
-        text_layout = ""
-        for page_num, blocks in page_data.items():
-            text_layout += f"\nPage {page_num} Text Layout:\n"
-            for i, block in enumerate(blocks):
-                text = block["text"].strip()
-                if text:  # Only include non-empty text
-                    bbox = block["bbox"]
-                    text_layout += f"  Block {i}: '{text}' at position (x:{bbox[0]:.1f}, y:{bbox[1]:.1f}, width:{bbox[2]-bbox[0]:.1f}, height:{bbox[3]-bbox[1]:.1f})\n"
+        # Merged lines near the fields' labels, as a compact table
+        if token_budget is None:
+            token_budget = self.prompt_token_budget
+        text_layout = encode_layout(page_data, field_analysis, token_budget)
         
         # Format the fields to place
-        fields_to_place = ""
-        for field in field_analysis:
-            fields_to_place += f"- {field['field_name']} ({field['field_type']}): {field['description']}\n"
+        fields_to_place = "\n".join(
+            f"- {field['field_name']} ({field['field_type']}): {field['description']}" for field in field_analysis
+        )
         
         prompt = f"""
 You are helping to create a fillable PDF form by positioning form fields based on the document layout and field analysis.
 
-Document Text Layout:
+Document Text Layout (one text line per row: x y width height text, in points rounded to {GRID:g}; ___ is a fill-in blank):
 {text_layout}
 
 Fields to Position:
@@ -165,7 +154,10 @@ Respond with a JSON array of field position objects only, no additional text.
     def determine_field_positions(self, pdf_path: str, 
                                 field_analysis: List[Dict[str, Any]]) -> List[FieldPosition]:
         """
-        Use AI to determine optimal field positions on the PDF.
+        Determine field positions on the PDF.
+        
+        Fields are first placed geometrically next to their labels; only the
+        fields the placer cannot match are sent to the LLM.
         
         Args:
             pdf_path: Path to the original PDF
@@ -174,79 +166,160 @@ Respond with a JSON array of field position objects only, no additional text.
         Returns:
             List of FieldPosition objects
         """
-        # Extract text with positions
-        page_data = self.extract_text_with_positions(pdf_path)
+        return list(self.iter_field_positions(pdf_path, field_analysis))
+    
+    def iter_field_positions(self, pdf_path: str,
+                             field_analysis: List[Dict[str, Any]]) -> Iterator[FieldPosition]:
+        """
+        Yield field positions as they become known.
         
-        # Create positioning prompt
-        prompt = self.create_position_prompt(page_data, field_analysis)
+        Geometric placements come first; positions for the remaining fields follow
+        one by one as the LLM's streamed response completes each of them. Every
+        position is clamped to its page, and overlapping fields or fields far from
+        any text are logged.
         
-        # Get AI analysis
-        message = HumanMessage(content=prompt)
-        response = self.llm.invoke([message])
+        Args:
+            pdf_path: Path to the original PDF
+            field_analysis: List of field analysis data
+            
+        Yields:
+            FieldPosition objects
+        """
+        layouts = extract_layout(pdf_path, self.layout_cache)
+        with span("fields.place", fields=len(field_analysis)) as current:
+            field_positions, unmatched = self.placer.place(layouts, field_analysis)
+            current.set_attribute("unmatched", len(unmatched))
+        increment("fields.placed", len(field_positions))
+        ai_positions: Iterable[FieldPosition] = ()
+        if unmatched and self.use_llm_fallback:
+            logger.info(f"Placed {len(field_positions)} fields geometrically, "
+                        f"asking AI about {len(unmatched)} more...")
+            ai_positions = self._fallback_positions(pdf_path, unmatched)
         
-        # Parse the JSON response
+        # Keep every field on its page and report overlaps and fields far from any text
+        from geometry import FieldValidator
+        validator = FieldValidator(layouts)
+        for position in itertools.chain(field_positions, ai_positions):
+            position, issues = validator.check(position)
+            if issues:
+                increment("fields.invalid")
+                logger.warning(f"Field {position.field_name}: {'; '.join(issues)}",
+                               extra={"data": {"page": position.page_number}})
+            yield position
+    
+    def _fallback_positions(self, pdf_path: str,
+                            unmatched: List[Dict[str, Any]]) -> Iterator[FieldPosition]:
+        """Stream LLM positions for the unmatched fields; a failed request is logged, not raised."""
         try:
-            # Clean the response content
-            content = response.content.strip()
-            if content.startswith('```json'):
-                content = content[7:]
-            if content.endswith('```'):
-                content = content[:-3]
-            content = content.strip()
-            
-            positions_data = json.loads(content)
-            
-            # Convert to FieldPosition objects
-            field_positions = []
-            for pos_data in positions_data:
-                position = FieldPosition(
-                    field_name=pos_data.get("field_name", ""),
-                    field_type=pos_data.get("field_type", "text"),
-                    x=float(pos_data.get("x", 0)),
-                    y=float(pos_data.get("y", 0)),
-                    width=float(pos_data.get("width", 150)),
-                    height=float(pos_data.get("height", 25)),
-                    page_number=int(pos_data.get("page_number", 1)),
-                    description=pos_data.get("description", ""),
-                    required=pos_data.get("required", False)
-                )
-                field_positions.append(position)
+            yield from self.stream_field_positions(pdf_path, unmatched)
+        except Exception as e:
+            # A missing API key or exhausted retries must not discard the geometric placements
+            increment("llm.failures")
+            logger.error(f"AI positioning failed, leaving {len(unmatched)} fields unplaced: {e}")
+    
+    def ai_field_positions(self, pdf_path: str,
+                           field_analysis: List[Dict[str, Any]]) -> List[FieldPosition]:
+        """
+        Use AI to determine field positions on the PDF.
+        
+        Args:
+            pdf_path: Path to the original PDF
+            field_analysis: List of field analysis data
             
-            return field_positions
+        Returns:
+            List of FieldPosition objects
+        """
+        return list(self.stream_field_positions(pdf_path, field_analysis))
+    
+    def stream_field_positions(self, pdf_path: str,
+                               field_analysis: List[Dict[str, Any]]) -> Iterator[FieldPosition]:
+        """
+        Use AI to determine field positions, yielding each one as soon as its object closes.
+        
+        Malformed entries are skipped; if the response is cut off, the positions
+        completed before that are still yielded.
+        
+        Args:
+            pdf_path: Path to the original PDF
+            field_analysis: List of field analysis data
             
-        except json.JSONDecodeError as e:
-            print(f"Error parsing position response: {e}")
-            print(f"Response content: {response.content}")
-            return []
+        Yields:
+            FieldPosition objects
+        """
+        # Extract text with positions
+        page_data = self.extract_text_with_positions(pdf_path)
+        
+        # Create positioning prompt
+        with span("llm.prompt_build", fields=len(field_analysis)) as current:
+            prompt = self.create_position_prompt(page_data, field_analysis)
+            current.set_attribute("chars", len(prompt))
+        
+        # Stream the AI response, parsing each position as soon as it is complete
+        from langchain.schema import HumanMessage
+        messages = [HumanMessage(content=prompt)]
+        increment("llm.calls")
+        parser = JSONArrayParser()
+        for pos_data in iter_json_array(self._response_chunks(messages), parser):
+            position = self._position_from_dict(pos_data)
+            if position is not None:
+                yield position
+        if not parser.started:
+            logger.error("Position response contained no JSON array")
+    
+    def _response_chunks(self, messages: List[Any]) -> Iterator[str]:
+        """Send messages to the fallback model, yielding the response text as it streams in."""
+        if hasattr(self.llm, "stream"):
+            for chunk in self.llm.stream(messages):
+                yield str(chunk.content)
+        else:
+            yield str(self.llm.invoke(messages).content)
+    
+    def _position_from_dict(self, pos_data: Any) -> Optional[FieldPosition]:
+        """Convert one decoded array element into a FieldPosition, or None if it does not fit."""
+        try:
+            return FieldPosition(
+                field_name=str(pos_data.get("field_name", "")),
+                field_type=str(pos_data.get("field_type", "text")),
+                x=float(pos_data.get("x", 0)),
+                y=float(pos_data.get("y", 0)),
+                width=float(pos_data.get("width", 150)),
+                height=float(pos_data.get("height", 25)),
+                page_number=int(pos_data.get("page_number", 1)),
+                description=str(pos_data.get("description", "")),
+                required=bool(pos_data.get("required", False))
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            increment("json_stream.skipped")
+            logger.warning(f"Skipping malformed position entry: {e}",
+                           extra={"data": {"entry": repr(pos_data)[:200]}})
+            return None
     
     def create_fillable_form(self, original_pdf_path: str, 
-                           field_positions: List[FieldPosition], 
-                           output_path: str):
+                           field_positions: Iterable[FieldPosition], 
+                           output_path: str) -> int:
         """
         Create a fillable PDF form by adding form fields to the original PDF.
         
         Args:
             original_pdf_path: Path to the original PDF
-            field_positions: List of field positions
+            field_positions: Field positions, e.g. a list or the iterator from iter_field_positions
             output_path: Path where to save the fillable form
+            
+        Returns:
+            Number of fields added
         """
+        import fitz  # PyMuPDF
+
         # Open the original PDF
         doc = fitz.open(original_pdf_path)
-        
-        # Group fields by page
-        fields_by_page = {}
-        for field_pos in field_positions:
-            page_num = field_pos.page_number - 1  # Convert to 0-indexed
-            if page_num not in fields_by_page:
-                fields_by_page[page_num] = []
-            fields_by_page[page_num].append(field_pos)
-        
-        # Add form fields to each page
-        for page_num, fields in fields_by_page.items():
-            if page_num < doc.page_count:
-                page = doc[page_num]
+        try:
+            # Add each field as it arrives, so streamed positions are placed while the model is still answering
+            added = 0
+            for field_pos in field_positions:
+                page_num = field_pos.page_number - 1  # Convert to 0-indexed
+                if page_num < doc.page_count:
+                    page = doc[page_num]
                 
-                for field_pos in fields:
                     # Create field rectangle
                     rect = fitz.Rect(
                         field_pos.x, 
@@ -254,7 +327,7 @@ Respond with a JSON array of field position objects only, no additional text.
                         field_pos.x + field_pos.width,
                         field_pos.y + field_pos.height
                     )
-                    
+                
                     # Determine field widget type
                     if field_pos.field_type == "text":
                         widget_type = fitz.PDF_WIDGET_TYPE_TEXT
@@ -268,7 +341,7 @@ Respond with a JSON array of field position objects only, no additional text.
                         widget_type = fitz.PDF_WIDGET_TYPE_TEXT
                     else:
                         widget_type = fitz.PDF_WIDGET_TYPE_TEXT
-                    
+                
                     # Create the form field using PyMuPDF's Widget approach
                     try:
                         # Create Widget object first
@@ -278,7 +351,7 @@ Respond with a JSON array of field position objects only, no additional text.
                             "field_name": field_pos.field_name,
                             "field_value": "",
                         }
-                        
+                    
                         # Add field-specific properties
                         if field_pos.field_type == "dropdown" and "role" in field_pos.field_name.lower():
                             widget_dict["choice_values"] = [
@@ -287,24 +360,28 @@ Respond with a JSON array of field position objects only, no additional text.
                                 "Associate Broker",
                                 "Salesperson"
                             ]
-                        
+                    
                         # Create widget and add to page
                         widget = fitz.Widget()
                         for key, value in widget_dict.items():
                             if hasattr(widget, key):
                                 setattr(widget, key, value)
-                        
+                    
                         annot = page.add_widget(widget)
-                        
+                        added += 1
+                    
                     except Exception as e:
-                        print(f"Error adding field {field_pos.field_name}: {e}")
+                        logger.error(f"Error adding field {field_pos.field_name}: {e}")
                         continue
         
-        # Save the fillable form
-        doc.save(output_path)
-        doc.close()
+            # Save the fillable form
+            with span("pdf.save", fields=added):
+                doc.save(output_path)
+        finally:
+            doc.close()
         
-        print(f"Fillable form saved to: {output_path}")
+        logger.info(f"Fillable form saved to: {output_path}")
+        return added
     
     def generate_form_from_analysis(self, original_pdf_path: str, 
                                   analysis_path: str, 
@@ -321,24 +398,26 @@ Respond with a JSON array of field position objects only, no additional text.
             base_name = Path(original_pdf_path).stem
             output_path = f"{base_name}_fillable.pdf"
         
-        print(f"Loading field analysis from: {analysis_path}")
+        logger.info(f"Loading field analysis from: {analysis_path}")
         field_analysis = self.load_field_analysis(analysis_path)
         
-        print(f"Determining field positions using AI...")
-        field_positions = self.determine_field_positions(original_pdf_path, field_analysis)
-        
-        if not field_positions:
-            print("No field positions could be determined.")
+        logger.info("Determining field positions...")
+        field_positions = self.iter_field_positions(original_pdf_path, field_analysis)
+        first = next(field_positions, None)
+        if first is None:
+            logger.warning("No field positions could be determined.")
             return
         
-        print(f"Creating fillable form with {len(field_positions)} fields...")
-        self.create_fillable_form(original_pdf_path, field_positions, output_path)
+        # Fields are added as their positions arrive, including those still streaming from the AI
+        added = self.create_fillable_form(original_pdf_path, itertools.chain([first], field_positions), output_path)
+        logger.info(f"Created fillable form with {added} fields")
         
         return output_path
 
 
 def main():
     """Main function to demonstrate the form generator."""
+    configure_logging()
     try:
         # Initialize the generator
         generator = PDFFormGenerator()
@@ -0,0 +1,265 @@
+"""
+Form Schema Module
+Compact, serializable description of a PDF form's fields, independent of PyPDF2 objects
+"""
+
+import json
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Attributes a field inherits from its ancestors in the AcroForm tree (PDF 32000-1, 12.7.3.1)
+_INHERITABLE = ("/FT", "/Ff", "/V", "/DV")
+
+# PyPDF2 versions whose PdfReader.resolved_objects cache is keyed by (generation, idnum)
+_RELEASE_VERSIONS = ("3.",)
+
+# (x0, y0, x1, y1) in PDF user space, origin bottom-left
+PdfRect = Tuple[float, float, float, float]
+
+
+@dataclass(frozen=True, slots=True)
+class FieldSpec:
+    """A single form field, holding only plain Python values."""
+    name: str
+    type: str  # PDF field type: /Tx, /Btn, /Ch or /Sig
+    flags: int = 0
+    options: Tuple[str, ...] = ()
+    page: Optional[int] = None  # 1-indexed page of the field's first widget
+    rect: Optional[PdfRect] = None  # Rectangle of the field's first widget
+    default: str = ""
+    value: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to plain JSON-compatible data."""
+        return {
+            "name": self.name,
+            "type": self.type,
+            "flags": self.flags,
+            "options": list(self.options),
+            "page": self.page,
+            "rect": list(self.rect) if self.rect is not None else None,
+            "default": self.default,
+            "value": self.value,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FieldSpec":
+        """Rebuild a FieldSpec from to_dict() output."""
+        rect = data.get("rect")
+        return cls(
+            name=data["name"],
+            type=data.get("type", "Unknown"),
+            flags=data.get("flags", 0),
+            options=tuple(data.get("options", ())),
+            page=data.get("page"),
+            rect=tuple(rect) if rect is not None else None,
+            default=data.get("default", ""),
+            value=data.get("value", ""),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class FormSchema:
+    """The fields of a form, extracted once and kept without any PDF objects."""
+    fields: Tuple[FieldSpec, ...]
+    page_count: int = 0
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __iter__(self) -> Iterator[FieldSpec]:
+        return iter(self.fields)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def get(self, name: str) -> Optional[FieldSpec]:
+        """Look up a field by its fully qualified name."""
+        for spec in self.fields:
+            if spec.name == name:
+                return spec
+        return None
+
+    def names(self) -> List[str]:
+        """Fully qualified names of every field, in document order."""
+        return [spec.name for spec in self.fields]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to plain JSON-compatible data."""
+        return {"page_count": self.page_count, "fields": [spec.to_dict() for spec in self.fields]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FormSchema":
+        """Rebuild a FormSchema from to_dict() output."""
+        return cls(
+            fields=tuple(FieldSpec.from_dict(spec) for spec in data.get("fields", ())),
+            page_count=data.get("page_count", 0),
+        )
+
+    def to_json(self) -> str:
+        """Serialize to a JSON string."""
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, text: str) -> "FormSchema":
+        """Rebuild a FormSchema from to_json() output."""
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_reader(cls, reader: Any) -> "FormSchema":
+        """Extract the schema of every field from a PyPDF2 PdfReader."""
+        return cls(fields=tuple(iter_field_specs(reader)), page_count=len(reader.pages))
+
+
+def _text(value: Any) -> str:
+    return str(value) if value is not None else ""
+
+
+def _options(field: Any) -> Tuple[str, ...]:
+    """Display strings of a choice field's /Opt entries, which may be [export, display] pairs."""
+    options = field.get("/Opt")
+    if options is None:
+        return ()
+    labels = []
+    for option in options.get_object():
+        option = option.get_object()
+        if isinstance(option, list) and option:
+            option = option[-1].get_object()
+        labels.append(str(option))
+    return tuple(labels)
+
+
+def _can_release(reader: Any) -> bool:
+    """Whether the reader's object cache has the private layout _release relies on."""
+    package = sys.modules.get(type(reader).__module__.split(".")[0])
+    version = str(getattr(package, "__version__", ""))
+    return version.startswith(_RELEASE_VERSIONS) and isinstance(getattr(reader, "resolved_objects", None), dict)
+
+
+def _release(reader: Any, reference: Any) -> None:
+    """Drop a parsed object from the reader's cache; it is parsed again if needed later."""
+    if hasattr(reference, "idnum"):
+        reader.resolved_objects.pop((reference.generation, reference.idnum), None)
+
+
+class _PageNumbers:
+    """Maps widgets to 1-indexed page numbers, walking the page tree only as far as needed."""
+
+    def __init__(self, reader: Any, release: bool = False):
+        self.reader = reader
+        self.release = release
+        self._stack = [reader.trailer["/Root"].raw_get("/Pages")]
+        self._count = 0
+        self._pages: Dict[int, int] = {}  # page object number -> page number
+        self._annotations: Dict[int, int] = {}  # annotation object number -> page number
+
+    def _advance(self) -> bool:
+        """Visit the next page in document order; False once the tree is exhausted."""
+        while self._stack:
+            reference = self._stack.pop()
+            node = reference.get_object()
+            kids = node.get("/Kids")
+            if kids is not None and node.get("/Type") != "/Page":
+                self._stack.extend(reversed(list(kids.get_object())))
+                continue
+            self._count += 1
+            if hasattr(reference, "idnum"):
+                self._pages[reference.idnum] = self._count
+            annotations = node.get("/Annots")
+            for annotation in annotations.get_object() if annotations is not None else ():
+                if hasattr(annotation, "idnum"):
+                    self._annotations[annotation.idnum] = self._count
+            if self.release:
+                _release(self.reader, reference)
+            return True
+        return False
+
+    def page_of(self, widget_reference: Any, widget: Any) -> Optional[int]:
+        """Page number of a widget, from its /P entry or the page whose /Annots list it."""
+        page_reference = widget.raw_get("/P") if "/P" in widget else None
+        page_number = getattr(page_reference, "idnum", None)
+        annotation_number = getattr(widget_reference, "idnum", None)
+        while True:
+            if page_number in self._pages:
+                return self._pages[page_number]
+            if annotation_number in self._annotations:
+                return self._annotations[annotation_number]
+            if not self._advance():
+                return None
+
+
+def iter_field_specs(reader: Any, release: bool = False) -> Iterator[FieldSpec]:
+    """
+    Walk the AcroForm /Fields tree lazily, yielding one FieldSpec per terminal field.
+
+    Only the tree itself is traversed; nothing is collected into a dictionary first,
+    and pages are only visited as far as the current field's page, so the first
+    field is available as soon as it has been read.
+
+    Args:
+        reader: PyPDF2 PdfReader
+        release: Evict each field's parsed objects from the reader's cache once its
+            spec has been built, keeping memory flat on very large forms. The cache is
+            private to PyPDF2, so this is skipped on versions other than 3.x; callers
+            then keep memory bounded by dropping the reader (PDFReader.release_objects)
+    """
+    acroform = reader.trailer["/Root"].get("/AcroForm")
+    if acroform is None:
+        return
+    fields = acroform.get_object().get("/Fields")
+    if fields is None:
+        return
+    release = release and _can_release(reader)
+    pages = _PageNumbers(reader, release)
+
+    # Depth-first, in document order: (reference, parent name, inherited attributes)
+    stack: List[Tuple[Any, str, Dict[str, Any]]] = [
+        (reference, "", {}) for reference in reversed(fields.get_object())
+    ]
+    seen = set()
+    while stack:
+        reference, parent_name, inherited = stack.pop()
+        field = reference.get_object()
+        identity = getattr(reference, "idnum", id(field))
+        if identity in seen:
+            continue  # Guard against malformed, cyclic trees
+        seen.add(identity)
+
+        partial_name = field.get("/T")
+        name = parent_name
+        if partial_name is not None:
+            name = f"{parent_name}.{partial_name}" if parent_name else str(partial_name)
+        attributes = dict(inherited)
+        for key in _INHERITABLE:
+            if key in field:
+                attributes[key] = field[key]
+
+        kids = field.get("/Kids")
+        kid_references = list(kids.get_object()) if kids is not None else []
+        child_fields = [kid for kid in kid_references if "/T" in kid.get_object()]
+        if child_fields:
+            stack.extend((kid, name, attributes) for kid in reversed(child_fields))
+            continue
+        if not name:
+            continue
+
+        # A terminal field is its own widget, or its /Kids are its widgets
+        widgets = kid_references or [reference]
+        first_widget = widgets[0].get_object()
+        rect = first_widget.get("/Rect")
+        spec = FieldSpec(
+            name=name,
+            type=_text(attributes.get("/FT")) or "Unknown",
+            flags=int(attributes.get("/Ff", 0)),
+            options=_options(field),
+            page=pages.page_of(widgets[0], first_widget),
+            rect=tuple(float(value) for value in rect) if rect is not None else None,
+            default=_text(attributes.get("/DV")),
+            value=_text(attributes.get("/V")),
+        )
+        if release:
+            for widget in widgets:
+                _release(reader, widget)
+            _release(reader, reference)
+        yield spec
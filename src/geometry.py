@@ -0,0 +1,326 @@
+"""
+Geometry Module
+Vectorized bounding-box operations on NumPy structured arrays of page spans and fields
+"""
+
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from field_placement import FieldPosition
+from layout_extraction import BLANK_RUN, PageLayout, Rect, TextSpan
+
+# One rectangle per row, in PDF points with origin top-left
+RECT_DTYPE = np.dtype([("page", "i4"), ("x0", "f8"), ("y0", "f8"), ("x1", "f8"), ("y1", "f8")])
+# Text spans add whether the span is an underscore blank rather than a label
+SPAN_DTYPE = np.dtype(RECT_DTYPE.descr + [("blank", "?")])
+
+# Rows of the target side of a pairwise comparison handled at once, bounding temporary memory
+_CHUNK = 256
+# Generated fields further than this (in points) from any text are probably misplaced
+MAX_LABEL_DISTANCE = 72.0
+
+Number = Union[float, np.ndarray]
+
+
+def rect_array(rects: Iterable[Rect], page_number: int = 0) -> np.ndarray:
+    """Structured array of (x0, y0, x1, y1) rectangles on one page."""
+    rows = [(page_number, *rect) for rect in rects]
+    return np.array(rows, dtype=RECT_DTYPE) if rows else np.empty(0, dtype=RECT_DTYPE)
+
+
+def span_array(layout: PageLayout) -> np.ndarray:
+    """Structured array of a page's text spans, in layout order."""
+    rows = [(layout.page_number, span.x0, span.y0, span.x1, span.y1, bool(BLANK_RUN.fullmatch(span.text)))
+            for span in layout.spans]
+    return np.array(rows, dtype=SPAN_DTYPE) if rows else np.empty(0, dtype=SPAN_DTYPE)
+
+
+def position_array(positions: Sequence[FieldPosition]) -> np.ndarray:
+    """Structured array of field rectangles, one row per position."""
+    rows = [(position.page_number, position.x, position.y, position.x + position.width, position.y + position.height)
+            for position in positions]
+    return np.array(rows, dtype=RECT_DTYPE) if rows else np.empty(0, dtype=RECT_DTYPE)
+
+
+@dataclass
+class PageGeometry:
+    """A page's spans as a structured array, for vectorized neighbourhood queries."""
+    page_number: int
+    width: float
+    height: float
+    spans: np.ndarray  # SPAN_DTYPE, same order as layout.spans
+
+    @classmethod
+    def from_layout(cls, layout: PageLayout) -> "PageGeometry":
+        """Build the geometry of one page layout."""
+        return cls(layout.page_number, layout.width, layout.height, span_array(layout))
+
+    def on_row(self, middle: float) -> np.ndarray:
+        """Mask of spans crossing the horizontal line y = middle."""
+        return (self.spans["y0"] <= middle) & (middle <= self.spans["y1"])
+
+    def text_between(self, x0: float, x1: float, middle: float) -> bool:
+        """Check for a non-blank span on the row lying between two x positions."""
+        spans = self.spans
+        mask = self.on_row(middle) & (spans["x0"] >= x0 - 1) & (spans["x1"] <= x1 + 1) & ~spans["blank"]
+        return bool(mask.any())
+
+    def next_text_x(self, label: TextSpan, middle: float) -> float:
+        """Left edge of the next span after a label on its row, or the right page margin."""
+        spans = self.spans
+        mask = self.on_row(middle) & (spans["x0"] >= label.x1 - 1)
+        mask &= ~((spans["x0"] == label.x0) & (spans["y0"] == label.y0)
+                  & (spans["x1"] == label.x1) & (spans["y1"] == label.y1))
+        return float(spans["x0"][mask].min()) if mask.any() else self.width - 36
+
+    def caption_centres(self, rect: Rect, caption: TextSpan) -> np.ndarray:
+        """Sorted horizontal centres of the labels on a caption's line that lie under a blank."""
+        spans = self.spans
+        mask = (~spans["blank"] & (np.abs(spans["y0"] - caption.y0) <= 2)
+                & (spans["x1"] >= rect[0]) & (spans["x0"] <= rect[2]))
+        return np.sort((spans["x0"][mask] + spans["x1"][mask]) / 2)
+
+
+def underlined(rules: np.ndarray, spans: np.ndarray) -> np.ndarray:
+    """Mask of rules sitting directly under a label, i.e. underlines rather than blanks."""
+    if len(rules) == 0 or len(spans) == 0:
+        return np.zeros(len(rules), dtype=bool)
+    labels = spans[~spans["blank"]]
+    rule = rules[:, None]
+    hits = ((labels["x0"] - 2 <= rule["x0"]) & (rule["x1"] <= labels["x1"] + 2)
+            & (rule["y0"] - labels["y1"] >= -4) & (rule["y0"] - labels["y1"] <= 3))
+    return hits.any(axis=1)
+
+
+def contains_text(boxes: np.ndarray, spans: np.ndarray) -> np.ndarray:
+    """Mask of boxes that enclose at least one span."""
+    if len(boxes) == 0 or len(spans) == 0:
+        return np.zeros(len(boxes), dtype=bool)
+    box = boxes[:, None]
+    inside = ((spans["x0"] >= box["x0"] - 1) & (spans["x1"] <= box["x1"] + 1)
+              & (spans["y0"] >= box["y0"] - 1) & (spans["y1"] <= box["y1"] + 1))
+    return inside.any(axis=1)
+
+
+def _columns(rects: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Contiguous x0, y0, x1, y1 columns; much faster to broadcast than structured-array fields."""
+    return tuple(np.ascontiguousarray(rects[name], dtype=np.float64) for name in ("x0", "y0", "x1", "y1"))
+
+
+def _squared_gaps(targets: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Squared gap between every pair of rectangles, ignoring pages."""
+    tx0, ty0, tx1, ty1 = (column[:, None] for column in _columns(targets))
+    ox0, oy0, ox1, oy1 = _columns(others)
+    # In place, so a chunk needs only two temporary matrices
+    gaps = np.subtract(ox0, tx1)
+    scratch = np.subtract(tx0, ox1)
+    np.maximum(gaps, scratch, out=gaps)
+    np.maximum(gaps, 0.0, out=gaps)
+    np.multiply(gaps, gaps, out=gaps)
+    np.subtract(oy0, ty1, out=scratch)
+    dy = np.subtract(ty0, oy1)
+    np.maximum(scratch, dy, out=scratch)
+    np.maximum(scratch, 0.0, out=scratch)
+    np.multiply(scratch, scratch, out=scratch)
+    return np.add(gaps, scratch, out=gaps)
+
+
+def rect_distances(targets: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Gap between every pair of rectangles, as a (len(targets), len(others)) matrix.
+
+    The gap is 0 for touching or overlapping rectangles and infinite between pages.
+    """
+    gaps = np.sqrt(_squared_gaps(targets, others))
+    gaps[targets["page"][:, None] != others["page"]] = np.inf
+    return gaps
+
+
+def nearest_labels(targets: np.ndarray, labels: np.ndarray,
+                   max_distance: float = np.inf) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the closest label rectangle to each target rectangle on the same page.
+
+    Targets are handled in bands sorted by y. With a finite max_distance each
+    band is only compared with the labels that can be close enough vertically.
+
+    Args:
+        targets: RECT_DTYPE or SPAN_DTYPE array, e.g. blanks or generated fields
+        labels: RECT_DTYPE or SPAN_DTYPE array of label spans
+        max_distance: Labels further away than this (in points) do not count
+
+    Returns:
+        (indices into labels, or -1 where none is close enough; gaps in points, inf where none)
+    """
+    indices = np.full(len(targets), -1, dtype=np.intp)
+    distances = np.full(len(targets), np.inf)
+    for page in np.unique(targets["page"]):
+        on_page = np.nonzero(labels["page"] == page)[0]
+        if len(on_page) == 0:
+            continue
+        on_page = on_page[np.argsort(labels["y0"][on_page], kind="stable")]
+        page_labels = labels[on_page]
+        label_y0 = np.ascontiguousarray(page_labels["y0"], dtype=np.float64)
+        tallest = float((page_labels["y1"] - page_labels["y0"]).max())
+        rows = np.nonzero(targets["page"] == page)[0]
+        rows = rows[np.argsort(targets["y0"][rows], kind="stable")]
+        for start in range(0, len(rows), _CHUNK):
+            chunk = rows[start:start + _CHUNK]
+            band = targets[chunk]
+            low, high = 0, len(on_page)
+            if np.isfinite(max_distance):
+                # A label whose top is outside this range is more than max_distance away vertically
+                low = np.searchsorted(label_y0, band["y0"].min() - max_distance - tallest, side="left")
+                high = np.searchsorted(label_y0, band["y1"].max() + max_distance, side="right")
+                if low >= high:
+                    continue
+            gaps = _squared_gaps(band, page_labels[low:high])
+            best = gaps.argmin(axis=1)
+            best_gaps = np.sqrt(gaps[np.arange(len(chunk)), best])
+            found = best_gaps <= max_distance
+            indices[chunk] = np.where(found, on_page[low + best], -1)
+            distances[chunk] = np.where(found, best_gaps, np.inf)
+    return indices, distances
+
+
+def overlapping_pairs(rects: np.ndarray, min_area: float = 0.0) -> np.ndarray:
+    """
+    Find pairs of rectangles on the same page whose intersection exceeds min_area.
+
+    Rectangles are swept left to right per page, so only pairs whose x-ranges
+    overlap are compared.
+
+    Returns:
+        (k, 2) array of row index pairs (i, j) with i < j, sorted
+    """
+    pairs = [np.empty((0, 2), dtype=np.intp)]
+    for page in np.unique(rects["page"]):
+        rows = np.nonzero(rects["page"] == page)[0]
+        x0, y0, x1, y1 = _columns(rects[rows])
+        order = np.argsort(x0, kind="stable")
+        x0, y0, x1, y1, rows = x0[order], y0[order], x1[order], y1[order], rows[order]
+        # Rectangles after i in x0 order that start before i ends
+        ends = np.searchsorted(x0, x1, side="left")
+        counts = np.maximum(ends - np.arange(len(rows)) - 1, 0)
+        first = np.repeat(np.arange(len(rows)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        second = first + 1 + offsets
+        width = np.minimum(x1[first], x1[second]) - np.maximum(x0[first], x0[second])
+        height = np.minimum(y1[first], y1[second]) - np.maximum(y0[first], y0[second])
+        hits = (width > 0) & (height > 0) & (width * height > min_area)
+        found = np.sort(np.column_stack((rows[first[hits]], rows[second[hits]])), axis=1)
+        pairs.append(found)
+    result = np.concatenate(pairs)
+    return result[np.lexsort((result[:, 1], result[:, 0]))] if len(result) else result
+
+
+def overlaps(rect: np.void, rects: np.ndarray) -> np.ndarray:
+    """Mask of rectangles on the same page that overlap one rectangle."""
+    width = np.minimum(rect["x1"], rects["x1"]) - np.maximum(rect["x0"], rects["x0"])
+    height = np.minimum(rect["y1"], rects["y1"]) - np.maximum(rect["y0"], rects["y0"])
+    return (width > 0) & (height > 0) & (rects["page"] == rect["page"])
+
+
+def clamp_to_page(rects: np.ndarray, width: Number, height: Number) -> np.ndarray:
+    """
+    Move rectangles inside the page, shrinking only those larger than the page.
+
+    Args:
+        rects: RECT_DTYPE array
+        width: Page width, or an array with the width of each row's page
+        height: Page height, or an array with the height of each row's page
+
+    Returns:
+        A clamped copy of rects
+    """
+    clamped = rects.copy()
+    for low, high, size in (("x0", "x1", width), ("y0", "y1", height)):
+        extent = np.minimum(rects[high] - rects[low], size)
+        clamped[low] = np.clip(rects[low], 0.0, size - extent)
+        clamped[high] = clamped[low] + extent
+    return clamped
+
+
+def validate_positions(positions: Sequence[FieldPosition], page_sizes: Dict[int, Tuple[float, float]]
+                       ) -> Tuple[List[FieldPosition], np.ndarray]:
+    """
+    Clamp generated field positions to their pages and find overlapping fields.
+
+    Args:
+        positions: Field positions, e.g. from the LLM
+        page_sizes: Page number to (width, height)
+
+    Returns:
+        (positions with out-of-page rectangles moved inside, (k, 2) index pairs of overlapping fields)
+    """
+    rects = position_array(positions)
+    if len(rects) == 0:
+        return list(positions), np.empty((0, 2), dtype=np.intp)
+    sizes = np.array([page_sizes.get(int(page), (np.inf, np.inf)) for page in rects["page"]])
+    clamped = clamp_to_page(rects, sizes[:, 0], sizes[:, 1])
+    moved = ((clamped["x0"] != rects["x0"]) | (clamped["y0"] != rects["y0"])
+             | (clamped["x1"] != rects["x1"]) | (clamped["y1"] != rects["y1"]))
+    result = list(positions)
+    for index in np.nonzero(moved)[0]:
+        row = clamped[index]
+        result[index] = replace(result[index], x=float(row["x0"]), y=float(row["y0"]),
+                                width=float(row["x1"] - row["x0"]), height=float(row["y1"] - row["y0"]))
+    return result, overlapping_pairs(clamped)
+
+
+class FieldValidator:
+    """Checks field positions one at a time against the page layout and the fields accepted before them."""
+
+    def __init__(self, layouts: Sequence[PageLayout], max_label_distance: float = MAX_LABEL_DISTANCE):
+        """
+        Initialize the validator.
+
+        Args:
+            layouts: Page layouts of the document the fields are for
+            max_label_distance: Report fields with no text at least this close
+        """
+        self.page_sizes = {layout.page_number: (layout.width, layout.height) for layout in layouts}
+        spans = np.concatenate([span_array(layout) for layout in layouts]) if layouts else np.empty(0, SPAN_DTYPE)
+        self.labels = spans[~spans["blank"]]
+        self.max_label_distance = max_label_distance
+        self._rects = np.empty(64, dtype=RECT_DTYPE)
+        self._names: List[str] = []
+
+    def check(self, position: FieldPosition) -> Tuple[FieldPosition, List[str]]:
+        """
+        Clamp a position to its page and describe anything wrong with it.
+
+        The (clamped) position is remembered, so later fields overlapping it are reported.
+
+        Returns:
+            (the position, moved inside its page if it was not; list of problems, empty if none)
+        """
+        issues = []
+        rect = position_array([position])
+        if position.page_number not in self.page_sizes:
+            issues.append(f"page {position.page_number} does not exist")
+        else:
+            width, height = self.page_sizes[position.page_number]
+            clamped = clamp_to_page(rect, width, height)
+            if clamped[0] != rect[0]:
+                row = clamped[0]
+                position = replace(position, x=float(row["x0"]), y=float(row["y0"]),
+                                   width=float(row["x1"] - row["x0"]), height=float(row["y1"] - row["y0"]))
+                issues.append("moved inside the page")
+                rect = clamped
+            _, distances = nearest_labels(rect, self.labels, self.max_label_distance)
+            if not np.isfinite(distances[0]):
+                issues.append(f"no text within {self.max_label_distance:g}pt")
+
+        count = len(self._names)
+        hits = np.nonzero(overlaps(rect[0], self._rects[:count]))[0]
+        if len(hits):
+            issues.append("overlaps " + ", ".join(self._names[index] for index in hits[:3])
+                          + (f" and {len(hits) - 3} more" if len(hits) > 3 else ""))
+        if count == len(self._rects):
+            self._rects = np.resize(self._rects, count * 2)
+        self._rects[count] = rect[0]
+        self._names.append(position.field_name)
+        return position, issues
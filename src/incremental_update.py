@@ -0,0 +1,189 @@
+"""
+Incremental Update Module
+Appends modified objects to an unchanged copy of the original PDF bytes
+"""
+
+import os
+import re
+import sys
+from io import BytesIO
+from typing import BinaryIO, Dict, List, Tuple
+
+try:
+    from PyPDF2.generic import (ArrayObject, DecodedStreamObject,
+                                DictionaryObject, NameObject, NumberObject,
+                                PdfObject)
+except ImportError:
+    print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
+    sys.exit(1)
+
+from template_cache import CompiledTemplate
+
+# Object number -> (generation, replacement object)
+ObjectUpdates = Dict[int, Tuple[int, PdfObject]]
+
+_STARTXREF_PATTERN = re.compile(rb"startxref\s+(\d+)")
+_OBJECT_HEADER_PATTERN = re.compile(rb"(\d+)\s+\d+\s+obj")
+
+
+def find_startxref(data: bytes) -> int:
+    """Return the offset of the last cross-reference section in a PDF."""
+    matches = list(_STARTXREF_PATTERN.finditer(data, max(0, len(data) - 2048)))
+    if not matches:
+        matches = list(_STARTXREF_PATTERN.finditer(data))
+    if not matches:
+        raise ValueError("Could not find startxref in the original PDF")
+    return int(matches[-1].group(1))
+
+
+def next_object_number(template: CompiledTemplate) -> int:
+    """
+    Return the first object number not used by any revision of the template.
+
+    Cross-reference streams do not surface /Size in PyPDF2's merged trailer and may
+    not list themselves, so the parsed xref tables and the stream header are checked too.
+    """
+    reader = template.reader
+    highest = int(reader.trailer.get("/Size", 1)) - 1
+    for entries in reader.xref.values():
+        highest = max([highest] + list(entries))
+    highest = max([highest] + list(reader.xref_objStm))
+
+    previous_xref = find_startxref(template.data)
+    header = _OBJECT_HEADER_PATTERN.match(template.data, previous_xref)
+    if header:
+        highest = max(highest, int(header.group(1)))
+    return highest + 1
+
+
+def _source_unchanged(template: CompiledTemplate) -> bool:
+    """Check that the template file on disk still holds the bytes that were compiled."""
+    if template.path is None:
+        return False
+    try:
+        stat = template.path.stat()
+    except OSError:
+        return False
+    return stat.st_size == len(template.data) and stat.st_mtime == template.mtime
+
+
+def _copy_original(template: CompiledTemplate, output_file: BinaryIO) -> None:
+    """Copy the original PDF bytes to the output without re-serializing them."""
+    try:
+        output_fd = output_file.fileno()
+    except (AttributeError, OSError, ValueError):
+        output_fd = None
+
+    if output_fd is not None and hasattr(os, "sendfile") and _source_unchanged(template):
+        # Flush first so the kernel-side copy lands after anything already buffered
+        output_file.flush()
+        offset = 0
+        size = len(template.data)
+        with open(template.path, 'rb') as source:
+            while offset < size:
+                sent = os.sendfile(output_fd, source.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        if offset < size:
+            output_file.write(memoryview(template.data)[offset:])
+        return
+
+    output_file.write(template.data)
+
+
+def _xref_subsections(object_numbers: List[int]) -> List[List[int]]:
+    """Group sorted object numbers into runs of consecutive numbers."""
+    runs: List[List[int]] = []
+    for number in object_numbers:
+        if runs and runs[-1][-1] == number - 1:
+            runs[-1].append(number)
+        else:
+            runs.append([number])
+    return runs
+
+
+def write_incremental_update(template: CompiledTemplate, updates: ObjectUpdates,
+                             output_file: BinaryIO) -> None:
+    """
+    Write the original template bytes followed by an incremental update section.
+
+    The output is byte-identical to the template up to its original %%EOF marker;
+    only the replacement objects, a new cross-reference section and a trailer
+    pointing back at the previous one (/Prev) are appended. With no updates the
+    template bytes are copied unchanged.
+
+    Args:
+        template: Compiled template whose bytes form the base revision
+        updates: Replacement objects keyed by their original object number
+        output_file: Binary file object to write to
+    """
+    if not updates:
+        # Nothing changed, and an xref section without subsections is not valid PDF
+        _copy_original(template, output_file)
+        return
+
+    trailer = template.reader.trailer
+    if "/Encrypt" in trailer:
+        raise ValueError("Incremental updates of encrypted PDFs are not supported")
+
+    data = template.data
+    previous_xref = find_startxref(data)
+    _copy_original(template, output_file)
+
+    section = BytesIO()
+    if not data.endswith((b"\n", b"\r")):
+        section.write(b"\n")
+
+    base = len(data)
+    offsets: Dict[int, int] = {}
+    for number in sorted(updates):
+        generation, obj = updates[number]
+        offsets[number] = base + section.tell()
+        section.write(f"{number} {generation} obj\n".encode())
+        obj.write_to_stream(section, None)
+        section.write(b"\nendobj\n")
+
+    size = max([next_object_number(template)] + [number + 1 for number in updates])
+    new_trailer = DictionaryObject()
+    new_trailer[NameObject("/Root")] = trailer.raw_get("/Root")
+    for key in ("/Info", "/ID"):
+        if key in trailer:
+            new_trailer[NameObject(key)] = trailer.raw_get(key)
+    new_trailer[NameObject("/Prev")] = NumberObject(previous_xref)
+
+    # Match the style of the previous section: readers expect a cross-reference
+    # stream to be followed by another stream rather than a classic table
+    xref_offset = base + section.tell()
+    if data[previous_xref:previous_xref + 4] == b"xref":
+        new_trailer[NameObject("/Size")] = NumberObject(size)
+        section.write(b"xref\n")
+        for run in _xref_subsections(sorted(offsets)):
+            section.write(f"{run[0]} {len(run)}\n".encode())
+            for number in run:
+                section.write(f"{offsets[number]:0>10} {updates[number][0]:0>5} n \n".encode())
+        section.write(b"trailer\n")
+        new_trailer.write_to_stream(section, None)
+    else:
+        offsets[size] = xref_offset
+        generations = {number: generation for number, (generation, _) in updates.items()}
+        generations[size] = 0
+        xref_stream = DecodedStreamObject()
+        xref_stream.update(new_trailer)
+        xref_stream[NameObject("/Type")] = NameObject("/XRef")
+        xref_stream[NameObject("/Size")] = NumberObject(size + 1)
+        xref_stream[NameObject("/W")] = ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)])
+        index = ArrayObject()
+        entries = bytearray()
+        for run in _xref_subsections(sorted(offsets)):
+            index.extend([NumberObject(run[0]), NumberObject(len(run))])
+            for number in run:
+                entries += b"\x01" + offsets[number].to_bytes(4, "big") + generations[number].to_bytes(2, "big")
+        xref_stream[NameObject("/Index")] = index
+        xref_stream.set_data(bytes(entries))
+        section.write(f"{size} 0 obj\n".encode())
+        xref_stream.write_to_stream(section, None)
+        section.write(b"\nendobj")
+    section.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+    output_file.write(section.getvalue())
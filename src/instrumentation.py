@@ -0,0 +1,295 @@
+"""
+Instrumentation Module
+Lightweight spans, counters and structured logging for the PDF pipeline
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+LOGGER_NAMESPACE = "pdf_filler"
+
+_enabled = False
+_exporters: List[Callable[["SpanRecord"], None]] = []
+_tracer: Any = None  # OpenTelemetry tracer, when enabled with opentelemetry=True
+_meter: Any = None
+_otel_counters: Dict[str, Any] = {}
+_current_span: contextvars.ContextVar = contextvars.ContextVar("pdf_filler_span", default=None)
+
+
+@dataclass
+class SpanRecord:
+    """A finished span."""
+    name: str
+    start_time: float  # Unix time in seconds
+    duration_ms: float
+    parent: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@dataclass
+class SpanStats:
+    """Aggregated timings of every span with the same name."""
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    errors: int = 0
+
+
+class Recorder:
+    """In-process aggregate of span timings and counters, safe to share between threads."""
+
+    def __init__(self):
+        """Initialize an empty recorder."""
+        self._lock = threading.Lock()
+        self.spans: Dict[str, SpanStats] = {}
+        self.counters: Dict[str, float] = {}
+
+    def record_span(self, record: SpanRecord) -> None:
+        """Add a finished span to the aggregate."""
+        with self._lock:
+            stats = self.spans.setdefault(record.name, SpanStats())
+            stats.count += 1
+            stats.total_ms += record.duration_ms
+            stats.max_ms = max(stats.max_ms, record.duration_ms)
+            if record.error is not None:
+                stats.errors += 1
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        """Add to a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain JSON-compatible copy of the current spans and counters."""
+        with self._lock:
+            return {
+                "spans": {
+                    name: {"count": stats.count, "total_ms": round(stats.total_ms, 3),
+                           "mean_ms": round(stats.total_ms / stats.count, 3),
+                           "max_ms": round(stats.max_ms, 3), "errors": stats.errors}
+                    for name, stats in self.spans.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+
+recorder = Recorder()
+
+
+class _NoopSpan:
+    """Returned by span() while instrumentation is disabled; does nothing."""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """A timed region of work, nested under whichever span is current when it starts."""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self._otel_context = None
+
+    def __enter__(self) -> "_Span":
+        parent = _current_span.get()
+        self.parent = parent.name if parent is not None else None
+        self._token = _current_span.set(self)
+        if _tracer is not None:
+            self._otel_context = _tracer.start_as_current_span(self.name, attributes=self.attributes)
+            self._otel_span = self._otel_context.__enter__()
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        duration_ms = (time.perf_counter() - self._started) * 1000
+        _current_span.reset(self._token)
+        if self._otel_context is not None:
+            self._otel_context.__exit__(exc_type, exc, traceback)
+        record = SpanRecord(
+            name=self.name,
+            start_time=self.start_time,
+            duration_ms=duration_ms,
+            parent=self.parent,
+            attributes=self.attributes,
+            error=exc_type.__name__ if exc_type is not None else None,
+        )
+        recorder.record_span(record)
+        for exporter in _exporters:
+            exporter(record)
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute discovered while the span is running, e.g. a result size."""
+        self.attributes[key] = value
+        if self._otel_context is not None:
+            self._otel_span.set_attribute(key, value)
+
+
+def span(name: str, **attributes: Any):
+    """
+    Time a block of work as a named span.
+
+    Usage: ``with span("pdf.fill", fields=len(values)) as current: ...``. While
+    instrumentation is disabled this returns a shared no-op object, so the cost
+    is one global check.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, attributes)
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """Add to a named counter (no-op while instrumentation is disabled)."""
+    if not _enabled:
+        return
+    recorder.increment(name, amount)
+    if _meter is not None:
+        counter = _otel_counters.get(name)
+        if counter is None:
+            counter = _otel_counters[name] = _meter.create_counter(name)
+        counter.add(amount)
+
+
+def enable(opentelemetry: bool = False, exporter: Optional[Callable[[SpanRecord], None]] = None) -> None:
+    """
+    Start recording spans and counters.
+
+    Args:
+        opentelemetry: Also report spans and counters through the OpenTelemetry API,
+            using whatever tracer and meter providers the application configured.
+            Ignored with a warning if the opentelemetry package is not installed.
+        exporter: Callable invoked with every finished SpanRecord
+    """
+    global _enabled, _tracer, _meter
+    if opentelemetry and _tracer is None:
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError:
+            get_logger(__name__).warning("opentelemetry is not installed; recording spans in-process only")
+        else:
+            _tracer = trace.get_tracer(LOGGER_NAMESPACE)
+            _meter = metrics.get_meter(LOGGER_NAMESPACE)
+    if exporter is not None:
+        _exporters.append(exporter)
+    _enabled = True
+
+
+def disable() -> None:
+    """Stop recording; exporters and the OpenTelemetry hookup are removed."""
+    global _enabled, _tracer, _meter
+    _enabled = False
+    _tracer = _meter = None
+    _otel_counters.clear()
+    _exporters.clear()
+
+
+def is_enabled() -> bool:
+    """Whether spans and counters are being recorded."""
+    return _enabled
+
+
+def format_summary(snapshot: Optional[Dict[str, Any]] = None) -> str:
+    """Render recorded spans and counters as a small table."""
+    snapshot = snapshot or recorder.snapshot()
+    lines = [f"{'span':<24} {'count':>7} {'total':>11} {'mean':>10} {'max':>10}"]
+    for name, stats in sorted(snapshot["spans"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(f"{name:<24} {stats['count']:>7} {stats['total_ms']:>9.1f}ms "
+                     f"{stats['mean_ms']:>8.2f}ms {stats['max_ms']:>8.1f}ms")
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{name:<24} {value:>7g}")
+    return "\n".join(lines)
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as text or JSON lines.
+
+    Structured fields are passed as ``extra={"data": {...}}``; the current span,
+    if any, is included so log lines can be matched to timings.
+    """
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = dict(getattr(record, "data", None) or {})
+        current = _current_span.get()
+        if self.json_lines:
+            entry = {
+                "ts": round(record.created, 3),
+                "level": record.levelname.lower(),
+                "logger": record.name,
+                "message": record.getMessage(),
+                **data,
+            }
+            if current is not None:
+                entry["span"] = current.name
+            if record.exc_info:
+                entry["exception"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        text = record.getMessage()
+        if data:
+            text += " " + " ".join(f"{key}={value}" for key, value in data.items())
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a pipeline module, e.g. get_logger(__name__) -> "pdf_filler.pdf_writer"."""
+    return logging.getLogger(f"{LOGGER_NAMESPACE}.{name.rsplit('.', 1)[-1]}")
+
+
+def configure_logging(level: Optional[str] = None, json_lines: Optional[bool] = None) -> None:
+    """
+    Send pipeline logs to stderr. Safe to call more than once.
+
+    Args:
+        level: Log level name; defaults to PDF_FILLER_LOG_LEVEL or INFO
+        json_lines: Emit one JSON object per line; defaults to PDF_FILLER_LOG_FORMAT=json
+    """
+    level = level or os.environ.get("PDF_FILLER_LOG_LEVEL", "INFO")
+    if json_lines is None:
+        json_lines = os.environ.get("PDF_FILLER_LOG_FORMAT", "text").lower() == "json"
+    logger = logging.getLogger(LOGGER_NAMESPACE)
+    for handler in list(logger.handlers):
+        if getattr(handler, "_pdf_filler", False):
+            logger.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(StructuredFormatter(json_lines))
+    handler._pdf_filler = True
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+# PDF_FILLER_INSTRUMENTATION=1 records in-process; =otel also reports through OpenTelemetry
+_setting = os.environ.get("PDF_FILLER_INSTRUMENTATION", "").lower()
+if _setting in ("1", "true", "yes", "otel", "opentelemetry"):
+    enable(opentelemetry=_setting in ("otel", "opentelemetry"))
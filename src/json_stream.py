@@ -0,0 +1,151 @@
+"""
+JSON Stream Module
+Incremental parsing of a JSON array arriving in chunks, e.g. a streamed LLM response
+"""
+
+import json
+from typing import (Any, AsyncIterable, AsyncIterator, Iterable, Iterator,
+                    List, Optional)
+
+from instrumentation import get_logger, increment
+
+logger = get_logger(__name__)
+
+_WHITESPACE = " \t\r\n"
+
+
+class JSONArrayParser:
+    """
+    Yields the elements of a top-level JSON array as soon as each one is complete.
+
+    Text before the opening bracket (a ```json fence, a sentence of preamble) and
+    after the closing bracket is ignored. Each element is decoded on its own, so a
+    malformed element is skipped without losing its neighbours, and the elements
+    completed before a truncated response ends are kept.
+    """
+
+    def __init__(self):
+        """Initialize a parser that has not yet seen the opening bracket."""
+        self.started = False  # Saw the array's opening bracket
+        self.finished = False  # Saw the array's closing bracket
+        self.skipped = 0  # Elements that were not valid JSON
+        self._pending = ""  # Text of the element being read
+        self._depth = 0  # Bracket nesting inside the current element
+        self._in_string = False
+        self._escaped = False
+        self._element_started = False
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consume the next chunk of text.
+
+        Args:
+            text: Next piece of the response, of any length
+
+        Returns:
+            Elements completed by this chunk, in order
+        """
+        items: List[Any] = []
+        if self.finished:
+            return items
+        if not self.started:
+            start = text.find("[")
+            if start < 0:
+                return items
+            self.started = True
+            text = text[start + 1:]
+
+        pending = self._pending
+        offset = len(pending)
+        pending += text
+        start = 0  # Where the current element begins in pending
+        if not self._element_started:
+            start = offset
+        for index in range(offset, len(pending)):
+            char = pending[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char in _WHITESPACE:
+                continue
+            if self._depth == 0 and char in ",]":
+                # End of a scalar element, or a separator after a closed container
+                if self._element_started:
+                    self._emit(pending[start:index], items)
+                    self._element_started = False
+                if char == "]":
+                    self.finished = True
+                    self._pending = ""
+                    return items
+                start = index + 1
+                continue
+            if not self._element_started:
+                self._element_started = True
+                start = index
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth <= 0:
+                    # The element's closing bracket: decode it without waiting for the separator
+                    self._depth = 0
+                    self._emit(pending[start:index + 1], items)
+                    self._element_started = False
+                    start = index + 1
+        self._pending = pending[start:] if self._element_started else ""
+        return items
+
+    def close(self) -> None:
+        """Signal the end of the input; an unfinished trailing element is counted as skipped."""
+        if self.started and not self.finished:
+            if self._element_started:
+                self.skipped += 1
+                increment("json_stream.skipped")
+            logger.warning("JSON array ended before its closing bracket; keeping the elements completed so far")
+        self._pending = ""
+        self._element_started = False
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the array was opened but never closed."""
+        return self.started and not self.finished
+
+    def _emit(self, text: str, items: List[Any]) -> None:
+        """Decode one element, skipping it if it is not valid JSON."""
+        try:
+            items.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            increment("json_stream.skipped")
+            logger.warning(f"Skipping malformed array element: {e}", extra={"data": {"element": text[:200]}})
+
+
+def iter_json_array(chunks: Iterable[str], parser: Optional[JSONArrayParser] = None) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array from an iterable of text chunks.
+
+    Args:
+        chunks: Pieces of the text, e.g. a streamed response or a single complete string
+        parser: Parser to use, so the caller can inspect it afterwards (skipped, truncated)
+    """
+    parser = parser or JSONArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
+
+
+async def aiter_json_array(chunks: AsyncIterable[str],
+                           parser: Optional[JSONArrayParser] = None) -> AsyncIterator[Any]:
+    """Async counterpart of iter_json_array."""
+    parser = parser or JSONArrayParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
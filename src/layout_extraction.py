@@ -0,0 +1,220 @@
+"""
+Layout Extraction Module
+Single-pass PyMuPDF extraction of page text and span positions, cached on disk
+"""
+
+import gzip
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from instrumentation import increment, span
+
+# Bump whenever the extracted representation changes so stale cache files are ignored
+LAYOUT_VERSION = "2"
+DEFAULT_LAYOUT_CACHE = Path(__file__).parent.parent / ".cache" / "layouts"
+
+# Runs of underscores are fill-in blanks rather than text
+BLANK_RUN = re.compile(r"_{3,}")
+# Horizontal drawn lines at least this long (in points) are treated as writing rules
+MIN_RULE_LENGTH = 15.0
+# Drawn rectangles at least this size in both directions are treated as boxes
+MIN_BOX_SIZE = 6.0
+
+# (x0, y0, x1, y1) in PDF points, origin top-left
+Rect = Tuple[float, float, float, float]
+
+
+class TextSpan(NamedTuple):
+    """A run of text on one line and its bounding box in PDF points (origin top-left)."""
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    text: str
+
+
+@dataclass
+class PageLayout:
+    """Compact text layout of a single page."""
+    page_number: int  # 1-indexed
+    width: float
+    height: float
+    text: str
+    spans: List[TextSpan]
+    # Drawn horizontal rules and rectangles, for locating blanks and checkboxes
+    rules: List[Rect] = field(default_factory=list)
+    boxes: List[Rect] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        """Serialize to plain JSON-compatible data."""
+        return {
+            "page_number": self.page_number,
+            "width": self.width,
+            "height": self.height,
+            "text": self.text,
+            "spans": [list(text_span) for text_span in self.spans],
+            "rules": [list(rule) for rule in self.rules],
+            "boxes": [list(box) for box in self.boxes],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PageLayout":
+        """Rebuild a PageLayout from to_dict() output."""
+        return cls(
+            page_number=data["page_number"],
+            width=data["width"],
+            height=data["height"],
+            text=data["text"],
+            spans=[TextSpan(*text_span) for text_span in data["spans"]],
+            rules=[tuple(rule) for rule in data["rules"]],
+            boxes=[tuple(box) for box in data["boxes"]],
+        )
+
+
+def _split_word(x0: float, y0: float, x1: float, y1: float, word: str) -> List[Tuple[TextSpan, bool]]:
+    """Split a word around underscore runs, estimating piece positions by character count."""
+    if "___" not in word:
+        return [(TextSpan(x0, y0, x1, y1, word), False)]
+    char_width = (x1 - x0) / len(word)
+    pieces = []
+    position = 0
+    for match in BLANK_RUN.finditer(word):
+        if match.start() > position:
+            pieces.append((match.start(), position, False))
+        pieces.append((match.end(), match.start(), True))
+        position = match.end()
+    if position < len(word):
+        pieces.append((len(word), position, False))
+    return [
+        (TextSpan(x0 + start * char_width, y0, x0 + end * char_width, y1, word[start:end]), is_blank)
+        for end, start, is_blank in pieces
+    ]
+
+
+def _line_spans(words: List[Tuple]) -> List[TextSpan]:
+    """Group the words of one line into text runs, keeping underscore blanks as their own spans."""
+    spans: List[TextSpan] = []
+    current: Optional[List] = None  # [x0, y0, x1, y1, [texts]]
+
+    def flush():
+        if current is not None:
+            spans.append(TextSpan(current[0], current[1], current[2], current[3], " ".join(current[4])))
+
+    for x0, y0, x1, y1, word in words:
+        for piece, is_blank in _split_word(x0, y0, x1, y1, word):
+            if is_blank:
+                flush()
+                current = None
+                spans.append(piece)
+            elif current is not None and piece.x0 - current[2] <= 1.5 * (piece.y1 - piece.y0):
+                current[1] = min(current[1], piece.y0)
+                current[2] = max(current[2], piece.x1)
+                current[3] = max(current[3], piece.y1)
+                current[4].append(piece.text)
+            else:
+                flush()
+                current = [piece.x0, piece.y0, piece.x1, piece.y1, [piece.text]]
+    flush()
+    return spans
+
+
+def _dedupe_rects(rects: List[Rect], tolerance: float = 1.5) -> List[Rect]:
+    """Drop rectangles that repeat an earlier one, such as the fill and stroke of the same box."""
+    kept: List[Rect] = []
+    for rect in sorted(rects):
+        if not any(all(abs(a - b) <= tolerance for a, b in zip(rect, other)) for other in kept):
+            kept.append(rect)
+    return kept
+
+
+def _page_graphics(page: "fitz.Page") -> Tuple[List[Rect], List[Rect]]:
+    """Collect horizontal rules and rectangles from the page's vector drawings."""
+    rules: List[Rect] = []
+    boxes: List[Rect] = []
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) < 1 and abs(end.x - start.x) >= MIN_RULE_LENGTH:
+                    rules.append((min(start.x, end.x), min(start.y, end.y),
+                                  max(start.x, end.x), max(start.y, end.y)))
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height <= 2.5 and rect.width >= MIN_RULE_LENGTH:
+                    rules.append((rect.x0, rect.y0, rect.x1, rect.y1))
+                elif rect.width >= MIN_BOX_SIZE and rect.height >= MIN_BOX_SIZE:
+                    boxes.append((rect.x0, rect.y0, rect.x1, rect.y1))
+    rounded = lambda rects: [tuple(round(value, 2) for value in rect) for rect in rects]
+    return _dedupe_rects(rounded(rules)), _dedupe_rects(rounded(boxes))
+
+
+def _page_layout(page: "fitz.Page") -> PageLayout:
+    """Build the layout of one page from a single word-level text extraction."""
+    # Each word is (x0, y0, x1, y1, text, block_no, line_no, word_no), in reading order
+    lines: Dict[Tuple[int, int], List[Tuple]] = {}
+    for x0, y0, x1, y1, word, block_no, line_no, _ in page.get_text("words"):
+        lines.setdefault((block_no, line_no), []).append((x0, y0, x1, y1, word))
+
+    spans: List[TextSpan] = []
+    for words in lines.values():
+        spans.extend(_line_spans(words))
+    text = "\n".join(" ".join(word[4] for word in words) for words in lines.values())
+    rules, boxes = _page_graphics(page)
+    rect = page.rect
+    return PageLayout(page.number + 1, rect.width, rect.height, text, spans, rules, boxes)
+
+
+def _cache_file(pdf_bytes: bytes, cache_dir: Path) -> Path:
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    return cache_dir / f"{digest}-v{LAYOUT_VERSION}.json.gz"
+
+
+def extract_layout(pdf_path: str, cache_dir: Optional[Path] = DEFAULT_LAYOUT_CACHE) -> List[PageLayout]:
+    """
+    Extract the text layout of every page in one pass over the document.
+
+    Results are cached on disk by content hash, so analyzing and then generating
+    a form from the same PDF only parses it once.
+
+    Args:
+        pdf_path: Path to the PDF file
+        cache_dir: Directory for cached layouts, or None to disable caching
+
+    Returns:
+        List of PageLayout objects in page order
+    """
+    with span("text.extract") as current:
+        pdf_bytes = Path(pdf_path).read_bytes()
+        cache_file = _cache_file(pdf_bytes, Path(cache_dir)) if cache_dir is not None else None
+        if cache_file is not None and cache_file.exists():
+            try:
+                with gzip.open(cache_file, 'rt', encoding='utf-8') as f:
+                    layouts = [PageLayout.from_dict(page) for page in json.load(f)]
+                current.set_attribute("cache", "hit")
+                increment("layout.cache_hits")
+                return layouts
+            except (OSError, ValueError, KeyError):
+                pass  # Unreadable cache entry; extract again and overwrite it
+
+        import fitz  # PyMuPDF, only needed on a cache miss
+
+        current.set_attribute("cache", "miss")
+        increment("layout.cache_misses")
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            layouts = [_page_layout(page) for page in doc]
+        finally:
+            doc.close()
+        current.set_attribute("pages", len(layouts))
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = cache_file.with_suffix(".tmp")
+        with gzip.open(temp_file, 'wt', encoding='utf-8') as f:
+            json.dump([layout.to_dict() for layout in layouts], f, ensure_ascii=False)
+        temp_file.replace(cache_file)
+    return layouts
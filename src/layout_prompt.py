@@ -0,0 +1,199 @@
+"""
+Layout Prompt Module
+Compact, token-budgeted encoding of page layouts for field-positioning prompts
+"""
+
+import math
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from field_placement import tokenize
+from layout_extraction import BLANK_RUN
+
+# Coordinates are rounded to multiples of this many points
+GRID = 2.0
+# Rows within this many points (vertically) of a label matching a field are kept as context
+CONTEXT = 40.0
+# Spans on one row are merged when the gap between them is at most this many line heights
+MERGE_GAP = 1.5
+# Rough characters-per-token ratio, as in field_analyzer
+CHARS_PER_TOKEN = 4
+
+HEADER = "x y w h text"
+
+_SPACES = re.compile(r"\s+")
+
+
+class LayoutRow(NamedTuple):
+    """One merged line of text (or one blank) on a page, in PDF points with origin top-left."""
+    page_number: int
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    text: str
+
+    @property
+    def is_blank(self) -> bool:
+        """Whether the row is an underscore fill-in blank."""
+        return self.text == "___"
+
+
+def merge_lines(page_data: Dict[int, List[Dict]]) -> List[LayoutRow]:
+    """
+    Merge the text spans of each page into rows.
+
+    Spans whose vertical centres line up are one row; neighbouring spans on a row
+    are joined when the gap between them is small. Underscore blanks are never
+    joined to text, so their extent stays visible, and their text becomes "___".
+
+    Args:
+        page_data: Page number to spans with "text" and "bbox" [x0, y0, x1, y1],
+            as returned by PDFFormGenerator.extract_text_with_positions
+
+    Returns:
+        Rows in reading order
+    """
+    rows: List[LayoutRow] = []
+    for page_number in sorted(page_data):
+        spans = []
+        for block in page_data[page_number]:
+            text = _SPACES.sub(" ", block["text"]).strip()
+            if text:
+                x0, y0, x1, y1 = block["bbox"]
+                spans.append((x0, y0, x1, y1, "___" if BLANK_RUN.fullmatch(text) else text))
+        spans.sort(key=lambda span: (span[1] + span[3]) / 2)
+
+        line: List[Tuple] = []
+        for span in spans:
+            middle = (span[1] + span[3]) / 2
+            if line:
+                first = line[0]
+                if abs(middle - (first[1] + first[3]) / 2) > max(first[3] - first[1], 1.0) / 2:
+                    rows.extend(_merge_row(page_number, line))
+                    line = []
+            line.append(span)
+        if line:
+            rows.extend(_merge_row(page_number, line))
+    return rows
+
+
+def _merge_row(page_number: int, spans: List[Tuple]) -> List[LayoutRow]:
+    """Join neighbouring text spans of one row, left to right."""
+    merged: List[LayoutRow] = []
+    for x0, y0, x1, y1, text in sorted(spans):
+        if merged:
+            last = merged[-1]
+            height = max(last.y1 - last.y0, y1 - y0)
+            if (not last.is_blank and text != "___" and x0 - last.x1 <= MERGE_GAP * height):
+                merged[-1] = LayoutRow(page_number, last.x0, min(last.y0, y0), max(last.x1, x1),
+                                       max(last.y1, y1), f"{last.text} {text}")
+                continue
+        merged.append(LayoutRow(page_number, x0, y0, x1, y1, text))
+    return merged
+
+
+def _distances(rows: List[LayoutRow], field_analysis: List[Dict[str, Any]]) -> List[float]:
+    """
+    Vertical distance from each row to the nearest row sharing words with a field.
+
+    A field that matches no row on its page (or anywhere, without a page number)
+    gives every row of those pages a distance of CONTEXT, so the model still sees them.
+    """
+    row_tokens = [set(tokenize(row.text)) for row in rows]
+    anchors: Dict[int, List[Tuple[float, float]]] = {}
+    whole_pages: Set[Optional[int]] = set()
+    for record in field_analysis:
+        tokens = set(tokenize(record.get("field_name", ""))) | set(tokenize(record.get("description", "")))
+        page_hint = record.get("page_number")
+        found = False
+        for row, words in zip(rows, row_tokens):
+            if words & tokens and (not page_hint or row.page_number == page_hint):
+                anchors.setdefault(row.page_number, []).append((row.y0, row.y1))
+                found = True
+        if not found:
+            whole_pages.add(page_hint or None)
+
+    distances = []
+    for row in rows:
+        distance = min((max(0.0, y0 - row.y1, row.y0 - y1) for y0, y1 in anchors.get(row.page_number, ())),
+                       default=float("inf"))
+        if None in whole_pages or row.page_number in whole_pages:
+            distance = min(distance, CONTEXT)
+        distances.append(distance)
+    return distances
+
+
+def _quantize(value: float, grid: float) -> int:
+    return int(round(value / grid) * grid)
+
+
+def _format_row(row: LayoutRow, grid: float) -> str:
+    x0, y0 = _quantize(row.x0, grid), _quantize(row.y0, grid)
+    width = max(_quantize(row.x1, grid) - x0, 1)
+    height = max(_quantize(row.y1, grid) - y0, 1)
+    return f"{x0} {y0} {width} {height} {row.text}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of some prompt text."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def encode_layout(page_data: Dict[int, List[Dict]], field_analysis: List[Dict[str, Any]],
+                  token_budget: Optional[int] = None, grid: float = GRID,
+                  context: Optional[float] = CONTEXT) -> str:
+    """
+    Encode page text as a compact table for a positioning prompt.
+
+    Spans are merged into rows, rows far from every field's label are dropped,
+    coordinates are rounded to the grid and each row is written as
+    "x y w h text" under a "Page N" heading. When the result would exceed
+    token_budget, the rows furthest from a matching label are dropped first.
+
+    Args:
+        page_data: Page number to spans with "text" and "bbox", as returned by
+            PDFFormGenerator.extract_text_with_positions
+        field_analysis: The fields to be positioned
+        token_budget: Approximate token limit for the encoded layout, or None for no limit
+        grid: Coordinate rounding step in points
+        context: Keep rows within this many points of a matching label, or None to keep every row
+
+    Returns:
+        The encoded layout, starting with the column header
+    """
+    rows = merge_lines(page_data)
+    if context is not None:
+        distances = _distances(rows, field_analysis)
+        kept = [(distance, index) for index, distance in enumerate(distances) if distance <= context]
+    else:
+        kept = [(0.0, index) for index in range(len(rows))]
+
+    lines = {index: _format_row(rows[index], grid) for _, index in kept}
+    if token_budget is not None:
+        # Closest rows first; every page heading used costs a line of its own. Characters are
+        # summed and rounded up once, so per-line rounding cannot add up past the budget
+        selected: List[int] = []
+        pages: Set[int] = set()
+        used = len(HEADER)
+        for _, index in sorted(kept):
+            cost = 1 + len(lines[index])
+            if rows[index].page_number not in pages:
+                cost += 1 + len(f"Page {rows[index].page_number}")
+            if math.ceil((used + cost) / CHARS_PER_TOKEN) > token_budget:
+                continue
+            used += cost
+            pages.add(rows[index].page_number)
+            selected.append(index)
+        indices = sorted(selected)
+    else:
+        indices = sorted(index for _, index in kept)
+
+    output = [HEADER]
+    page_number = None
+    for index in indices:
+        if rows[index].page_number != page_number:
+            page_number = rows[index].page_number
+            output.append(f"Page {page_number}")
+        output.append(lines[index])
+    return "\n".join(output)
@@ -0,0 +1,462 @@
+"""
+LLM Gateway Module
+Shared, rate-limited async access to the chat model, with retries, timeouts and request coalescing
+"""
+
+import argparse
+import asyncio
+import queue
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import (Any, AsyncIterator, Callable, Dict, Iterator, List,
+                    Optional, Tuple, Union)
+
+from config import Config
+from instrumentation import configure_logging, get_logger, increment, span
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class LLMResponse:
+    """Mimics the message object returned by a LangChain chat model."""
+    content: str
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second; 0 or less disables limiting
+            capacity: Largest burst (defaults to one second's worth of tokens, at least 1)
+            clock: Monotonic time source in seconds
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Wait until `amount` tokens are available and take them; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        waited = 0.0
+        # Callers queue on the lock, so tokens are handed out first come, first served
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= amount
+        return waited
+
+
+class ChatModelBackend:
+    """Adapts a LangChain-style chat model (anything with ainvoke() or invoke()) to the gateway."""
+
+    def __init__(self, llm: Any):
+        self.llm = llm
+        self.model = str(getattr(llm, "model", getattr(llm, "model_name", "unknown")))
+
+    async def generate(self, prompt: str) -> str:
+        """Send one prompt and return the response text."""
+        from langchain.schema import HumanMessage
+
+        messages = [HumanMessage(content=prompt)]
+        if hasattr(self.llm, "ainvoke"):
+            response = await self.llm.ainvoke(messages)
+        else:
+            response = await asyncio.to_thread(self.llm.invoke, messages)
+        return str(response.content)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Send one prompt and yield the response text as the model produces it."""
+        if not hasattr(self.llm, "astream"):
+            yield await self.generate(prompt)
+            return
+        from langchain.schema import HumanMessage
+
+        async for chunk in self.llm.astream([HumanMessage(content=prompt)]):
+            if chunk.content:
+                yield str(chunk.content)
+
+
+class GeminiBackend(ChatModelBackend):
+    """Google Gemini through LangChain, created on first use so importing stays cheap."""
+
+    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 0.1):
+        self.model = model
+        self.temperature = temperature
+        self._llm: Any = None
+
+    @property
+    def llm(self) -> Any:
+        """The LangChain chat model, created on first use."""
+        if self._llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            self._llm = ChatGoogleGenerativeAI(
+                model=self.model,
+                google_api_key=Config.get_google_genai_key(),
+                temperature=self.temperature,
+            )
+        return self._llm
+
+
+@dataclass
+class _SharedRequest:
+    """A request in flight and the number of callers waiting for it."""
+    task: "asyncio.Task[str]"
+    waiters: int = 0
+
+
+def _prompt_text(messages: Union[str, List[Any]]) -> str:
+    """Flatten LangChain messages (or a plain string) into one prompt."""
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(getattr(message, "content", message)) for message in messages)
+
+
+class LLMGateway:
+    """
+    One point of access to the chat model, shared by every analyzer and generator.
+
+    Requests run on a private event loop thread, so sync callers (invoke) and async
+    callers on any loop (ainvoke, complete) share one rate limiter, one concurrency
+    limit and one table of in-flight prompts. Identical prompts already in flight
+    are answered by the same request. Streamed requests (stream, astream) share the
+    limits but are never coalesced.
+    """
+
+    def __init__(self, backend: Any, requests_per_second: float = 2.0, burst: Optional[float] = None,
+                 max_concurrency: int = 8, timeout: Optional[float] = 120.0, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0):
+        """
+        Initialize the gateway.
+
+        Args:
+            backend: Object with an async generate(prompt) -> str and a model attribute
+            requests_per_second: Sustained request rate; 0 disables rate limiting
+            burst: Requests allowed at once before the rate applies (defaults to one second's worth)
+            max_concurrency: Maximum requests in flight
+            timeout: Seconds before a single attempt is abandoned (None waits forever)
+            max_retries: Retries after a failed or timed-out attempt
+            backoff_base: Delay before the first retry, doubled on each further attempt
+            backoff_max: Upper bound for a single retry delay
+        """
+        self.backend = backend
+        self.model = str(getattr(backend, "model", "unknown"))
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._in_flight: Dict[Tuple[str, str], _SharedRequest] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the gateway's event loop thread on first use."""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, prompt: str) -> Future:
+        """Schedule a prompt from any thread; returns a concurrent.futures.Future of the response text."""
+        return asyncio.run_coroutine_threadsafe(self._coalesced(prompt), self._ensure_loop())
+
+    async def complete(self, prompt: str) -> str:
+        """Answer a prompt from any event loop."""
+        return await asyncio.wrap_future(self.submit(prompt))
+
+    def complete_sync(self, prompt: str) -> str:
+        """Answer a prompt, blocking the calling thread."""
+        return self.submit(prompt).result()
+
+    # LangChain-compatible surface, so the gateway can be passed wherever a chat model is expected
+
+    def invoke(self, messages: Union[str, List[Any]]) -> LLMResponse:
+        """Synchronously answer a list of messages."""
+        return LLMResponse(self.complete_sync(_prompt_text(messages)))
+
+    async def ainvoke(self, messages: Union[str, List[Any]]) -> LLMResponse:
+        """Asynchronously answer a list of messages."""
+        return LLMResponse(await self.complete(_prompt_text(messages)))
+
+    def stream(self, messages: Union[str, List[Any]]) -> Iterator[LLMResponse]:
+        """Synchronously yield the response to a list of messages in chunks, as it arrives."""
+        chunks: "queue.Queue[Any]" = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_to(_prompt_text(messages), chunks.put_nowait), self._ensure_loop()
+        )
+        try:
+            yield from self._drain(iter(chunks.get, None))
+        finally:
+            future.cancel()  # The caller stopped reading early
+
+    async def astream(self, messages: Union[str, List[Any]]) -> AsyncIterator[LLMResponse]:
+        """Asynchronously yield the response to a list of messages in chunks, as it arrives."""
+        chunks: "asyncio.Queue[Any]" = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_to(_prompt_text(messages), lambda item: loop.call_soon_threadsafe(chunks.put_nowait, item)),
+            self._ensure_loop(),
+        )
+        try:
+            while True:
+                item = await chunks.get()
+                if item is None:
+                    return
+                for chunk in self._drain([item]):
+                    yield chunk
+        finally:
+            future.cancel()
+
+    @staticmethod
+    def _drain(items: Any) -> Iterator[LLMResponse]:
+        """Turn items delivered by _stream_to into response chunks, raising a delivered exception."""
+        for item in items:
+            if isinstance(item, BaseException):
+                raise item
+            yield LLMResponse(item)
+
+    async def _stream_to(self, prompt: str, deliver: Callable[[Any], None]) -> None:
+        """
+        Stream one prompt on the gateway loop, passing each text chunk to deliver().
+
+        An exception is delivered in place of the next chunk and None marks the end.
+        Attempts that fail before the first chunk are retried like any request; once
+        text has been delivered a failure ends the stream, since a retry would repeat it.
+        The timeout applies to the wait for each chunk rather than to the whole response.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        attempt = 0
+        delivered = False
+        try:
+            while True:
+                try:
+                    waited = await self.bucket.acquire()
+                    async with self._semaphore:
+                        with span("llm.request", model=self.model, attempt=attempt, stream=True,
+                                  throttled_ms=round(waited * 1000, 1)):
+                            if hasattr(self.backend, "stream"):
+                                chunks = self.backend.stream(prompt).__aiter__()
+                                while True:
+                                    try:
+                                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                                    except StopAsyncIteration:
+                                        break
+                                    deliver(chunk)
+                                    delivered = True
+                            else:
+                                deliver(await asyncio.wait_for(self.backend.generate(prompt), self.timeout))
+                                delivered = True
+                    increment("llm.requests")
+                    break
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        increment("llm.timeouts")
+                    if delivered or attempt >= self.max_retries:
+                        raise
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    logger.warning(f"LLM stream failed, retrying in {delay:.1f}s: {e!r}",
+                                   extra={"data": {"model": self.model, "attempt": attempt + 1}})
+                    increment("llm.retries")
+                    attempt += 1
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            deliver(e)
+        finally:
+            deliver(None)
+
+    async def _coalesced(self, prompt: str) -> str:
+        """
+        Join an identical request already in flight, or start one. Runs on the gateway loop.
+
+        The request runs as a task of its own that every caller awaits through a shield,
+        so cancelling one caller leaves the others waiting; the request itself is only
+        cancelled once no caller is left.
+        """
+        key = (self.model, prompt)
+        shared = self._in_flight.get(key)
+        if shared is None:
+            task = asyncio.get_running_loop().create_task(self._with_retries(prompt))
+            shared = self._in_flight[key] = _SharedRequest(task)
+            task.add_done_callback(lambda _: self._forget(key, shared))
+        else:
+            increment("llm.coalesced")
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.waiters -= 1
+            if shared.waiters == 0 and not shared.task.done():
+                self._forget(key, shared)  # So a new caller starts afresh instead of joining a cancelled task
+                shared.task.cancel()
+
+    def _forget(self, key: Tuple[str, str], shared: "_SharedRequest") -> None:
+        """Remove a request from the in-flight table, unless a newer one has replaced it."""
+        if self._in_flight.get(key) is shared:
+            del self._in_flight[key]
+
+    async def _with_retries(self, prompt: str) -> str:
+        """Call the backend under the rate limit and concurrency cap, retrying with exponential backoff."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        attempt = 0
+        while True:
+            try:
+                waited = await self.bucket.acquire()
+                async with self._semaphore:
+                    with span("llm.request", model=self.model, attempt=attempt,
+                              throttled_ms=round(waited * 1000, 1)):
+                        response = await asyncio.wait_for(self.backend.generate(prompt), self.timeout)
+                increment("llm.requests")
+                return response
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    increment("llm.timeouts")
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"LLM request failed, retrying in {delay:.1f}s: {e!r}",
+                               extra={"data": {"model": self.model, "attempt": attempt + 1}})
+                increment("llm.retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def close(self) -> None:
+        """Stop the gateway's event loop thread."""
+        with self._start_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = self._thread = None
+                self._semaphore = None
+                self.bucket._lock = None
+
+
+def _float_setting(value: Optional[str], default: float) -> float:
+    return float(value) if value else default
+
+
+def create_gateway(backend: Optional[str] = None, **options: Any) -> LLMGateway:
+    """
+    Build a gateway from configuration.
+
+    Args:
+        backend: "gemini" or "fake"; defaults to PDF_FILLER_LLM_BACKEND, else "gemini"
+        **options: LLMGateway keyword arguments overriding PDF_FILLER_LLM_RPS,
+            PDF_FILLER_LLM_CONCURRENCY and PDF_FILLER_LLM_TIMEOUT
+    """
+    backend = (backend or Config.LLM_BACKEND or "gemini").lower()
+    if backend == "fake":
+        from stub_llm import StubLLM
+
+        llm_backend: Any = ChatModelBackend(StubLLM(latency=_float_setting(Config.LLM_FAKE_LATENCY, 0.05)))
+    elif backend == "gemini":
+        llm_backend = GeminiBackend()
+    else:
+        raise ValueError(f"Unknown LLM backend '{backend}' (expected 'gemini' or 'fake')")
+    options.setdefault("requests_per_second", _float_setting(Config.LLM_REQUESTS_PER_SECOND, 2.0))
+    options.setdefault("max_concurrency", int(_float_setting(Config.LLM_MAX_CONCURRENCY, 8)))
+    options.setdefault("timeout", _float_setting(Config.LLM_TIMEOUT, 120.0))
+    return LLMGateway(llm_backend, **options)
+
+
+_default_gateway: Optional[LLMGateway] = None
+_default_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Get the process-wide gateway, creating it from configuration on first use."""
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            _default_gateway = create_gateway()
+        return _default_gateway
+
+
+def set_gateway(gateway: Optional[LLMGateway]) -> None:
+    """Replace the process-wide gateway (None recreates it from configuration on next use)."""
+    global _default_gateway
+    with _default_lock:
+        _default_gateway = gateway
+
+
+async def _load_test(gateway: LLMGateway, requests: int, distinct: int) -> List[float]:
+    """Fire `requests` prompts (cycling through `distinct` texts) at once; returns per-request latencies."""
+    async def one(index: int) -> float:
+        started = time.perf_counter()
+        try:
+            await gateway.complete(f"load test prompt {index % distinct}")
+        except Exception as e:
+            logger.error(f"Request {index} failed: {e!r}")
+        return time.perf_counter() - started
+
+    return await asyncio.gather(*[one(index) for index in range(requests)])
+
+
+def main():
+    """Load-test the gateway against a stub chat model."""
+    from stub_llm import StubLLM
+
+    parser = argparse.ArgumentParser(description="Load-test the LLM gateway offline with a stub chat model.")
+    parser.add_argument("--requests", type=int, default=100, help="Number of requests to send")
+    parser.add_argument("--distinct", type=int, default=100,
+                        help="Distinct prompts among them (fewer means more coalescing)")
+    parser.add_argument("--rps", type=float, default=20.0, help="Rate limit in requests per second")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of stub calls that fail")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Per-attempt timeout in seconds")
+    args = parser.parse_args()
+    configure_logging()
+
+    stub = StubLLM(latency=args.latency, jitter=args.latency / 2, failure_rate=args.failure_rate, seed=0)
+    gateway = LLMGateway(ChatModelBackend(stub), requests_per_second=args.rps, max_concurrency=args.concurrency,
+                         timeout=args.timeout, backoff_base=0.05)
+    started = time.perf_counter()
+    latencies = asyncio.run(_load_test(gateway, args.requests, max(1, args.distinct)))
+    elapsed = time.perf_counter() - started
+    gateway.close()
+
+    latencies.sort()
+    print(f"{args.requests} requests ({stub.calls} backend calls) in {elapsed:.2f}s "
+          f"= {args.requests / elapsed:.1f} req/s")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.0f}ms, "
+          f"max {latencies[-1] * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
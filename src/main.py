@@ -9,6 +9,7 @@ from pathlib import Path
 from typing import Any, Dict
 
 # Import our modules
+from instrumentation import configure_logging
 from pdf_reader import PDFReader, display_fields
 from pdf_writer import PDFWriter, fill_pdf_form
 
@@ -78,6 +79,7 @@ class PDFFormFillerApp:
 
 def main():
     """Main function demonstrating the modular PDF form filler."""
+    configure_logging()
     # Configuration
     pdf_path = "docs/Sample-Fillable-PDF.pdf"
     
@@ -0,0 +1,501 @@
+"""
+Merged Output Module
+Streams many filled copies of one template into a single PDF, sharing the template's resources
+"""
+
+import sys
+from array import array
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, List, Optional,
+                    Union)
+
+try:
+    from PyPDF2.generic import (ArrayObject, BooleanObject, DictionaryObject,
+                                IndirectObject, NameObject, NullObject,
+                                NumberObject, PdfObject, StreamObject,
+                                TextStringObject)
+except ImportError:
+    print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
+    sys.exit(1)
+
+from appearance import (FieldLayout, appearance_stream, layout_for, render,
+                        standard_font)
+from instrumentation import get_logger, increment, span
+from pdf_writer import apply_widget_value
+from template_cache import (CompiledTemplate, PdfSource, WidgetRef,
+                            is_path_source, load_template)
+
+DEFAULT_FIELD_PREFIX = "copy_{index}"
+
+# Page attributes that may be inherited from /Pages nodes (PDF 32000-1, 7.7.3.4)
+_INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# Object numbers of the document-level objects, reserved up front and written last
+_CATALOG, _PAGE_TREE, _ACROFORM = 1, 2, 3
+
+# Slot key of each copy's parent field (template object numbers are positive)
+_WRAPPER = -1
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class MergeStats:
+    """What a merged write produced."""
+    copies: int = 0
+    pages: int = 0
+    objects: int = 0
+    shared_objects: int = 0
+    bytes_written: int = 0
+
+
+class _NewRef(PdfObject):
+    """A reference to an object number in the output file, as opposed to the template."""
+
+    def __init__(self, number: int):
+        self.number = number
+
+    def write_to_stream(self, stream: BinaryIO, encryption_key: Any = None) -> None:
+        stream.write(f"{self.number} 0 R".encode())
+
+
+class _Slot(PdfObject):
+    """Placeholder for a reference that each copy fills with its own object number."""
+
+    def __init__(self, key: int):
+        self.key = key
+
+
+class _Parts:
+    """Serialized bytes split around slots, so a compiled object can be re-rendered per copy."""
+
+    def __init__(self):
+        self.parts: List[Union[bytes, int]] = []
+        self._buffer = BytesIO()
+
+    def write(self, data: bytes) -> None:
+        self._buffer.write(data)
+
+    def slot(self, key: int) -> None:
+        self.parts.append(self._buffer.getvalue())
+        self.parts.append(key)
+        self._buffer = BytesIO()
+
+    def finish(self) -> List[Union[bytes, int]]:
+        self.parts.append(self._buffer.getvalue())
+        return self.parts
+
+
+class _CountingWriter:
+    """Tracks the output offset without requiring a seekable file."""
+
+    def __init__(self, output_file: BinaryIO):
+        self.output_file = output_file
+        self.position = 0
+
+    def write(self, data: bytes) -> None:
+        self.output_file.write(data)
+        self.position += len(data)
+
+
+class MergedDocumentWriter:
+    """
+    Writes filled copies of a template one after another into a single PDF.
+
+    Everything a copy does not modify - content streams, fonts, images, form
+    XObjects and widget appearance streams - is written once and referenced by
+    every copy. Each copy only adds its own page dictionaries, annotations and
+    field dictionaries, and is written out as soon as it is filled, so memory
+    stays bounded by one copy plus an offset per object.
+
+    Each copy's fields are nested under a new parent field named after the copy
+    (e.g. "copy_3.Name"), so field names never collide across copies.
+    """
+
+    def __init__(self, template: Union[PdfSource, CompiledTemplate], output_file: BinaryIO,
+                 field_prefix: Union[str, Callable[[int, Dict[str, str]], str]] = DEFAULT_FIELD_PREFIX):
+        """
+        Start a merged document.
+
+        Args:
+            template: Template path, bytes, binary file object or compiled template
+            output_file: Binary file object to stream the merged PDF into
+            field_prefix: Name of each copy's parent field, as a pattern formatted with
+                the record fields and {index}, or a function of (index, record)
+        """
+        self.template = template if isinstance(template, CompiledTemplate) else load_template(template)
+        if "/Encrypt" in self.template.reader.trailer:
+            raise ValueError("Merging encrypted PDFs is not supported")
+        self.field_prefix = field_prefix
+        self.out = _CountingWriter(output_file)
+        self.stats = MergeStats()
+
+        self._offsets = array("q", [0] * (_ACROFORM + 1))  # Output object number -> byte offset
+        self._shared: Dict[int, int] = {}  # Template object number -> output object number
+        self._pending_shared: List[IndirectObject] = []
+        # Template object number -> original reference, which carries the object's generation
+        self._references: Dict[int, IndirectObject] = {}
+        self._page_numbers: List[int] = []
+        self._copy_fields: List[int] = []
+        self._compiled: Dict[int, List[Union[bytes, int]]] = {}  # Unmodified per-copy objects
+        self._standard_font: Optional[_NewRef] = None  # Written once if a /DA font is missing from /DR
+        self._undrawn = False  # Whether any filled widget is left for the viewer to draw
+        self._closed = False
+        self._collect_template_objects()
+
+        self.out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _collect_template_objects(self) -> None:
+        """Classify template objects: the page tree is rebuilt, per-copy objects are duplicated."""
+        reader = self.template.reader
+        self._excluded = {reader.trailer.raw_get("/Root").idnum}
+        acroform_reference = reader.trailer["/Root"].raw_get("/AcroForm")
+        if isinstance(acroform_reference, IndirectObject):
+            self._excluded.add(acroform_reference.idnum)
+
+        # Intermediate /Pages nodes are replaced by the merged page tree
+        stack = [reader.trailer["/Root"].raw_get("/Pages")]
+        while stack:
+            reference = stack.pop()
+            kids = reference.get_object().get("/Kids")
+            if kids is None:
+                continue
+            if isinstance(reference, IndirectObject):
+                self._excluded.add(reference.idnum)
+            stack.extend(kids.get_object())
+
+        # Per-copy objects, in the order each copy writes them
+        self._per_copy: List[int] = []
+        self._page_ids: List[int] = []
+        for page in self.template.pages:
+            reference = page.indirect_reference
+            self._page_ids.append(reference.idnum)
+            self._add_per_copy(reference)
+            annotations = page.raw_get("/Annots") if "/Annots" in page else None
+            if isinstance(annotations, IndirectObject):
+                self._add_per_copy(annotations)
+            for annotation in annotations.get_object() if annotations is not None else ():
+                if isinstance(annotation, IndirectObject):
+                    self._add_per_copy(annotation)
+
+        acroform = self.template.acroform
+        fields = acroform.get("/Fields") if acroform is not None else None
+        stack = list(fields.get_object()) if fields is not None else []
+        self._root_fields = [reference.idnum for reference in stack if isinstance(reference, IndirectObject)]
+        while stack:
+            reference = stack.pop()
+            if not isinstance(reference, IndirectObject):
+                continue
+            self._add_per_copy(reference)
+            kids = reference.get_object().get("/Kids")
+            if kids is not None:
+                stack.extend(kids.get_object())
+
+        # A widget merged with its field appears both in /Annots and /Fields
+        self._per_copy = list(dict.fromkeys(self._per_copy))
+        self._per_copy_set = set(self._per_copy)
+
+        # Pages hang off the merged page tree and take their inherited attributes along;
+        # top-level fields hang off each copy's parent field
+        self._relinked: Dict[int, DictionaryObject] = {}
+        for page in self.template.pages:
+            relinked = DictionaryObject()
+            relinked.update(page)
+            for key in _INHERITABLE_PAGE_KEYS:
+                if key not in relinked:
+                    inherited = self._inherited_page_value(page, key)
+                    if inherited is not None:
+                        relinked[NameObject(key)] = inherited
+            relinked[NameObject("/Parent")] = _NewRef(_PAGE_TREE)
+            self._relinked[page.indirect_reference.idnum] = relinked
+        for idnum in self._root_fields:
+            relinked = DictionaryObject()
+            relinked.update(self._resolve(self._references[idnum]))
+            relinked[NameObject("/Parent")] = _Slot(_WRAPPER)
+            self._relinked[idnum] = relinked
+
+    def _add_per_copy(self, reference: IndirectObject) -> None:
+        self._per_copy.append(reference.idnum)
+        self._references[reference.idnum] = reference
+
+    def _resolve(self, reference: IndirectObject) -> Any:
+        """Look up a template object by its original reference, or null (with a warning) if it is missing."""
+        obj = self.template.reader.get_object(reference)
+        if obj is None:
+            logger.warning(f"Template object {reference.idnum} {reference.generation} R not found; writing null")
+            increment("merge.missing_objects")
+            return NullObject()
+        return obj
+
+    def _allocate(self) -> int:
+        self._offsets.append(0)
+        return len(self._offsets) - 1
+
+    def _shared_number(self, reference: IndirectObject) -> int:
+        """Output object number of a shared template object, queueing it to be written once."""
+        number = self._shared.get(reference.idnum)
+        if number is None:
+            number = self._shared[reference.idnum] = self._allocate()
+            self._pending_shared.append(reference)
+        return number
+
+    def _serialize(self, obj: Any, out: "_Parts", in_copy: bool) -> None:
+        """
+        Write a PDF object, translating template references to output object numbers.
+
+        References to per-copy objects become slots that each copy fills with its own
+        numbers; outside a copy (in shared objects) they are written as null.
+        """
+        if isinstance(obj, IndirectObject):
+            idnum = obj.idnum
+            if idnum in self._per_copy_set and in_copy:
+                out.slot(idnum)
+            elif idnum in self._per_copy_set or idnum in self._excluded:
+                out.write(b"null")
+            else:
+                out.write(b"%d 0 R" % self._shared_number(obj))
+        elif isinstance(obj, _Slot):
+            out.slot(obj.key)
+        elif isinstance(obj, DictionaryObject):
+            is_stream = isinstance(obj, StreamObject)
+            out.write(b"<<")
+            for key, value in obj.items():
+                if is_stream and key == "/Length":
+                    continue
+                out.write(b"\n")
+                key.write_to_stream(out, None)
+                out.write(b" ")
+                self._serialize(value, out, in_copy)
+            if is_stream:
+                out.write(b"\n/Length %d\n>>\nstream\n" % len(obj._data))
+                out.write(obj._data)
+                out.write(b"\nendstream")
+            else:
+                out.write(b"\n>>")
+        elif isinstance(obj, ArrayObject):
+            out.write(b"[")
+            for index, item in enumerate(obj):
+                if index:
+                    out.write(b" ")
+                self._serialize(item, out, in_copy)
+            out.write(b"]")
+        else:
+            obj.write_to_stream(out, None)
+
+    def _compile(self, obj: Any, in_copy: bool = True) -> List[Union[bytes, int]]:
+        out = _Parts()
+        self._serialize(obj, out, in_copy)
+        return out.finish()
+
+    def _write_parts(self, number: int, parts: List[Union[bytes, int]],
+                     numbers: Optional[Dict[int, int]] = None) -> None:
+        body = b"".join(part if isinstance(part, bytes) else b"%d 0 R" % numbers[part] for part in parts)
+        self._offsets[number] = self.out.position
+        self.out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+    def _flush_shared(self) -> None:
+        """Write shared objects discovered so far; they may reference further shared objects."""
+        while self._pending_shared:
+            reference = self._pending_shared.pop()
+            obj = self._resolve(reference)
+            self._write_parts(self._shared[reference.idnum], self._compile(obj, in_copy=False))
+            self.stats.shared_objects += 1
+
+    def _prefix(self, index: int, record: Dict[str, str]) -> str:
+        if callable(self.field_prefix):
+            name = self.field_prefix(index, record)
+        else:
+            name = self.field_prefix.format_map({**record, "index": index})
+        if not name or "." in name:
+            raise ValueError(f"Invalid field prefix '{name}': partial field names cannot be empty or contain '.'")
+        return name
+
+    def add_copy(self, record: Dict[str, str]) -> None:
+        """Fill one copy of the template with a record and append it to the output."""
+        if self._closed:
+            raise ValueError("Cannot add copies after close()")
+        index = self.stats.copies
+        prefix = self._prefix(index, record)
+
+        with span("merge.copy", index=index):
+            # Shallow copies of the template objects this copy fills in
+            overrides: Dict[int, DictionaryObject] = {}
+
+            def copy_of(reference: IndirectObject) -> DictionaryObject:
+                if reference.idnum not in overrides:
+                    copy = DictionaryObject()
+                    copy.update(self._relinked.get(reference.idnum) or reference.get_object())
+                    overrides[reference.idnum] = copy
+                return overrides[reference.idnum]
+
+            for field_name, value in record.items():
+                for page_index, annot_index in self.template.widget_index.get(field_name, ()):
+                    widget_reference = self.template.pages[page_index]["/Annots"].get_object()[annot_index]
+                    if not isinstance(widget_reference, IndirectObject):
+                        continue
+                    widget = copy_of(widget_reference)
+                    field = widget if "/T" in widget else copy_of(widget.raw_get("/Parent"))
+                    apply_widget_value(widget, str(value), field)
+                    self._set_appearance((page_index, annot_index), widget, str(value))
+
+            numbers = {idnum: self._allocate() for idnum in self._per_copy}
+            numbers[_WRAPPER] = self._allocate()
+            for idnum in self._per_copy:
+                if idnum in overrides:
+                    parts = self._compile(overrides[idnum])
+                else:
+                    parts = self._compiled.get(idnum)
+                    if parts is None:
+                        obj = self._relinked.get(idnum) or self._resolve(self._references[idnum])
+                        parts = self._compiled[idnum] = self._compile(obj)
+                self._write_parts(numbers[idnum], parts, numbers)
+            self._flush_shared()
+
+            parent_field = DictionaryObject()
+            parent_field[NameObject("/T")] = TextStringObject(prefix)
+            parent_field[NameObject("/Kids")] = ArrayObject(
+                [_NewRef(numbers[idnum]) for idnum in self._root_fields]
+            )
+            self._write_parts(numbers[_WRAPPER], self._compile(parent_field))
+
+        self._page_numbers.extend(numbers[idnum] for idnum in self._page_ids)
+        self._copy_fields.append(numbers[_WRAPPER])
+        self.stats.copies += 1
+        self.stats.pages += len(self._page_ids)
+        increment("merge.copies")
+
+    def _set_appearance(self, widget_ref: WidgetRef, widget: DictionaryObject, value: str) -> None:
+        """
+        Give a copy's filled widget its own generated normal appearance.
+
+        Buttons keep their appearance states. Widgets that cannot be drawn lose
+        the template's appearance, so the viewer redraws them instead of showing
+        the template's value.
+        """
+        layout = layout_for(self.template, widget_ref)
+        content = render(layout, value) if layout is not None else None
+        if content is None:
+            if "/AS" not in widget and "/AP" in widget:
+                del widget["/AP"]
+                self._undrawn = True
+            return
+        number = self._allocate()
+        stream = appearance_stream(layout, content, self._font_reference(layout))
+        self._write_parts(number, self._compile(stream, in_copy=False))
+        appearances = DictionaryObject()
+        appearances[NameObject("/N")] = _NewRef(number)
+        widget[NameObject("/AP")] = appearances
+        increment("merge.appearances_generated")
+
+    def _font_reference(self, layout: FieldLayout) -> Any:
+        """The template's /DA font, shared by every copy, or a Helvetica font written once."""
+        if layout.font is not None:
+            return layout.font
+        if self._standard_font is None:
+            self._standard_font = _NewRef(self._allocate())
+            self._write_parts(self._standard_font.number, self._compile(standard_font(), in_copy=False))
+        return self._standard_font
+
+    def _inherited_page_value(self, page: DictionaryObject, key: str) -> Any:
+        """Raw value of an inheritable attribute from a page's /Pages ancestors."""
+        node = page.get("/Parent")
+        while node is not None:
+            node = node.get_object()
+            if key in node:
+                return node.raw_get(key)
+            node = node.get("/Parent")
+        return None
+
+    def close(self) -> MergeStats:
+        """Write the page tree, AcroForm, catalog and cross-reference table."""
+        if self._closed:
+            return self.stats
+        self._closed = True
+
+        page_tree = DictionaryObject()
+        page_tree[NameObject("/Type")] = NameObject("/Pages")
+        page_tree[NameObject("/Kids")] = ArrayObject([_NewRef(number) for number in self._page_numbers])
+        page_tree[NameObject("/Count")] = NumberObject(len(self._page_numbers))
+        self._write_parts(_PAGE_TREE, self._compile(page_tree, in_copy=False))
+
+        acroform = DictionaryObject()
+        template_acroform = self.template.acroform
+        for key in ("/DR", "/DA", "/Q"):
+            if template_acroform is not None and key in template_acroform:
+                acroform[NameObject(key)] = template_acroform.raw_get(key)
+        acroform[NameObject("/Fields")] = ArrayObject([_NewRef(number) for number in self._copy_fields])
+        if self._undrawn:
+            acroform[NameObject("/NeedAppearances")] = BooleanObject(True)
+        self._write_parts(_ACROFORM, self._compile(acroform, in_copy=False))
+
+        catalog = DictionaryObject()
+        catalog[NameObject("/Type")] = NameObject("/Catalog")
+        catalog[NameObject("/Pages")] = _NewRef(_PAGE_TREE)
+        catalog[NameObject("/AcroForm")] = _NewRef(_ACROFORM)
+        self._write_parts(_CATALOG, self._compile(catalog, in_copy=False))
+        self._flush_shared()
+
+        size = len(self._offsets)
+        xref_offset = self.out.position
+        table = BytesIO()
+        table.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for number in range(1, size):
+            table.write(b"%010d 00000 n \n" % self._offsets[number])
+        table.write(f"trailer\n<< /Size {size} /Root {_CATALOG} 0 R >>\n".encode())
+        table.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+        self.out.write(table.getvalue())
+
+        self.stats.objects = size - 1
+        self.stats.bytes_written = self.out.position
+        return self.stats
+
+
+def write_merged(template: Union[PdfSource, CompiledTemplate], records: Iterable[Dict[str, str]],
+                 output_path: Union[str, Path, BinaryIO],
+                 field_prefix: Union[str, Callable[[int, Dict[str, str]], str]] = DEFAULT_FIELD_PREFIX
+                 ) -> MergeStats:
+    """
+    Fill one template with every record and write all copies into a single PDF.
+
+    Records are consumed lazily and each copy is streamed out as soon as it is
+    filled, so thousands of copies can be merged in bounded memory. Skipping a
+    record would renumber every later copy, so the first record that cannot be
+    filled stops the merge, and a partly written output file is removed.
+
+    Args:
+        template: Template path, bytes, binary file object or compiled template
+        records: Iterable of field name to value dictionaries
+        output_path: Output path or writable binary file object
+        field_prefix: Per-copy parent field name pattern, formatted with the record and {index}
+
+    Returns:
+        MergeStats describing the output
+
+    Raises:
+        ValueError: Naming the index of the first record that could not be filled
+    """
+    if not is_path_source(output_path):
+        return _write_merged(template, records, output_path, field_prefix)
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(output_path, 'wb') as output_file:
+            stats = _write_merged(template, records, output_file, field_prefix)
+    except BaseException:
+        output_path.unlink(missing_ok=True)
+        raise
+    logger.info(f"Merged {stats.copies} copies ({stats.pages} pages) into: {output_path}")
+    return stats
+
+
+def _write_merged(template, records, output_file, field_prefix) -> MergeStats:
+    with span("merge.write"):
+        writer = MergedDocumentWriter(template, output_file, field_prefix)
+        for index, record in enumerate(records):
+            try:
+                writer.add_copy(record)
+            except (KeyError, ValueError) as e:
+                raise ValueError(f"Record {index}: {e}") from e
+        return writer.close()
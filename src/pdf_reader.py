@@ -4,8 +4,9 @@ Handles reading and analyzing PDF form fields
 """
 
 import sys
+from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
 
 try:
     from PyPDF2 import PdfReader
@@ -13,78 +14,147 @@ except ImportError:
     print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
     sys.exit(1)
 
+from form_schema import FieldSpec, FormSchema, iter_field_specs
+from instrumentation import get_logger, span
+from template_cache import PdfSource, is_path_source, read_source_bytes
+
+logger = get_logger(__name__)
+
 
 class PDFReader:
     """A class to handle reading PDF form fields."""
     
-    def __init__(self, pdf_path: str):
-        """Initialize with the path to the PDF file."""
-        self.pdf_path = Path(pdf_path)
+    def __init__(self, pdf_path: PdfSource):
+        """Initialize with the path to the PDF file, its bytes, or a binary file object."""
+        self.source = pdf_path
+        self.pdf_path = Path(pdf_path) if is_path_source(pdf_path) else None
         self.reader = None
         self.fields = {}
+        self._schema: Optional[FormSchema] = None
+        
+    def load_pdf(self, keep_objects: bool = True) -> bool:
+        """
+        Load the PDF file. Fields are read lazily, when they are first asked for.
         
-    def load_pdf(self) -> bool:
-        """Load the PDF file and extract form fields."""
+        Args:
+            keep_objects: Keep the PyPDF2 reader after loading. Pass False to extract
+                the compact schema immediately and hold only that.
+        """
         try:
-            if not self.pdf_path.exists():
-                print(f"Error: PDF file not found at {self.pdf_path}")
-                return False
+            with span("pdf.load", source="reader"):
+                if self.pdf_path is None:
+                    self.reader = PdfReader(BytesIO(read_source_bytes(self.source)))
+                elif not self.pdf_path.exists():
+                    logger.error(f"Error: PDF file not found at {self.pdf_path}")
+                    return False
+                else:
+                    self.reader = PdfReader(str(self.pdf_path))
+                self.fields = {}
+                self._schema = None
                 
-            self.reader = PdfReader(str(self.pdf_path))
-            
-            # Check if the PDF has form fields
-            if not self.reader.get_fields():
-                print("Warning: This PDF does not appear to have fillable form fields.")
-                return True
+                # Check if the PDF has form fields
+                if not self.has_fields():
+                    logger.warning("Warning: This PDF does not appear to have fillable form fields.")
                 
-            # Extract form fields
-            self.fields = self.reader.get_fields()
+                if not keep_objects:
+                    self.release_objects()
             return True
             
         except Exception as e:
-            print(f"Error loading PDF: {e}")
+            logger.error(f"Error loading PDF: {e}", extra={"data": {"path": str(self.pdf_path)}})
+            return False
+    
+    def has_fields(self) -> bool:
+        """Check whether the form's /Fields array is non-empty, without reading any field."""
+        if self._schema is not None:
+            return bool(self._schema)
+        if self.reader is None:
+            return False
+        acroform = self.reader.trailer["/Root"].get("/AcroForm")
+        if acroform is None:
             return False
+        fields = acroform.get_object().get("/Fields")
+        return fields is not None and len(fields.get_object()) > 0
+    
+    def iter_fields(self) -> Iterator[FieldSpec]:
+        """
+        Yield the form's fields one at a time as the AcroForm tree is walked.
+        
+        Nothing is collected up front, so the first field is available immediately
+        and memory stays flat however many fields the document has.
+        """
+        if self._schema is not None:
+            yield from self._schema
+        elif self.reader is not None:
+            yield from iter_field_specs(self.reader, release=True)
+    
+    @property
+    def schema(self) -> FormSchema:
+        """Compact schema of every field, extracted on first use."""
+        return self._build_schema()
+    
+    def _build_schema(self) -> FormSchema:
+        """Extract the schema unless that was already done, and return it."""
+        if self._schema is None:
+            self._schema = FormSchema(
+                fields=tuple(self.iter_fields()),
+                page_count=len(self.reader.pages) if self.reader is not None else 0,
+            )
+        return self._schema
+    
+    def release_objects(self) -> None:
+        """Extract the schema, then drop the PyPDF2 reader and raw field objects."""
+        self._build_schema()
+        self.reader = None
+        self.fields = {}
     
     def get_fields(self) -> Dict[str, Any]:
-        """Get all form fields from the PDF."""
+        """Get all raw PyPDF2 form field objects (empty once objects are released)."""
+        if not self.fields and self.reader is not None:
+            self.fields = self.reader.get_fields() or {}
         return self.fields
     
+    def get_schema(self) -> FormSchema:
+        """Get the compact schema of the form's fields."""
+        return self.schema
+    
     def list_fields(self) -> None:
-        """List all available form fields in the PDF."""
-        if not self.fields:
-            print("No form fields found in the PDF.")
-            return
-            
-        print(f"\nFound {len(self.fields)} form fields:")
-        print("-" * 50)
-        
-        for field_name, field in self.fields.items():
-            field_type = field.get('/FT', 'Unknown')
-            current_value = field.get('/V', '')
-            print(f"Field: {field_name}")
-            print(f"  Type: {field_type}")
-            print(f"  Current Value: {current_value}")
+        """List all available form fields in the PDF, printing each as soon as it is read."""
+        count = 0
+        for spec in self.iter_fields():
+            if count == 0:
+                print("\nForm fields:")
+                print("-" * 50)
+            count += 1
+            print(f"Field: {spec.name}")
+            print(f"  Type: {spec.type}")
+            print(f"  Current Value: {spec.value}")
             print()
+        
+        if count == 0:
+            print("No form fields found in the PDF.")
+        else:
+            print(f"Found {count} form fields.")
     
     def get_field_names(self) -> list:
         """Get a list of all field names."""
-        return list(self.fields.keys())
+        return [spec.name for spec in self.iter_fields()]
     
     def get_field_info(self, field_name: str) -> Optional[Dict[str, Any]]:
         """Get detailed information about a specific field."""
-        if field_name not in self.fields:
+        with span("pdf.field_lookup", fields=1):
+            spec = next((spec for spec in self.iter_fields() if spec.name == field_name), None)
+        if spec is None:
             return None
             
-        field = self.fields[field_name]
-        return {
-            'name': field_name,
-            'type': field.get('/FT', 'Unknown'),
-            'current_value': field.get('/V', ''),
-            'field_object': field
-        }
+        info = spec.to_dict()
+        info['current_value'] = info.pop('value')
+        if field_name in self.fields:
+            info['field_object'] = self.fields[field_name]
+        return info
 
 
-def read_pdf_fields(pdf_path: str) -> Dict[str, Any]:
+def read_pdf_fields(pdf_path: PdfSource) -> Dict[str, Any]:
     """Convenience function to quickly read fields from a PDF."""
     reader = PDFReader(pdf_path)
     if reader.load_pdf():
@@ -92,7 +162,7 @@ def read_pdf_fields(pdf_path: str) -> Dict[str, Any]:
     return {}
 
 
-def display_fields(pdf_path: str) -> None:
+def display_fields(pdf_path: PdfSource) -> None:
     """Convenience function to display all fields from a PDF."""
     reader = PDFReader(pdf_path)
     if reader.load_pdf():
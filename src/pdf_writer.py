@@ -4,115 +4,521 @@ Handles filling and writing PDF forms
 """
 
 import sys
+from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Union
 
 try:
-    from PyPDF2 import PdfReader, PdfWriter
+    from PyPDF2.generic import (ArrayObject, BooleanObject,
+                                DecodedStreamObject, DictionaryObject,
+                                IndirectObject, NameObject, NullObject,
+                                StreamObject, TextStringObject)
 except ImportError:
     print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
     sys.exit(1)
 
+from appearance import (FieldLayout, appearance_stream, layout_for, render,
+                        standard_font)
+from incremental_update import (ObjectUpdates, next_object_number,
+                                write_incremental_update)
+from instrumentation import get_logger, increment, span
+from template_cache import (CompiledTemplate, PdfSource, WidgetRef,
+                            is_path_source, load_template)
+
+# Values that tick a checkbox regardless of the on-state name it defines
+_CHECKED_VALUES = {"yes", "on", "true", "1", "x", "checked"}
+
+# Annotation flags of widgets that are not drawn when flattening: Hidden and NoView
+_HIDDEN_FLAGS = 2 | 32
+
+logger = get_logger(__name__)
+
+
+def _inherited_value(field: DictionaryObject, key: str) -> Any:
+    """Look up an inheritable field attribute such as /FT on the field or its ancestors."""
+    node = field
+    while node is not None:
+        if key in node:
+            return node[key]
+        node = node.get("/Parent")
+        if node is not None:
+            node = node.get_object()
+    return None
+
+
+def _appearance_states(widget: DictionaryObject) -> List[str]:
+    """Names of the normal appearance states of a button widget, e.g. ["/Yes", "/Off"]."""
+    appearances = widget.get("/AP")
+    states = appearances.get_object().get("/N") if appearances is not None else None
+    states = states.get_object() if states is not None else None
+    return list(states) if isinstance(states, DictionaryObject) else []
+
+
+def apply_widget_value(widget: DictionaryObject, value: str,
+                       field: Optional[DictionaryObject] = None) -> List[DictionaryObject]:
+    """
+    Write a value into a widget annotation and the field it belongs to.
+
+    The field dictionary is looked up from the widget unless one is passed in, which
+    lets callers update copies of the original objects. Returns the dictionaries that
+    were modified, so callers can track changed objects. A button value that names
+    none of the field's appearance states turns it off (/V and /AS both /Off).
+    """
+    # Widgets without their own /T are kids of the terminal field that holds /V
+    if field is None:
+        field = widget if "/T" in widget else widget["/Parent"].get_object()
+    modified = [field] if field is widget else [field, widget]
+
+    if _inherited_value(field, "/FT") == "/Btn":
+        state = value if value.startswith("/") else f"/{value}"
+        on_states = _appearance_states(widget)
+        if state not in on_states and value.lower() in _CHECKED_VALUES:
+            # Checkboxes name their on-state freely (/Yes, /On, /1...), so use whichever one exists
+            state = next((name for name in on_states if name != "/Off"), state)
+        # Radio kids each have their own on-state, so /V may name a state of a sibling widget
+        kids = field.get("/Kids")
+        field_states = ({name for kid in kids for name in _appearance_states(kid.get_object())}
+                        if kids is not None else set(on_states))
+        field[NameObject("/V")] = NameObject(state if state in field_states else "/Off")
+        widget[NameObject("/AS")] = NameObject(state if state in on_states else "/Off")
+    else:
+        field[NameObject("/V")] = TextStringObject(value)
+    return modified
+
+
+def _normal_appearance(widget: DictionaryObject) -> Any:
+    """Reference to the appearance stream a widget currently shows, or None."""
+    appearances = widget.get("/AP")
+    if appearances is None or "/N" not in appearances.get_object():
+        return None
+    normal = appearances.get_object().raw_get("/N")
+    if isinstance(normal.get_object(), StreamObject):
+        return normal
+    # Buttons keep one appearance per state, selected by /AS
+    state = widget.get("/AS")
+    states = normal.get_object()
+    return states.raw_get(state) if state is not None and state in states else None
+
+
+def _placement_matrix(widget: DictionaryObject, appearance: StreamObject) -> List[float]:
+    """Matrix mapping an appearance stream's transformed /BBox onto the widget's /Rect (PDF 32000-1, 12.5.5)."""
+    x0, y0, x1, y1 = (float(value) for value in appearance.get("/BBox", [0, 0, 1, 1]))
+    a, b, c, d, e, f = (float(value) for value in appearance.get("/Matrix", [1, 0, 0, 1, 0, 0]))
+    corners = [(a * x + c * y + e, b * x + d * y + f) for x in (x0, x1) for y in (y0, y1)]
+    bx0, bx1 = min(x for x, _ in corners), max(x for x, _ in corners)
+    by0, by1 = min(y for _, y in corners), max(y for _, y in corners)
+    rx0, ry0, rx1, ry1 = (float(value) for value in widget["/Rect"])
+    rx0, rx1, ry0, ry1 = min(rx0, rx1), max(rx0, rx1), min(ry0, ry1), max(ry0, ry1)
+    sx = (rx1 - rx0) / (bx1 - bx0) if bx1 > bx0 else 1.0
+    sy = (ry1 - ry0) / (by1 - by0) if by1 > by0 else 1.0
+    return [sx, 0.0, 0.0, sy, rx0 - sx * bx0, ry0 - sy * by0]
+
 
 class PDFWriter:
     """A class to handle filling and writing PDF forms."""
     
-    def __init__(self, pdf_path: str):
-        """Initialize with the path to the PDF file."""
-        self.pdf_path = Path(pdf_path)
+    def __init__(self, pdf_path: Union[PdfSource, CompiledTemplate], generate_appearances: bool = True):
+        """
+        Initialize with a PDF path, bytes, binary file object or an already compiled template.
+
+        With generate_appearances=True (the default) filled text and combo box fields get
+        /AP appearance streams drawn here, so viewers show the values without regenerating
+        them; NeedAppearances is only set when some filled field could not be drawn.
+        """
+        self.source = pdf_path
+        self.generate_appearances = generate_appearances
+        if isinstance(pdf_path, CompiledTemplate):
+            self.compiled = pdf_path
+            self.pdf_path = pdf_path.path
+        else:
+            self.compiled = None
+            self.pdf_path = Path(pdf_path) if is_path_source(pdf_path) else None
+        self.template = None
         self.reader = None
-        self.writer = None
+        self._writer = None  # Created on first use; incremental saves never need it
         self.fields = {}
+        self.filled_values: Dict[str, str] = {}
+        self._undrawn_fields: Set[str] = set()
+        self._appearances: Dict[WidgetRef, IndirectObject] = {}
+        self._fonts: Dict[str, Any] = {}
+        self.flattened = False
         
     def load_pdf(self) -> bool:
         """Load the PDF file for writing."""
         try:
-            if not self.pdf_path.exists():
-                print(f"Error: PDF file not found at {self.pdf_path}")
-                return False
-                
-            self.reader = PdfReader(str(self.pdf_path))
-            self.writer = PdfWriter()
-            self.fields = self.reader.get_fields()
+            with span("pdf.load", source="writer"):
+                if self.compiled is not None:
+                    self.template = self.compiled
+                elif self.pdf_path is None:
+                    # In-memory sources are compiled once; file objects cannot be read twice
+                    self.template = self.compiled = load_template(self.source)
+                else:
+                    if not self.pdf_path.exists():
+                        logger.error(f"Error: PDF file not found at {self.pdf_path}")
+                        return False
+                    self.template = load_template(self.pdf_path)
+                    
+                self.reader = self.template.reader
+                self._writer = None
+                self.fields = self.template.fields
+                self.filled_values = {}
+                self._undrawn_fields = set()
+                self._appearances = {}
+                self._fonts = {}
+                self.flattened = False
             return True
             
         except Exception as e:
-            print(f"Error loading PDF: {e}")
+            logger.error(f"Error loading PDF: {e}", extra={"data": {"path": str(self.pdf_path)}})
             return False
     
+    @property
+    def writer(self) -> Any:
+        """
+        The PdfWriter holding the filled document, or None before load_pdf().
+
+        It is only created when a full rewrite or flatten needs it, and then gets
+        every value filled so far; incremental saves patch the template instead.
+        """
+        if self._writer is None and self.template is not None:
+            self._writer = self.template.new_writer()
+            self._apply_to_writer(self.filled_values)
+        return self._writer
+
+    @property
+    def undrawn_fields(self) -> Set[str]:
+        """Filled fields left for the viewer to draw (drawing the values first if needed)."""
+        if self.writer is None:
+            return set()
+        return self._undrawn_fields
+
     def fill_single_field(self, field_name: str, value: str) -> bool:
         """Fill a single form field with a value."""
-        if not self.reader or not self.writer:
-            print("Error: PDF not loaded. Call load_pdf() first.")
+        if self.template is None:
+            logger.error("Error: PDF not loaded. Call load_pdf() first.")
             return False
             
         if field_name not in self.fields:
-            print(f"Error: Field '{field_name}' not found in the PDF.")
+            logger.error(f"Error: Field '{field_name}' not found in the PDF.")
             return False
             
         try:
-            # Add all pages to the writer
-            for page in self.reader.pages:
-                self.writer.add_page(page)
-            
-            # Fill the field
-            self.writer.update_page_form_field_values(
-                self.writer.pages[0], {field_name: value}
-            )
+            self._write_field_values({field_name: value})
             return True
             
         except Exception as e:
-            print(f"Error filling field '{field_name}': {e}")
+            logger.error(f"Error filling field '{field_name}': {e}")
             return False
     
     def fill_multiple_fields(self, field_values: Dict[str, str]) -> bool:
         """Fill multiple form fields at once."""
-        if not self.reader or not self.writer:
-            print("Error: PDF not loaded. Call load_pdf() first.")
+        if self.template is None:
+            logger.error("Error: PDF not loaded. Call load_pdf() first.")
             return False
             
         try:
-            # Add all pages to the writer
-            for page in self.reader.pages:
-                self.writer.add_page(page)
-            
-            # Fill all fields
-            self.writer.update_page_form_field_values(
-                self.writer.pages[0], field_values
-            )
+            self._write_field_values(field_values)
             return True
             
         except Exception as e:
-            print(f"Error filling multiple fields: {e}")
+            logger.error(f"Error filling multiple fields: {e}")
             return False
     
-    def save_pdf(self, output_path: str) -> bool:
-        """Save the filled PDF to a new file."""
-        if not self.writer:
-            print("Error: No PDF writer available. Fill some fields first.")
+    def _write_field_values(self, field_values: Dict[str, str]) -> None:
+        """Record the values, and write them to the writer's widgets if it already exists."""
+        values = {name: str(value) for name, value in field_values.items()}
+        self.filled_values.update(values)
+        if self._writer is not None:
+            self._apply_to_writer(values)
+        increment("pdf.fields_filled", len(values))
+
+    def _apply_to_writer(self, field_values: Dict[str, str]) -> None:
+        """Write each value straight to the writer's widgets using the template's widget index."""
+        widget_index = self.template.widget_index
+        with span("pdf.field_lookup", fields=len(field_values)):
+            targets = [(name, value, widget_index.get(name, ())) for name, value in field_values.items()]
+        with span("pdf.fill", fields=len(targets)):
+            for field_name, value, widgets in targets:
+                self._undrawn_fields.discard(field_name)
+                for widget_ref in widgets:
+                    page_index, annot_index = widget_ref
+                    widget = self._writer.pages[page_index]["/Annots"][annot_index].get_object()
+                    apply_widget_value(widget, value)
+                    if not self.generate_appearances or not self._set_appearance(widget_ref, widget, value):
+                        self._undrawn_fields.add(field_name)
+            if self._undrawn_fields:
+                self._writer.set_need_appearances_writer()
+
+    def _set_appearance(self, widget_ref: WidgetRef, widget: DictionaryObject, value: str) -> bool:
+        """
+        Give a filled widget a generated normal appearance.
+
+        Returns False if the widget still needs the viewer to draw it. Buttons only
+        switch between the appearance states they already have.
+        """
+        layout = layout_for(self.template, widget_ref)
+        if layout is None:
+            return "/AS" in widget
+        content = render(layout, value)
+        if content is None:
+            return False
+        reference = self._appearances.get(widget_ref)
+        if reference is not None:
+            reference.get_object().set_data(content)  # Filled again: reuse the stream
+            return True
+        stream = appearance_stream(layout, content, self._font_reference(layout))
+        reference = self._appearances[widget_ref] = self._writer._add_object(stream)
+        appearances = DictionaryObject()
+        appearances[NameObject("/N")] = reference
+        widget[NameObject("/AP")] = appearances
+        increment("pdf.appearances_generated")
+        return True
+
+    def _font_reference(self, layout: FieldLayout) -> IndirectObject:
+        """The writer's copy of the /DA font, or a Helvetica font added once per document."""
+        font = self._fonts.get(layout.font_name)
+        if font is None:
+            fonts = DictionaryObject()
+            acroform = self._writer._root_object.get("/AcroForm")
+            resources = acroform.get_object().get("/DR") if acroform is not None else None
+            if resources is not None and "/Font" in resources.get_object():
+                fonts = resources.get_object()["/Font"]
+            if layout.font is not None and layout.font_name in fonts:
+                font = fonts.raw_get(layout.font_name)
+            else:
+                font = self._writer._add_object(standard_font())
+            self._fonts[layout.font_name] = font
+        return font
+    
+    def flatten(self) -> bool:
+        """
+        Burn every widget's current appearance into its page and remove the form.
+
+        Widget annotations, the field tree and the AcroForm are dropped in the same
+        pass, so the saved PDF is no longer editable. Call after filling; values are
+        drawn from the appearance streams the fill generated. Fails without changing
+        the PDF if some filled field could not be drawn here (undrawn_fields), since
+        flattening would burn in its old appearance and lose the value.
+        """
+        if self.template is None:
+            logger.error("Error: PDF not loaded. Call load_pdf() first.")
+            return False
+
+        try:
+            if self.undrawn_fields:
+                logger.error(f"Error: Cannot flatten; no appearance could be generated for: "
+                             f"{', '.join(sorted(self.undrawn_fields))}",
+                             extra={"data": {"fields": sorted(self.undrawn_fields)}})
+                return False
+
+            with span("pdf.flatten") as current:
+                current.set_attribute("widgets", self._flatten_pages())
+            self.flattened = True
+            return True
+
+        except Exception as e:
+            logger.error(f"Error flattening PDF: {e}")
+            return False
+
+    def _flatten_pages(self) -> int:
+        """Draw widget appearances as page XObjects and drop the form objects; returns the widgets drawn."""
+        writer = self.writer
+        dropped: List[Any] = []
+        drawn = 0
+        for page in writer.pages:
+            annotations = page.get("/Annots")
+            if annotations is None:
+                continue
+            kept = ArrayObject()
+            placements = []
+            for reference in annotations.get_object():
+                widget = reference.get_object()
+                if widget.get("/Subtype") != "/Widget":
+                    kept.append(reference)
+                    continue
+                dropped.append(reference)
+                appearance = _normal_appearance(widget)
+                if appearance is None or int(widget.get("/F", 0)) & _HIDDEN_FLAGS:
+                    continue
+                if not isinstance(appearance, IndirectObject):
+                    appearance = writer._add_object(appearance)  # XObjects must be indirect
+                placements.append((appearance, _placement_matrix(widget, appearance.get_object())))
+            if len(kept) == len(annotations.get_object()):
+                continue
+            if kept:
+                page[NameObject("/Annots")] = kept
+            else:
+                del page["/Annots"]
+            if not placements:
+                continue
+
+            if "/Resources" not in page:
+                page[NameObject("/Resources")] = DictionaryObject()
+            resources = page["/Resources"]
+            if "/XObject" not in resources:
+                resources[NameObject("/XObject")] = DictionaryObject()
+            xobjects = resources["/XObject"]
+            operations = []
+            for appearance, matrix in placements:
+                name = f"/FlatField{drawn}"
+                while name in xobjects:
+                    drawn += 1
+                    name = f"/FlatField{drawn}"
+                xobjects[NameObject(name)] = appearance
+                operations.append(f"q {' '.join(f'{value:g}' for value in matrix)} cm {name} Do Q")
+                drawn += 1
+
+            # Wrap the existing content in q/Q so its graphics state cannot leak into the fields
+            contents = page.raw_get("/Contents") if "/Contents" in page else None
+            existing = contents.get_object() if contents is not None else []
+            existing = list(existing) if isinstance(existing, list) else [contents]
+            before, after = DecodedStreamObject(), DecodedStreamObject()
+            before.set_data(b"q\n")
+            after.set_data(("Q\n" + "\n".join(operations) + "\n").encode("ascii"))
+            page[NameObject("/Contents")] = ArrayObject(
+                [writer._add_object(before)] + existing + [writer._add_object(after)]
+            )
+
+        root = writer._root_object
+        if "/AcroForm" in root:
+            acroform_reference = root.raw_get("/AcroForm")
+            stack = list(root["/AcroForm"].get("/Fields", []))
+            del root["/AcroForm"]
+            dropped.append(acroform_reference)
+            while stack:
+                reference = stack.pop()
+                dropped.append(reference)
+                stack.extend(reference.get_object().get("/Kids", []))
+        # PdfWriter writes every object it holds, so blank the orphaned form objects
+        for reference in dropped:
+            if isinstance(reference, IndirectObject) and reference.pdf is writer:
+                writer._objects[reference.idnum - 1] = NullObject()
+        return drawn
+
+    def _incremental_updates(self) -> ObjectUpdates:
+        """Build modified copies of the original field, widget and AcroForm objects."""
+        updates: ObjectUpdates = {}
+
+        def copy_of(reference: IndirectObject) -> DictionaryObject:
+            if not isinstance(reference, IndirectObject):
+                raise ValueError("Cannot incrementally update an inline form object")
+            if reference.idnum not in updates:
+                copy = DictionaryObject()
+                copy.update(reference.get_object())
+                updates[reference.idnum] = (reference.generation, copy)
+            return updates[reference.idnum][1]
+
+        new_numbers = iter(range(next_object_number(self.template), sys.maxsize))
+        fonts: Dict[str, Any] = {}
+
+        def add_object(obj: Any) -> IndirectObject:
+            number = next(new_numbers)
+            updates[number] = (0, obj)
+            return IndirectObject(number, 0, self.template.reader)
+
+        needs_viewer_appearances = not self.generate_appearances
+        for field_name, value in self.filled_values.items():
+            for widget_ref in self.template.widget_index.get(field_name, ()):
+                page_index, annot_index = widget_ref
+                widget = copy_of(self.template.pages[page_index]["/Annots"][annot_index])
+                field = widget if "/T" in widget else copy_of(widget.raw_get("/Parent"))
+                apply_widget_value(widget, value, field)
+                if not self.generate_appearances:
+                    continue
+                layout = layout_for(self.template, widget_ref)
+                if layout is None:
+                    needs_viewer_appearances = needs_viewer_appearances or "/AS" not in widget
+                    continue
+                content = render(layout, value)
+                if content is None:
+                    needs_viewer_appearances = True
+                    continue
+                if layout.font_name not in fonts:
+                    fonts[layout.font_name] = layout.font if layout.font is not None else add_object(standard_font())
+                appearances = DictionaryObject()
+                appearances[NameObject("/N")] = add_object(
+                    appearance_stream(layout, content, fonts[layout.font_name])
+                )
+                widget[NameObject("/AP")] = appearances
+                increment("pdf.appearances_generated")
+
+        if not needs_viewer_appearances:
+            return updates
+
+        root_reference = self.template.reader.trailer.raw_get("/Root")
+        acroform_reference = root_reference.get_object().raw_get("/AcroForm")
+        if isinstance(acroform_reference, IndirectObject):
+            acroform = copy_of(acroform_reference)
+        elif acroform_reference is not None:
+            acroform = DictionaryObject()
+            acroform.update(acroform_reference)
+            copy_of(root_reference)[NameObject("/AcroForm")] = acroform
+        else:
+            return updates
+        acroform[NameObject("/NeedAppearances")] = BooleanObject(True)
+        return updates
+    
+    def write_to(self, output_file: BinaryIO, incremental: bool = False) -> None:
+        """Serialize the filled PDF into a writable binary file object."""
+        with span("pdf.save", incremental=incremental):
+            if incremental:
+                write_incremental_update(self.template, self._incremental_updates(), output_file)
+            else:
+                self.writer.write(output_file)
+    
+    def save_pdf(self, output_path: Union[str, Path, BinaryIO], incremental: bool = False) -> bool:
+        """
+        Save the filled PDF to a new file, or stream it into a binary file object.
+
+        With incremental=True the original bytes are copied unchanged and only the
+        modified field objects are appended as an incremental update.
+        """
+        if self.template is None:
+            logger.error("Error: PDF not loaded. Call load_pdf() first.")
             return False
             
+        if incremental and self.flattened:
+            logger.error("Error: A flattened PDF cannot be saved as an incremental update.")
+            return False
+
         try:
+            if not is_path_source(output_path):
+                self.write_to(output_path, incremental)
+                return True
+
             output_path = Path(output_path)
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
             with open(output_path, 'wb') as output_file:
-                self.writer.write(output_file)
+                self.write_to(output_file, incremental)
             
-            print(f"Filled PDF saved to: {output_path}")
+            logger.info(f"Filled PDF saved to: {output_path}")
             return True
             
         except Exception as e:
-            print(f"Error saving PDF: {e}")
+            logger.error(f"Error saving PDF: {e}")
             return False
     
+    def to_bytes(self, incremental: bool = False) -> Optional[bytes]:
+        """Return the filled PDF as bytes without touching disk."""
+        buffer = BytesIO()
+        if not self.save_pdf(buffer, incremental):
+            return None
+        return buffer.getvalue()
+    
     def get_available_fields(self) -> list:
         """Get a list of available field names."""
         return list(self.fields.keys()) if self.fields else []
 
 
-def fill_pdf_form(input_path: str, field_values: Dict[str, str], output_path: str) -> bool:
-    """Convenience function to fill a PDF form and save it."""
+def fill_pdf_form(input_path: Union[PdfSource, CompiledTemplate], field_values: Dict[str, str],
+                  output_path: Union[str, Path, BinaryIO], incremental: bool = False,
+                  flatten: bool = False) -> bool:
+    """
+    Convenience function to fill a PDF form and save it to a path or binary file object.
+
+    With flatten=True the values are burned into the page content and the form is removed.
+    """
     writer = PDFWriter(input_path)
     
     if not writer.load_pdf():
@@ -120,11 +526,32 @@ def fill_pdf_form(input_path: str, field_values: Dict[str, str], output_path: st
         
     if not writer.fill_multiple_fields(field_values):
         return False
+
+    if flatten and not writer.flatten():
+        return False
+        
+    return writer.save_pdf(output_path, incremental=incremental)
+
+
+def fill_pdf_form_to_bytes(input_path: Union[PdfSource, CompiledTemplate], field_values: Dict[str, str],
+                           incremental: bool = False, flatten: bool = False) -> Optional[bytes]:
+    """Convenience function to fill a PDF form entirely in memory and return the PDF bytes."""
+    writer = PDFWriter(input_path)
+    
+    if not writer.load_pdf():
+        return None
+        
+    if not writer.fill_multiple_fields(field_values):
+        return None
+
+    if flatten and not writer.flatten():
+        return None
         
-    return writer.save_pdf(output_path)
+    return writer.to_bytes(incremental=incremental)
 
 
-def fill_single_field(input_path: str, field_name: str, value: str, output_path: str) -> bool:
+def fill_single_field(input_path: Union[PdfSource, CompiledTemplate], field_name: str, value: str,
+                      output_path: Union[str, Path, BinaryIO]) -> bool:
     """Convenience function to fill a single field and save the PDF."""
     writer = PDFWriter(input_path)
     
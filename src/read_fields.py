@@ -14,6 +14,8 @@ except ImportError:
     print("PyPDF2 is not installed. Please install it with: uv add pypdf2")
     sys.exit(1)
 
+from form_schema import iter_field_specs
+
 
 def read_pdf_fields(pdf_path: str):
     """Read and display all form fields from a PDF."""
@@ -25,23 +27,22 @@ def read_pdf_fields(pdf_path: str):
     
     try:
         reader = PdfReader(str(pdf_path))
-        fields = reader.get_fields()
-        
-        if not fields:
-            print("No form fields found in this PDF.")
-            return True
         
-        print(f"Found {len(fields)} form fields in {pdf_path.name}:")
-        print("=" * 60)
-        
-        for i, (field_name, field) in enumerate(fields.items(), 1):
-            field_type = field.get('/FT', 'Unknown')
-            current_value = field.get('/V', '')
-            print(f"{i}. Field Name: {field_name}")
-            print(f"   Type: {field_type}")
-            print(f"   Current Value: {current_value}")
+        # Fields are printed as the form tree is walked, so output starts immediately
+        count = 0
+        for count, spec in enumerate(iter_field_specs(reader, release=True), 1):
+            if count == 1:
+                print(f"Form fields in {pdf_path.name}:")
+                print("=" * 60)
+            print(f"{count}. Field Name: {spec.name}")
+            print(f"   Type: {spec.type}")
+            print(f"   Current Value: {spec.value}")
             print()
         
+        if count == 0:
+            print("No form fields found in this PDF.")
+        else:
+            print(f"Found {count} form fields in {pdf_path.name}.")
         return True
             
     except Exception as e:
@@ -0,0 +1,251 @@
+"""
+Schema Index Module
+Persistent SQLite index of the form schemas of a directory of PDF templates
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    from PyPDF2 import PdfReader
+except ImportError:
+    print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
+    sys.exit(1)
+
+from form_schema import FormSchema
+from instrumentation import get_logger
+
+DEFAULT_INDEX_PATH = Path(__file__).parent.parent / ".cache" / "schema_index.sqlite3"
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class TemplateRecord:
+    """An indexed template, as stored in the index."""
+    path: str
+    content_hash: str
+    page_count: int
+    field_count: int
+
+
+@dataclass
+class FieldMatch:
+    """A field of an indexed template matching a query."""
+    path: str
+    name: str
+    type: str
+    page: Optional[int]
+
+
+@dataclass
+class IndexStats:
+    """What an index update did."""
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+
+
+class SchemaIndex:
+    """Answers template and field lookups from SQLite, without opening any PDFs."""
+
+    def __init__(self, db_path: str = str(DEFAULT_INDEX_PATH)):
+        """
+        Open (or create) the index database.
+
+        Args:
+            db_path: Path of the SQLite database file, or ":memory:"
+        """
+        self.db_path = db_path
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS templates (
+                path TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                page_count INTEGER NOT NULL,
+                schema_json TEXT NOT NULL,
+                indexed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fields (
+                path TEXT NOT NULL,
+                name TEXT NOT NULL COLLATE NOCASE,
+                type TEXT NOT NULL,
+                page INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS fields_name ON fields (name);
+            CREATE INDEX IF NOT EXISTS fields_path ON fields (path);
+            CREATE INDEX IF NOT EXISTS templates_hash ON templates (content_hash);
+            """
+        )
+        self._conn.commit()
+
+    def update(self, directory: str, pattern: str = "**/*.pdf") -> IndexStats:
+        """
+        Bring the index up to date with the templates under a directory.
+
+        Files whose size and modification time are unchanged are skipped without
+        being read. Changed files are hashed, and only parsed when their content
+        actually differs. Entries for deleted files are removed.
+
+        Args:
+            directory: Directory of PDF templates
+            pattern: Glob pattern selecting templates, relative to the directory
+
+        Returns:
+            IndexStats describing the changes
+        """
+        stats = IndexStats()
+        root = Path(directory).resolve()
+        prefix = str(root) + os.sep
+        with self._lock:
+            known = {
+                path: (mtime_ns, size, content_hash)
+                for path, mtime_ns, size, content_hash in self._conn.execute(
+                    "SELECT path, mtime_ns, size, content_hash FROM templates"
+                )
+                if path.startswith(prefix)
+            }
+
+        seen = set()
+        for pdf_path in sorted(root.glob(pattern)):
+            if not pdf_path.is_file():
+                continue
+            path = str(pdf_path)
+            seen.add(path)
+            stat = pdf_path.stat()
+            previous = known.get(path)
+            if previous is not None and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+                stats.unchanged += 1
+                continue
+
+            try:
+                data = pdf_path.read_bytes()
+                content_hash = hashlib.sha256(data).hexdigest()
+                if previous is not None and previous[2] == content_hash:
+                    # Touched but not modified: refresh the stat signature only
+                    with self._lock:
+                        self._conn.execute(
+                            "UPDATE templates SET mtime_ns = ?, size = ? WHERE path = ?",
+                            (stat.st_mtime_ns, stat.st_size, path),
+                        )
+                        self._conn.commit()
+                    stats.unchanged += 1
+                    continue
+                schema = self._extract_schema(data)
+            except Exception as e:
+                logger.error(f"Error indexing {path}: {e}")
+                stats.failed += 1
+                continue
+
+            self._store(path, content_hash, stat.st_mtime_ns, stat.st_size, schema)
+            if previous is None:
+                stats.added += 1
+            else:
+                stats.updated += 1
+
+        removed = [path for path in known if path not in seen]
+        if removed:
+            with self._lock:
+                self._conn.executemany("DELETE FROM fields WHERE path = ?", [(path,) for path in removed])
+                self._conn.executemany("DELETE FROM templates WHERE path = ?", [(path,) for path in removed])
+                self._conn.commit()
+            stats.removed = len(removed)
+        return stats
+
+    @staticmethod
+    def _extract_schema(data: bytes) -> FormSchema:
+        """Parse a template just long enough to extract its schema."""
+        return FormSchema.from_reader(PdfReader(BytesIO(data)))
+
+    def _store(self, path: str, content_hash: str, mtime_ns: int, size: int, schema: FormSchema) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM fields WHERE path = ?", (path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO templates "
+                "(path, content_hash, mtime_ns, size, page_count, schema_json, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, content_hash, mtime_ns, size, schema.page_count, schema.to_json(), time.time()),
+            )
+            self._conn.executemany(
+                "INSERT INTO fields (path, name, type, page) VALUES (?, ?, ?, ?)",
+                [(path, spec.name, spec.type, spec.page) for spec in schema],
+            )
+            self._conn.commit()
+
+    def templates(self) -> List[TemplateRecord]:
+        """List every indexed template."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.path, t.content_hash, t.page_count, COUNT(f.name) "
+                "FROM templates t LEFT JOIN fields f ON f.path = t.path "
+                "GROUP BY t.path ORDER BY t.path"
+            ).fetchall()
+        return [TemplateRecord(*row) for row in rows]
+
+    def schema(self, path: str) -> Optional[FormSchema]:
+        """Get the stored schema of a template, or None if it is not indexed."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT schema_json FROM templates WHERE path = ?", (str(Path(path).resolve()),)
+            ).fetchone()
+        return FormSchema.from_json(row[0]) if row is not None else None
+
+    def find_fields(self, name: str, field_type: Optional[str] = None,
+                    pattern: bool = False) -> List[FieldMatch]:
+        """
+        Find fields by name across every indexed template.
+
+        Args:
+            name: Field name, matched exactly but case-insensitively
+            field_type: Only return fields of this PDF type, e.g. "/Tx"
+            pattern: Treat name as an SQL LIKE pattern: % matches any run of characters
+                and _ any single character; escape them with a backslash to match them literally
+
+        Returns:
+            List of FieldMatch objects ordered by template path
+        """
+        if pattern:
+            query = "SELECT path, name, type, page FROM fields WHERE name LIKE ? ESCAPE '\\'"
+        else:
+            query = "SELECT path, name, type, page FROM fields WHERE name = ?"
+        params: list = [name]
+        if field_type is not None:
+            query += " AND type = ?"
+            params.append(field_type)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY path, rowid", params).fetchall()
+        return [FieldMatch(*row) for row in rows]
+
+    def templates_with_field(self, name: str, field_type: Optional[str] = None,
+                             pattern: bool = False) -> List[str]:
+        """Paths of the templates that have a field matching name (see find_fields)."""
+        paths = []
+        for match in self.find_fields(name, field_type, pattern):
+            if not paths or paths[-1] != match.path:
+                paths.append(match.path)
+        return paths
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,97 @@
+"""
+Stub LLM Module
+Offline stand-in for a LangChain chat model, for tests, benchmarks, load tests and local runs
+"""
+
+import asyncio
+import random
+import time
+from typing import (Any, AsyncIterator, Callable, Iterator, List, Optional,
+                    Tuple, Union)
+
+from llm_gateway import LLMResponse
+
+
+class StubLLM:
+    """Answers prompts from a fixed string or a callable instead of calling a model."""
+
+    def __init__(self, response: Union[str, Callable[[str], str]] = "[]", model: str = "stub-llm",
+                 latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 seed: Optional[int] = None, stream_chunks: int = 8):
+        """
+        Initialize the stub.
+
+        Args:
+            response: Text returned for every prompt, or a function of the prompt text
+            model: Model name reported to callers (used in cache keys)
+            latency: Seconds each call takes
+            jitter: Extra random latency of up to this many seconds
+            failure_rate: Fraction of calls that raise ConnectionError
+            seed: Seed for latency jitter and failures, for reproducible runs
+            stream_chunks: Pieces a streamed response is split into, spread over the latency
+        """
+        self.response = response
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stream_chunks = stream_chunks
+        self.prompts: List[str] = []
+        self._random = random.Random(seed)
+
+    @property
+    def calls(self) -> int:
+        """Number of prompts answered so far."""
+        return len(self.prompts)
+
+    def _start(self, messages: Union[str, List[Any]]) -> Tuple[str, float]:
+        """Record a prompt and decide its latency, returning both; raises for an injected failure."""
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = "\n".join(str(getattr(message, "content", message)) for message in messages)
+        self.prompts.append(prompt)
+        latency = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise ConnectionError("Injected stub LLM failure")
+        return prompt, latency
+
+    def _text(self, prompt: str) -> str:
+        # Answer the call's own prompt: concurrent calls may have recorded newer ones meanwhile
+        return self.response(prompt) if callable(self.response) else self.response
+
+    def _pieces(self, text: str) -> List[str]:
+        size = max(1, -(-len(text) // max(1, self.stream_chunks)))
+        return [text[start:start + size] for start in range(0, max(len(text), 1), size)]
+
+    def invoke(self, messages: Union[str, List[Any]]) -> LLMResponse:
+        """Synchronously answer a list of messages."""
+        prompt, latency = self._start(messages)
+        if latency:
+            time.sleep(latency)
+        return LLMResponse(self._text(prompt))
+
+    async def ainvoke(self, messages: Union[str, List[Any]]) -> LLMResponse:
+        """Asynchronously answer a list of messages."""
+        prompt, latency = self._start(messages)
+        if latency:
+            await asyncio.sleep(latency)
+        return LLMResponse(self._text(prompt))
+
+    def stream(self, messages: Union[str, List[Any]]) -> Iterator[LLMResponse]:
+        """Synchronously answer in pieces, spreading the latency between them."""
+        prompt, latency = self._start(messages)
+        pieces = self._pieces(self._text(prompt))
+        for piece in pieces:
+            if latency:
+                time.sleep(latency / len(pieces))
+            yield LLMResponse(piece)
+
+    async def astream(self, messages: Union[str, List[Any]]) -> AsyncIterator[LLMResponse]:
+        """Asynchronously answer in pieces, spreading the latency between them."""
+        prompt, latency = self._start(messages)
+        pieces = self._pieces(self._text(prompt))
+        for piece in pieces:
+            if latency:
+                await asyncio.sleep(latency / len(pieces))
+            yield LLMResponse(piece)
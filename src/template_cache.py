@@ -0,0 +1,225 @@
+"""
+Template Cache Module
+Parses PDF form templates once and keeps them ready for repeated filling
+"""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+try:
+    from PyPDF2 import PdfReader, PdfWriter
+    from PyPDF2.generic import DictionaryObject, NameObject
+except ImportError:
+    print("PyPDF2 is not installed. Please install it with: pip install PyPDF2")
+    sys.exit(1)
+
+from form_schema import FormSchema
+from instrumentation import increment, span
+
+# (page index, position of the widget in the page's /Annots array)
+WidgetRef = Tuple[int, int]
+
+# A filesystem path, the PDF bytes themselves, or a binary file object to read them from
+PdfSource = Union[str, Path, bytes, bytearray, memoryview, BinaryIO]
+
+
+def is_path_source(source: PdfSource) -> bool:
+    """Check whether a PDF source refers to a file on disk."""
+    return isinstance(source, (str, Path))
+
+
+def read_source_bytes(source: PdfSource) -> bytes:
+    """Get the raw PDF bytes from any supported source."""
+    if is_path_source(source):
+        return Path(source).read_bytes()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    return source.read()
+
+
+def _qualified_field_name(annotation: DictionaryObject) -> Optional[str]:
+    """Build the fully qualified field name of a widget by walking its /Parent chain."""
+    parts = []
+    node = annotation
+    while node is not None:
+        if "/T" in node:
+            parts.append(str(node["/T"]))
+        node = node.get("/Parent")
+        if node is not None:
+            node = node.get_object()
+    if not parts:
+        return None
+    return ".".join(reversed(parts))
+
+
+class CompiledTemplate:
+    """A PDF form template parsed once and reused for many fills."""
+
+    def __init__(self, pdf_path: Optional[Union[str, Path]], data: bytes, mtime: float = 0.0):
+        """Parse the template bytes and build the field-to-widget index."""
+        # Templates compiled from memory have no path
+        self.path = Path(pdf_path) if pdf_path is not None else None
+        self.mtime = mtime
+        self.data = data
+        self.content_hash = hashlib.sha256(data).hexdigest()
+
+        self.reader = PdfReader(BytesIO(data))
+        self.pages = list(self.reader.pages)
+        self.fields: Dict[str, Any] = self.reader.get_fields() or {}
+
+        root = self.reader.trailer["/Root"]
+        self.acroform: Optional[DictionaryObject] = root.get("/AcroForm")
+        if self.acroform is not None:
+            self.acroform = self.acroform.get_object()
+
+        self.widget_index: Dict[str, List[WidgetRef]] = self._build_widget_index()
+        self._schema: Optional[FormSchema] = None
+        # Widget appearance layouts, filled lazily by appearance.layout_for()
+        self.appearance_layouts: Dict[WidgetRef, Any] = {}
+
+    @classmethod
+    def from_path(cls, pdf_path: Union[str, Path]) -> "CompiledTemplate":
+        """Read and compile a template from disk."""
+        pdf_path = Path(pdf_path)
+        return cls(pdf_path, pdf_path.read_bytes(), pdf_path.stat().st_mtime)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, bytearray, memoryview]) -> "CompiledTemplate":
+        """Compile a template held in memory."""
+        return cls(None, bytes(data))
+
+    def _build_widget_index(self) -> Dict[str, List[WidgetRef]]:
+        """Map every field name to the widget annotations that display it."""
+        index: Dict[str, List[WidgetRef]] = {}
+        for page_index, page in enumerate(self.pages):
+            annotations = page.get("/Annots")
+            if annotations is None:
+                continue
+            for annot_index, annotation in enumerate(annotations.get_object()):
+                annotation = annotation.get_object()
+                if annotation.get("/Subtype") != "/Widget":
+                    continue
+                field_name = _qualified_field_name(annotation)
+                if field_name is not None:
+                    index.setdefault(field_name, []).append((page_index, annot_index))
+        return index
+
+    @property
+    def schema(self) -> FormSchema:
+        """Compact schema of the template's fields, extracted on first use."""
+        if self._schema is None:
+            with span("schema.extract"):
+                self._schema = FormSchema.from_reader(self.reader)
+        return self._schema
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages in the template."""
+        return len(self.pages)
+
+    def new_writer(self) -> PdfWriter:
+        """Create a PdfWriter holding a fresh copy of the template, ready to fill."""
+        writer = PdfWriter()
+        for page in self.pages:
+            writer.add_page(page)
+
+        if self.acroform is not None:
+            # Pages were cloned first, so /Fields resolves to the widgets already in the writer
+            acroform = self.acroform.clone(writer)
+            writer._root_object[NameObject("/AcroForm")] = writer._add_object(acroform)
+        return writer
+
+
+class TemplateCache:
+    """LRU cache of compiled templates keyed by path, modification time and content hash."""
+
+    def __init__(self, max_size: int = 32):
+        """Initialize an empty cache holding at most max_size templates."""
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, int, str], CompiledTemplate]" = OrderedDict()
+        # The content hash is only recomputed when the stat signature of a file changes
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, pdf_path: PdfSource) -> CompiledTemplate:
+        """Return the compiled template for a source, compiling it on a miss."""
+        if not is_path_source(pdf_path):
+            return self._get_in_memory(read_source_bytes(pdf_path))
+
+        pdf_path = Path(pdf_path).resolve()
+        stat = pdf_path.stat()
+        stat_key = (str(pdf_path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            digest = self._hashes.get(stat_key)
+            if digest is not None:
+                key = (str(pdf_path), stat.st_mtime_ns, digest)
+                template = self._entries.get(key)
+                if template is not None:
+                    self._entries.move_to_end(key)
+                    increment("template_cache.hits")
+                    return template
+
+        increment("template_cache.misses")
+        with span("template.compile"):
+            data = pdf_path.read_bytes()
+            template = CompiledTemplate(pdf_path, data, stat.st_mtime)
+        key = (str(pdf_path), stat.st_mtime_ns, template.content_hash)
+
+        with self._lock:
+            self._hashes[stat_key] = template.content_hash
+            self._store(key, template)
+        return template
+
+    def _get_in_memory(self, data: bytes) -> CompiledTemplate:
+        """Return the compiled template for in-memory bytes, keyed by content hash alone."""
+        key = ("<memory>", 0, hashlib.sha256(data).hexdigest())
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                increment("template_cache.hits")
+                return template
+
+        increment("template_cache.misses")
+        with span("template.compile"):
+            template = CompiledTemplate.from_bytes(data)
+        with self._lock:
+            self._store(key, template)
+        return template
+
+    def _store(self, key: Tuple[str, int, str], template: CompiledTemplate) -> None:
+        """Insert a template and evict the least recently used ones. Caller holds the lock."""
+        self._entries[key] = template
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            (path, mtime_ns, _), _ = self._entries.popitem(last=False)
+            for cached in [k for k in self._hashes if k[0] == path and k[1] == mtime_ns]:
+                del self._hashes[cached]
+
+    def clear(self) -> None:
+        """Drop every cached template."""
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_default_cache = TemplateCache()
+
+
+def get_template_cache() -> TemplateCache:
+    """Get the process-wide template cache."""
+    return _default_cache
+
+
+def load_template(pdf_path: PdfSource) -> CompiledTemplate:
+    """Convenience function to get a compiled template from the process-wide cache."""
+    return _default_cache.get(pdf_path)
@@ -0,0 +1,14 @@
+"""
+Tests
+Modules under src/ are imported by their flat names, as pdf_filler.py does. Run with:
+
+    python -m unittest discover tests
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DOCS = PROJECT_ROOT / "docs"
+
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
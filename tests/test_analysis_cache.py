@@ -0,0 +1,104 @@
+"""
+AnalysisCache tests: keys, expiry, least-recently-used eviction and reuse by the field analyzer
+"""
+
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests import PROJECT_ROOT  # isort: split
+
+from analysis_cache import AnalysisCache
+from field_analyzer import PDFFieldAnalyzer
+from stub_llm import StubLLM
+
+RECORDS = [{"field_name": "name", "field_type": "text", "description": "Full name",
+            "page_number": 1, "confidence": 0.9}]
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = AnalysisCache(":memory:", ttl_seconds=60, max_entries=2)
+        self.addCleanup(self.cache.close)
+        self.now = 1000.0
+        clock = mock.patch("analysis_cache.time.time", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_key_covers_text_prompt_version_and_model(self):
+        key = AnalysisCache.make_key({1: "a", 2: "b"}, "1", "model")
+        self.assertEqual(AnalysisCache.make_key({2: "b", 1: "a"}, "1", "model"), key)
+        self.assertNotEqual(AnalysisCache.make_key({1: "a", 2: "c"}, "1", "model"), key)
+        self.assertNotEqual(AnalysisCache.make_key({1: "a", 2: "b"}, "2", "model"), key)
+        self.assertNotEqual(AnalysisCache.make_key({1: "a", 2: "b"}, "1", "other"), key)
+        self.assertNotEqual(AnalysisCache.make_key({1: "ab", 2: ""}, "1", "model"), key)
+
+    def test_round_trip_and_expiry(self):
+        self.cache.put("key", RECORDS)
+        self.now += 60
+        self.assertEqual(self.cache.get("key"), RECORDS)
+        self.now += 1
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put("a", RECORDS)
+        self.now += 1
+        self.cache.put("b", RECORDS)
+        self.now += 1
+        self.assertIsNotNone(self.cache.get("a"))  # Now "b" is the least recently used
+        self.now += 1
+        self.cache.put("c", RECORDS)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+    def test_entries_persist_on_disk(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = str(Path(temp_dir) / "nested" / "cache.sqlite3")
+            first = AnalysisCache(path)
+            first.put("key", RECORDS)
+            first.close()
+            second = AnalysisCache(path)
+            self.assertEqual(second.get("key"), RECORDS)
+            second.close()
+
+
+class AnalyzerCacheTest(unittest.TestCase):
+
+    def analyze(self, analyzer: PDFFieldAnalyzer, page_texts):
+        return asyncio.run(analyzer.analyze_text_async(page_texts, pages_per_chunk=None))
+
+    def test_repeated_analysis_is_served_from_the_cache(self):
+        cache = AnalysisCache(":memory:")
+        self.addCleanup(cache.close)
+        stub = StubLLM(json.dumps(RECORDS))
+        analyzer = PDFFieldAnalyzer(llm=stub, cache=cache, layout_cache=None)
+        first = self.analyze(analyzer, {1: "Name: ____"})
+        self.assertEqual(self.analyze(analyzer, {1: "Name: ____"}), first)
+        self.assertEqual(stub.calls, 1)
+        self.analyze(analyzer, {1: "Name: ____ Date: ____"})
+        self.assertEqual(stub.calls, 2)
+
+        # Another model does not reuse these answers
+        other = StubLLM(json.dumps(RECORDS), model="other-model")
+        self.analyze(PDFFieldAnalyzer(llm=other, cache=cache, layout_cache=None), {1: "Name: ____"})
+        self.assertEqual(other.calls, 1)
+
+    def test_incomplete_answers_are_not_cached(self):
+        cache = AnalysisCache(":memory:")
+        self.addCleanup(cache.close)
+        stub = StubLLM(json.dumps(RECORDS)[:-5])
+        analyzer = PDFFieldAnalyzer(llm=stub, cache=cache, layout_cache=None)
+        with self.assertLogs("pdf_filler", "WARNING"):
+            self.analyze(analyzer, {1: "Name: ____"})
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
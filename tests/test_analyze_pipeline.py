@@ -0,0 +1,85 @@
+"""
+Directory pipeline tests: per-document reports and resuming from the manifest
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests import DOCS  # isort: split
+
+from analyze_pipeline import (MANIFEST_NAME, Manifest, PipelineStats,
+                              analyze_directory)
+from field_analyzer import PDFFieldAnalyzer
+from stub_llm import StubLLM
+
+ANSWER = json.dumps([{"field_name": "name", "field_type": "text", "description": "Name",
+                      "page_number": 1, "confidence": 0.9}])
+
+
+class AnalyzePipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.input = Path(temp_dir.name) / "input"
+        self.output = Path(temp_dir.name) / "output"
+        (self.input / "nested").mkdir(parents=True)
+        shutil.copyfile(DOCS / "License-Transfer-Form_fillable.pdf", self.input / "license.pdf")
+        shutil.copyfile(DOCS / "Sample-Fillable-PDF.pdf", self.input / "nested" / "sample.pdf")
+        (self.input / "broken.pdf").write_bytes(b"not a pdf")
+
+    def run_pipeline(self, stub: StubLLM) -> PipelineStats:
+        analyzer = PDFFieldAnalyzer(llm=stub, use_cache=False, layout_cache=None)
+        with self.assertLogs("pdf_filler", "ERROR") as logs:
+            stats = analyze_directory(str(self.input), str(self.output), analyzer=analyzer,
+                                      extract_workers=1, layout_cache=None)
+        failures = [record.getMessage() for record in logs.records if record.name == "pdf_filler.analyze_pipeline"]
+        self.assertEqual(len(failures), stats.failed)
+        self.assertTrue(any("broken.pdf" in failure for failure in failures), failures)
+        return stats
+
+    def manifest_counts(self):
+        manifest = Manifest(str(self.output / MANIFEST_NAME))
+        try:
+            return manifest.counts()
+        finally:
+            manifest.close()
+
+    def test_reports_mirror_the_input_tree(self):
+        stats = self.run_pipeline(StubLLM(ANSWER))
+        self.assertEqual(stats, PipelineStats(total=3, analyzed=2, failed=1, fields=2))
+        for report in ("license.json", "nested/sample.json"):
+            records = json.loads((self.output / report).read_text(encoding="utf-8"))
+            self.assertEqual([record["field_name"] for record in records], ["name"])
+        self.assertFalse((self.output / "broken.json").exists())
+        self.assertEqual(self.manifest_counts(), {"done": 2, "failed": 1})
+
+    def test_rerun_skips_finished_documents(self):
+        self.run_pipeline(StubLLM(ANSWER))
+        stub = StubLLM(ANSWER)
+        self.assertEqual(self.run_pipeline(stub), PipelineStats(total=3, skipped=2, failed=1))
+        self.assertEqual(stub.calls, 0)
+
+        # A changed document is analyzed again
+        path = self.input / "license.pdf"
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(self.run_pipeline(stub), PipelineStats(total=3, skipped=1, analyzed=1, failed=1, fields=1))
+        self.assertEqual(stub.calls, 1)
+
+    def test_failed_documents_are_retried(self):
+        stats = self.run_pipeline(StubLLM(failure_rate=1.0))
+        self.assertEqual((stats.analyzed, stats.failed), (0, 3))
+        self.assertEqual(self.manifest_counts(), {"failed": 3})
+
+        stats = self.run_pipeline(StubLLM(ANSWER))
+        self.assertEqual((stats.skipped, stats.analyzed, stats.failed), (0, 2, 1))
+        self.assertEqual(self.manifest_counts(), {"done": 2, "failed": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
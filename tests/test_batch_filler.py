@@ -0,0 +1,70 @@
+"""
+Batch filler tests: record parsing, per-record results and output path checks
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests import DOCS  # isort: split
+
+from batch_filler import InvalidRecord, fill_batch, read_records
+from tests.test_round_trip import pypdf2_values
+
+SAMPLE_FORM = DOCS / "Sample-Fillable-PDF.pdf"
+
+
+class BatchFillerTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = Path(temp_dir.name)
+
+    def write(self, name: str, text: str) -> str:
+        path = self.dir / name
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+
+    def test_read_csv_drops_empty_cells(self):
+        records = list(read_records(self.write("records.csv", "Name,Dropdown2\nJane,\n,Choice 2\n")))
+        self.assertEqual(records, [{"Name": "Jane"}, {"Dropdown2": "Choice 2"}])
+
+    def test_read_jsonl_keeps_bad_lines_in_place(self):
+        text = '{"Name": "Jane", "Dropdown2": null, "Age": 7}\n\nnot json\n[1]\n{"Name": "Ann"}\n'
+        records = list(read_records(self.write("records.jsonl", text)))
+        self.assertEqual(records[0], {"Name": "Jane", "Age": "7"})
+        self.assertIsInstance(records[1], InvalidRecord)
+        self.assertEqual(records[1].line, 3)
+        self.assertIsInstance(records[2], InvalidRecord)
+        self.assertEqual(records[3], {"Name": "Ann"})
+
+    def test_results_and_errors(self):
+        records = [
+            {"Name": "Jane", "id": "a"},
+            InvalidRecord(2, "Invalid JSON on line 2"),
+            {"Name": "Ann"},  # No "id" for the output pattern
+            {"Name": "Joe", "id": "a"},  # Same output path as the first record
+            {"Name": "Bob", "id": "b"},
+        ]
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                pattern = str(self.dir / f"w{workers}" / "form_{id}.pdf")
+                results = sorted(fill_batch(SAMPLE_FORM, records, pattern, workers=workers),
+                                 key=lambda result: result.index)
+                self.assertEqual([result.index for result in results], [0, 1, 2, 3, 4])
+                self.assertEqual([result.success for result in results], [True, False, False, False, True])
+                self.assertIn("line 2", results[1].error)
+                self.assertIn("Invalid output pattern", results[2].error)
+                self.assertIn("record 0", results[3].error)
+                self.assertEqual(pypdf2_values(Path(results[0].output_path).read_bytes())["Name"], "Jane")
+                self.assertEqual(pypdf2_values(Path(results[4].output_path).read_bytes())["Name"], "Bob")
+
+    def test_constant_output_pattern_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(fill_batch(SAMPLE_FORM, [{"Name": "Jane"}], str(self.dir / "out.pdf"), workers=1))
+        self.assertFalse((self.dir / "out.pdf").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
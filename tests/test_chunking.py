@@ -0,0 +1,64 @@
+"""
+Chunked analysis tests: page grouping, merging, and the same fields whatever the chunk size
+"""
+
+import asyncio
+import json
+import re
+import unittest
+
+from tests import PROJECT_ROOT  # isort: split
+
+from field_analyzer import CHARS_PER_TOKEN, FieldCandidate, PDFFieldAnalyzer
+from stub_llm import StubLLM
+
+PAGE_TEXTS = {page: f"Form page {page}: name ____ date ____" for page in range(1, 6)}
+
+
+def answer_per_page(prompt: str) -> str:
+    """Answer with a field of each page in the prompt, after one that every chunk reports."""
+    fields = [{"field_name": "signature", "field_type": "signature",
+               "description": "Signature", "page_number": 1, "confidence": 0.8}]
+    for page in sorted(int(number) for number in re.findall(r"Page (\d+):", prompt)):
+        fields.append({"field_name": f"name_{page}", "field_type": "text",
+                       "description": "Name", "page_number": page, "confidence": 0.9})
+    return json.dumps(fields)
+
+
+class ChunkingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.analyzer = PDFFieldAnalyzer(llm=StubLLM(), use_cache=False, layout_cache=None)
+
+    def test_pages_per_chunk(self):
+        chunks = self.analyzer.split_into_chunks(PAGE_TEXTS, pages_per_chunk=2)
+        self.assertEqual([list(chunk) for chunk in chunks], [[1, 2], [3, 4], [5]])
+        self.assertEqual({page: text for chunk in chunks for page, text in chunk.items()}, PAGE_TEXTS)
+
+    def test_token_budget(self):
+        page_texts = {1: "a" * 40 * CHARS_PER_TOKEN, 2: "b" * 40 * CHARS_PER_TOKEN,
+                      3: "c" * 200 * CHARS_PER_TOKEN, 4: "d" * 10 * CHARS_PER_TOKEN}
+        chunks = self.analyzer.split_into_chunks(page_texts, pages_per_chunk=10, token_budget=100)
+        # A page over the budget is never split, it becomes a chunk of its own
+        self.assertEqual([list(chunk) for chunk in chunks], [[1, 2], [3], [4]])
+
+    def test_merge_only_drops_exact_duplicates(self):
+        first = FieldCandidate("name", "text", "Name", 1, 0.9)
+        renamed = FieldCandidate("name", "text", "Name", 2, 0.9)
+        merged = self.analyzer.merge_candidates([first, renamed, first])
+        self.assertEqual(merged, [first, renamed])
+
+    def test_same_fields_for_every_chunk_size(self):
+        results = {}
+        for pages_per_chunk in (None, 1, 2):
+            stub = StubLLM(answer_per_page)
+            analyzer = PDFFieldAnalyzer(llm=stub, use_cache=False, layout_cache=None)
+            results[pages_per_chunk] = asyncio.run(analyzer.analyze_text_async(PAGE_TEXTS, pages_per_chunk))
+            self.assertEqual(stub.calls, {None: 1, 1: 5, 2: 3}[pages_per_chunk])
+        self.assertEqual(len(results[None]), len(PAGE_TEXTS) + 1)
+        self.assertEqual(results[1], results[None])
+        self.assertEqual(results[2], results[None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Fill server tests: routes and error statuses over a real socket, plus one fill through the worker pool
+"""
+
+import asyncio
+import json
+import unittest
+
+from tests import DOCS  # isort: split
+
+import fill_server
+from fill_server import FillServer
+from tests.test_round_trip import pypdf2_values
+
+
+class FillServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FillServer(str(DOCS), workers=1)
+        self.server.start_pool()
+        self.addCleanup(self.server.close)
+        listener = await asyncio.start_server(self.server.handle_connection, "127.0.0.1", 0)
+        self.addAsyncCleanup(listener.wait_closed)
+        self.addCleanup(listener.close)
+        self.port = listener.sockets[0].getsockname()[1]
+
+    async def exchange(self, raw: bytes) -> bytes:
+        """Send raw request bytes and read until the server closes the connection."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            writer.write(raw)
+            await writer.drain()
+            return await asyncio.wait_for(reader.read(), 30)
+        finally:
+            writer.close()
+
+    async def request(self, method: str, target: str, body: bytes = b"",
+                      headers: str = "") -> tuple:
+        """Send one request; returns the status and the response body."""
+        raw = (f"{method} {target} HTTP/1.1\r\nConnection: close\r\n{headers}"
+               f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+        head, _, payload = (await self.exchange(raw)).partition(b"\r\n\r\n")
+        return int(head.split()[1]), payload
+
+    async def test_routes(self):
+        status, payload = await self.request("GET", "/templates")
+        self.assertEqual(status, 200)
+        self.assertIn("Sample-Fillable-PDF", json.loads(payload)["templates"])
+
+        status, payload = await self.request("GET", "/templates/Sample-Fillable-PDF/fields")
+        self.assertEqual(status, 200)
+        self.assertIn("Name", json.dumps(json.loads(payload)))
+
+        status, payload = await self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertIn("latency_ms", json.loads(payload))
+
+    async def test_client_errors(self):
+        cases = [
+            ("GET", "/templates/missing/fields", b"", 404),
+            ("POST", "/templates/missing/fill", b"{}", 404),
+            ("GET", "/nowhere", b"", 404),
+            ("GET", "/templates/Sample-Fillable-PDF/fill", b"", 405),
+            ("POST", "/templates/Sample-Fillable-PDF/fill", b"{not json", 400),
+            ("POST", "/templates/Sample-Fillable-PDF/fill", b"[1, 2]", 400),
+        ]
+        for method, target, body, expected in cases:
+            with self.subTest(method=method, target=target, body=body):
+                status, payload = await self.request(method, target, body)
+                self.assertEqual(status, expected)
+                self.assertIn("error", json.loads(payload))
+
+    async def test_malformed_framing(self):
+        target = "POST /templates/Sample-Fillable-PDF/fill HTTP/1.1\r\n"
+        cases = [
+            (f"{target}Content-Length: {fill_server.MAX_BODY_BYTES + 1}\r\n\r\n", 413),
+            (f"{target}Content-Length: -1\r\n\r\n{{}}", 400),
+            (f"{target}Transfer-Encoding: chunked\r\n\r\n2\r\n{{}}\r\n0\r\n\r\n", 411),
+            (f"{target}Transfer-Encoding: chunked\r\nContent-Length: 2\r\n\r\n{{}}", 400),
+            ("nonsense\r\n\r\n", 400),
+        ]
+        for raw, expected in cases:
+            with self.subTest(raw=raw[:60]):
+                response = await self.exchange(raw.encode("latin-1"))
+                self.assertTrue(response.startswith(f"HTTP/1.1 {expected} ".encode()), response[:40])
+                self.assertIn(b"Connection: close", response)
+
+    async def test_full_queue_is_rejected(self):
+        self.server.max_queue = 0
+        status, _ = await self.request("POST", "/templates/Sample-Fillable-PDF/fill", b"{}")
+        self.assertEqual(status, 503)
+        self.assertEqual(self.server.metrics.rejected, 1)
+
+    async def test_fill_on_a_kept_alive_connection(self):
+        body = json.dumps({"Name": "Jane", "Dropdown2": "Choice 2"}).encode()
+        fill = (f"POST /templates/Sample-Fillable-PDF/fill HTTP/1.1\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        closing = b"GET /templates HTTP/1.1\r\nConnection: close\r\n\r\n"
+        response = await self.exchange(fill + closing)
+        head, _, rest = response.partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 "))
+        self.assertIn(b"Connection: keep-alive", head)
+        length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+        values = pypdf2_values(rest[:length])
+        self.assertEqual(values["Name"], "Jane")
+        self.assertEqual(values["Dropdown2"], "Choice 2")
+        self.assertTrue(rest[length:].startswith(b"HTTP/1.1 200 "))
+        self.assertEqual(self.server.metrics.fills, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+FormSchema tests: extraction from the docs/ forms, the JSON round trip and lazy field iteration
+"""
+
+import unittest
+from io import BytesIO
+
+import fitz
+from PyPDF2 import PdfReader
+
+from tests import DOCS  # isort: split
+
+from form_schema import FieldSpec, FormSchema, iter_field_specs
+from pdf_reader import PDFReader
+
+LICENSE_FORM = DOCS / "License-Transfer-Form_fillable.pdf"
+SAMPLE_FORM = DOCS / "Sample-Fillable-PDF.pdf"
+
+
+def one_field_per_page(pages: int) -> bytes:
+    """A generated form with a single text field on each page."""
+    with fitz.open() as doc:
+        for index in range(pages):
+            widget = fitz.Widget()
+            widget.field_name = f"field_{index}"
+            widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+            widget.field_value = f"value {index}"
+            widget.rect = fitz.Rect(50, 50, 200, 70)
+            doc.new_page().add_widget(widget)
+        return doc.tobytes()
+
+
+class FormSchemaTest(unittest.TestCase):
+
+    def test_extraction_matches_pypdf2(self):
+        for form in (LICENSE_FORM, SAMPLE_FORM):
+            with self.subTest(form=form.name):
+                reader = PdfReader(str(form))
+                schema = FormSchema.from_reader(reader)
+                self.assertEqual(sorted(schema.names()), sorted(reader.get_fields()))
+                self.assertEqual(schema.page_count, len(reader.pages))
+                for spec in schema:
+                    self.assertIn(spec.type, ("/Tx", "/Btn", "/Ch", "/Sig"))
+                    self.assertTrue(1 <= spec.page <= schema.page_count, spec)
+
+    def test_choice_options_and_lookup(self):
+        schema = FormSchema.from_reader(PdfReader(str(SAMPLE_FORM)))
+        dropdown = schema.get("Dropdown2")
+        self.assertEqual(dropdown.type, "/Ch")
+        self.assertEqual(dropdown.options, ("Choice 1", "Choice 2", "Choice 3", "Choice 4"))
+        self.assertIn("Name", schema)
+        self.assertNotIn("Missing", schema)
+        self.assertIsNone(schema.get("Missing"))
+
+    def test_json_round_trip(self):
+        for form in (LICENSE_FORM, SAMPLE_FORM):
+            with self.subTest(form=form.name):
+                schema = FormSchema.from_reader(PdfReader(str(form)))
+                restored = FormSchema.from_json(schema.to_json())
+                self.assertEqual(restored, schema)
+                self.assertEqual(hash(restored), hash(schema))
+
+    def test_from_dict_defaults(self):
+        spec = FieldSpec.from_dict({"name": "Name"})
+        self.assertEqual(spec, FieldSpec(name="Name", type="Unknown"))
+        self.assertEqual(FormSchema.from_dict({}), FormSchema(fields=()))
+
+    def test_released_reader_keeps_the_schema(self):
+        reader = PDFReader(SAMPLE_FORM)
+        self.assertTrue(reader.load_pdf(keep_objects=False))
+        self.assertIsNone(reader.reader)
+        self.assertEqual(reader.schema, FormSchema.from_reader(PdfReader(str(SAMPLE_FORM))))
+        self.assertEqual([spec.name for spec in reader.iter_fields()], reader.schema.names())
+
+
+class LazyIterationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = one_field_per_page(40)
+
+    def test_first_field_reads_only_its_own_objects(self):
+        reader = PdfReader(BytesIO(self.data))
+        specs = iter_field_specs(reader)
+        first = next(specs)
+        self.assertEqual((first.name, first.page, first.value), ("field_0", 1, "value 0"))
+        parsed_for_first = len(reader.resolved_objects)
+        rest = list(specs)
+        self.assertLess(parsed_for_first, len(reader.resolved_objects) // 10)
+        self.assertEqual([spec.page for spec in rest], list(range(2, 41)))
+
+    def test_release_keeps_the_reader_cache_flat(self):
+        reader = PdfReader(BytesIO(self.data))
+        specs = list(iter_field_specs(reader, release=True))
+        self.assertEqual([spec.name for spec in specs], [f"field_{index}" for index in range(40)])
+        self.assertLess(len(reader.resolved_objects), 5)
+        # Released objects are parsed again on demand
+        self.assertEqual(list(iter_field_specs(reader)), specs)
+
+    def test_reader_iterates_before_building_the_schema(self):
+        reader = PDFReader(self.data)
+        self.assertTrue(reader.load_pdf())
+        self.assertEqual(next(reader.iter_fields()).name, "field_0")
+        self.assertIsNone(reader._schema)
+        self.assertEqual(len(reader.schema), 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
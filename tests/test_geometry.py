@@ -0,0 +1,163 @@
+"""
+Geometry tests: the vectorized helpers against plain-Python reference implementations on random layouts
+"""
+
+import math
+import unittest
+from typing import List, Tuple
+
+import numpy as np
+
+from tests import PROJECT_ROOT  # isort: split
+
+from field_placement import FieldPosition
+from geometry import (RECT_DTYPE, SPAN_DTYPE, FieldValidator, PageGeometry,
+                      clamp_to_page, contains_text, nearest_labels,
+                      overlapping_pairs, rect_distances, underlined,
+                      validate_positions)
+from layout_extraction import PageLayout, TextSpan
+
+
+def random_rects(rng: np.random.Generator, count: int, pages: int = 3, dtype=RECT_DTYPE,
+                 max_size: float = 80.0) -> np.ndarray:
+    rects = np.empty(count, dtype=dtype)
+    rects["page"] = rng.integers(1, pages + 1, count)
+    rects["x0"] = rng.uniform(-20, 600, count)
+    rects["y0"] = rng.uniform(-20, 780, count)
+    rects["x1"] = rects["x0"] + rng.uniform(0, max_size, count)
+    rects["y1"] = rects["y0"] + rng.uniform(0, max_size / 4, count)
+    if "blank" in dtype.names:
+        rects["blank"] = rng.random(count) < 0.3
+    return rects
+
+
+def gap(a, b) -> float:
+    """Scalar gap between two rectangles, infinite between pages."""
+    if a["page"] != b["page"]:
+        return math.inf
+    dx = max(0.0, b["x0"] - a["x1"], a["x0"] - b["x1"])
+    dy = max(0.0, b["y0"] - a["y1"], a["y0"] - b["y1"])
+    return math.hypot(dx, dy)
+
+
+def overlap_area(a, b) -> float:
+    width = min(a["x1"], b["x1"]) - max(a["x0"], b["x0"])
+    height = min(a["y1"], b["y1"]) - max(a["y0"], b["y0"])
+    return width * height if width > 0 and height > 0 else 0.0
+
+
+class VectorizedHelpersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(20251017)
+
+    def test_rect_distances(self):
+        targets, others = random_rects(self.rng, 40), random_rects(self.rng, 60)
+        expected = [[gap(target, other) for other in others] for target in targets]
+        np.testing.assert_allclose(rect_distances(targets, others), expected)
+
+    def test_nearest_labels(self):
+        # More targets than one comparison chunk, so the banding is exercised
+        targets = random_rects(self.rng, 700, pages=2)
+        labels = random_rects(self.rng, 60, pages=2, dtype=SPAN_DTYPE)
+        for max_distance in (math.inf, 40.0, 0.0):
+            with self.subTest(max_distance=max_distance):
+                indices, distances = nearest_labels(targets, labels, max_distance)
+                for target, index, distance in zip(targets, indices, distances):
+                    gaps = [gap(target, label) for label in labels]
+                    best = min(gaps)
+                    if best <= max_distance:
+                        self.assertAlmostEqual(distance, best)
+                        self.assertAlmostEqual(gaps[index], best)
+                    else:
+                        self.assertEqual((index, distance), (-1, math.inf))
+
+    def test_nearest_labels_without_labels(self):
+        indices, distances = nearest_labels(random_rects(self.rng, 5), np.empty(0, dtype=RECT_DTYPE))
+        self.assertEqual(indices.tolist(), [-1] * 5)
+        self.assertTrue(np.isinf(distances).all())
+
+    def test_overlapping_pairs(self):
+        rects = random_rects(self.rng, 250, max_size=120.0)
+        for min_area in (0.0, 50.0):
+            with self.subTest(min_area=min_area):
+                expected = [[i, j] for i in range(len(rects)) for j in range(i + 1, len(rects))
+                            if rects[i]["page"] == rects[j]["page"] and overlap_area(rects[i], rects[j]) > min_area]
+                self.assertEqual(overlapping_pairs(rects, min_area).tolist(), expected)
+        self.assertEqual(overlapping_pairs(np.empty(0, dtype=RECT_DTYPE)).shape, (0, 2))
+
+    def test_contains_text_and_underlined(self):
+        boxes = random_rects(self.rng, 80, pages=1, max_size=200.0)
+        spans = random_rects(self.rng, 120, pages=1, dtype=SPAN_DTYPE, max_size=30.0)
+        expected = [any(span["x0"] >= box["x0"] - 1 and span["x1"] <= box["x1"] + 1
+                        and span["y0"] >= box["y0"] - 1 and span["y1"] <= box["y1"] + 1 for span in spans)
+                    for box in boxes]
+        self.assertEqual(contains_text(boxes, spans).tolist(), expected)
+        self.assertTrue(any(expected))
+
+        labels = spans[~spans["blank"]]
+        rules = np.concatenate([boxes, np.array([(1, label["x0"], label["y1"] + 1, label["x1"], label["y1"] + 1)
+                                                 for label in labels[:10]], dtype=RECT_DTYPE)])
+        expected = [any(label["x0"] - 2 <= rule["x0"] and rule["x1"] <= label["x1"] + 2
+                        and -4 <= rule["y0"] - label["y1"] <= 3 for label in labels) for rule in rules]
+        self.assertEqual(underlined(rules, spans).tolist(), expected)
+        self.assertTrue(all(expected[-10:]))
+
+    def test_clamp_to_page(self):
+        rects = random_rects(self.rng, 200, max_size=700.0)
+        clamped = clamp_to_page(rects, 612.0, 792.0)
+        for rect, result in zip(rects, clamped):
+            for low, high, size in (("x0", "x1", 612.0), ("y0", "y1", 792.0)):
+                extent = min(rect[high] - rect[low], size)
+                start = min(max(rect[low], 0.0), size - extent)
+                self.assertAlmostEqual(result[low], start)
+                self.assertAlmostEqual(result[high], start + extent)
+
+
+def layout(spans: List[Tuple[float, float, float, float, str]]) -> PageLayout:
+    return PageLayout(1, 612.0, 792.0, " ".join(span[4] for span in spans), [TextSpan(*span) for span in spans])
+
+
+def position(name: str, x: float, y: float, width: float = 100.0, page: int = 1) -> FieldPosition:
+    return FieldPosition(name, "text", x, y, width, 14.0, page, name)
+
+
+class PageGeometryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.layout = layout([(50, 100, 100, 112, "Name:"), (104, 100, 250, 112, "__________"),
+                              (300, 100, 340, 112, "Date:"), (50, 200, 120, 212, "Signature")])
+        self.geometry = PageGeometry.from_layout(self.layout)
+
+    def test_row_queries(self):
+        self.assertEqual(self.geometry.on_row(106).tolist(), [True, True, True, False])
+        self.assertTrue(self.geometry.text_between(250, 350, 106))
+        self.assertFalse(self.geometry.text_between(100, 260, 106))  # Only the blank lies between
+        self.assertEqual(self.geometry.next_text_x(self.layout.spans[0], 106), 104)
+        self.assertEqual(self.geometry.next_text_x(self.layout.spans[2], 106), 612 - 36)
+
+    def test_validate_positions(self):
+        positions = [position("a", 50, 120), position("b", 100, 125), position("c", 580, 700)]
+        result, pairs = validate_positions(positions, {1: (612.0, 792.0)})
+        self.assertEqual(result[:2], positions[:2])
+        self.assertEqual((result[2].x, result[2].width), (512.0, 100.0))
+        self.assertEqual(pairs.tolist(), [[0, 1]])
+
+    def test_field_validator(self):
+        validator = FieldValidator([self.layout])
+        self.assertEqual(validator.check(position("name", 104, 100))[1], [])
+        _, issues = validator.check(position("overlap", 150, 105))
+        self.assertEqual(issues, ["overlaps name"])
+        moved, issues = validator.check(position("far", 600, 700))
+        self.assertEqual(moved.x, 512.0)
+        self.assertEqual(issues, ["moved inside the page", "no text within 72pt"])
+        self.assertEqual(validator.check(position("lost", 10, 10, page=9))[1], ["page 9 does not exist"])
+        # Enough fields to grow the validator's buffer
+        for index in range(100):
+            validator.check(position(f"row_{index}", 50, 300 + index * 4, width=20))
+        _, issues = validator.check(position("wide", 40, 300, 30))
+        self.assertEqual(issues[-1], "overlaps row_0, row_1, row_2 and 1 more")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+JSONArrayParser tests, feeding the same text split at every possible chunk boundary
+"""
+
+import json
+import unittest
+from typing import List, Tuple
+
+from tests import PROJECT_ROOT  # isort: split
+
+from json_stream import JSONArrayParser, iter_json_array
+
+ELEMENTS = [
+    {"field_name": "name", "description": "Say \"hi\" [x] {y}, then \\ stop", "page_number": 1},
+    {"nested": [[1, 2], {"a": []}], "empty": {}},
+    "a string with ] and , inside",
+    -12.5e3,
+    True,
+    None,
+    [],
+]
+
+
+def feed_chunks(chunks: List[str]) -> Tuple[List, JSONArrayParser]:
+    """Feed chunks to a fresh parser; returns the items it yielded and the parser."""
+    parser = JSONArrayParser()
+    return list(iter_json_array(chunks, parser)), parser
+
+
+def splits(text: str):
+    """Every way of cutting text into two chunks, plus one character per chunk."""
+    for index in range(len(text) + 1):
+        yield [text[:index], text[index:]]
+    yield list(text)
+
+
+class JSONArrayParserTest(unittest.TestCase):
+
+    def assert_every_split(self, text: str, expected: List, skipped: int = 0, finished: bool = True):
+        for chunks in splits(text):
+            items, parser = feed_chunks(chunks)
+            self.assertEqual(items, expected, chunks)
+            self.assertEqual(parser.skipped, skipped, chunks)
+            self.assertEqual(parser.finished, finished, chunks)
+
+    def test_chunk_boundaries(self):
+        self.assert_every_split(json.dumps(ELEMENTS), ELEMENTS)
+        self.assert_every_split(json.dumps(ELEMENTS, indent=2), ELEMENTS)
+
+    def test_preamble_and_code_fence(self):
+        text = "Here are the fields:\n```json\n" + json.dumps(ELEMENTS[:2]) + "\n```\nDone [ignored]"
+        self.assert_every_split(text, ELEMENTS[:2])
+
+    def test_empty_array(self):
+        self.assert_every_split("[ ]", [])
+
+    def test_malformed_element_is_skipped(self):
+        text = '[{"a": 1}, {"b": tru}, {"c": 3}, nope, 4]'
+        with self.assertLogs("pdf_filler.json_stream", "WARNING"):
+            self.assert_every_split(text, [{"a": 1}, {"c": 3}, 4], skipped=2)
+
+    def test_truncated_response_keeps_completed_elements(self):
+        text = '[{"a": 1}, {"b": [2, 3]}, {"c": "unterminated'
+        with self.assertLogs("pdf_filler.json_stream", "WARNING"):
+            for chunks in splits(text):
+                items, parser = feed_chunks(chunks)
+                self.assertEqual(items, [{"a": 1}, {"b": [2, 3]}])
+                self.assertTrue(parser.truncated)
+                self.assertEqual(parser.skipped, 1)
+
+    def test_no_array(self):
+        items, parser = feed_chunks(["no JSON ", "here"])
+        self.assertEqual(items, [])
+        self.assertFalse(parser.started)
+        self.assertFalse(parser.truncated)
+
+    def test_bundled_analysis_report(self):
+        text = (PROJECT_ROOT / "field_analysis_report.json").read_text(encoding="utf-8")
+        expected = json.loads(text)
+        for size in (1, 7, 64, 4096):
+            items, _ = feed_chunks([text[start:start + size] for start in range(0, len(text), size)])
+            self.assertEqual(items, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Layout prompt tests: row merging, context filtering and the token budget
+"""
+
+import math
+import unittest
+
+from tests import DOCS  # isort: split
+
+from form_generator import PDFFormGenerator
+from layout_prompt import CHARS_PER_TOKEN, HEADER, encode_layout, merge_lines
+
+PAGE_DATA = {
+    1: [
+        {"text": "Applicant", "bbox": [50, 100, 100, 112]},
+        {"text": "name:", "bbox": [104, 100, 130, 112]},
+        {"text": "__________", "bbox": [134, 100, 250, 112]},
+        {"text": "Date   of birth", "bbox": [50, 130, 120, 142]},
+        {"text": "Unrelated footer text", "bbox": [50, 700, 200, 712]},
+    ],
+    2: [
+        {"text": "Signature", "bbox": [50, 400, 110, 412]},
+        {"text": "   ", "bbox": [120, 400, 130, 412]},
+    ],
+}
+
+FIELDS = [
+    {"field_name": "applicant_name", "description": "Applicant name", "page_number": 1},
+    {"field_name": "signature", "description": "Signature", "page_number": 2},
+]
+
+
+def tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class LayoutPromptTest(unittest.TestCase):
+
+    def test_merge_lines(self):
+        rows = merge_lines(PAGE_DATA)
+        self.assertEqual([(row.page_number, row.text) for row in rows], [
+            (1, "Applicant name:"), (1, "___"), (1, "Date of birth"),
+            (1, "Unrelated footer text"), (2, "Signature"),
+        ])
+        self.assertTrue(rows[1].is_blank)
+        self.assertEqual((rows[0].x0, rows[0].x1), (50, 130))
+
+    def test_context_keeps_rows_near_matching_labels(self):
+        encoded = encode_layout(PAGE_DATA, FIELDS)
+        self.assertEqual(encoded.splitlines(), [
+            HEADER, "Page 1", "50 100 80 12 Applicant name:", "134 100 116 12 ___",
+            "50 130 70 12 Date of birth", "Page 2", "50 400 60 12 Signature",
+        ])
+        self.assertIn("Unrelated footer text", encode_layout(PAGE_DATA, FIELDS, context=None))
+
+    def test_unmatched_field_keeps_its_whole_page(self):
+        encoded = encode_layout(PAGE_DATA, [{"field_name": "zip", "description": "Postcode", "page_number": 1}])
+        self.assertIn("Unrelated footer text", encoded)
+        self.assertNotIn("Signature", encoded)
+
+    def test_budget_drops_the_furthest_rows_first(self):
+        full = encode_layout(PAGE_DATA, FIELDS)
+        self.assertEqual(encode_layout(PAGE_DATA, FIELDS, token_budget=tokens(full)), full)
+        tight = encode_layout(PAGE_DATA, FIELDS, token_budget=tokens(full) - 1)
+        self.assertNotIn("Date of birth", tight)
+        self.assertIn("Applicant name:", tight)
+        self.assertIn("Signature", tight)
+        self.assertEqual(encode_layout(PAGE_DATA, FIELDS, token_budget=0), HEADER)
+
+    def test_budget_is_respected_on_a_real_form(self):
+        page_data = PDFFormGenerator(layout_cache=None).extract_text_with_positions(
+            str(DOCS / "License-Transfer-Form_fillable.pdf"))
+        full = encode_layout(page_data, [], context=None)
+        full_lines = set(full.splitlines())
+        self.assertGreater(tokens(full), 200)
+        for budget in range(5, tokens(full) + 20, 37):
+            with self.subTest(budget=budget):
+                encoded = encode_layout(page_data, [], token_budget=budget, context=None)
+                self.assertLessEqual(tokens(encoded), max(budget, tokens(HEADER)))
+                self.assertTrue(encoded.startswith(HEADER))
+                self.assertLessEqual(set(encoded.splitlines()), full_lines)
+                lines = encoded.splitlines()
+                for previous, line in zip(lines, lines[1:]):
+                    if line.startswith("Page "):
+                        self.assertFalse(previous.startswith("Page "), "empty page heading")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+LLM gateway tests: token bucket, retries, timeouts, coalescing and streaming against StubLLM
+"""
+
+import asyncio
+import unittest
+from typing import List
+from unittest import mock
+
+from tests import PROJECT_ROOT  # isort: split
+
+from llm_gateway import ChatModelBackend, LLMGateway, TokenBucket
+from stub_llm import StubLLM
+
+
+class FakeClock:
+    """Monotonic clock that only moves when a waiter sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def acquire_all(self, bucket: TokenBucket, clock: FakeClock, count: int) -> List[float]:
+        async def run():
+            return [await bucket.acquire() for _ in range(count)]
+
+        with mock.patch("llm_gateway.asyncio.sleep", clock.sleep):
+            return asyncio.run(run())
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+        self.assertEqual(self.acquire_all(bucket, clock, 5), [0.0, 0.0, 0.0, 0.5, 0.5])
+        self.assertEqual(clock.now, 1.0)
+
+    def test_idle_time_refills_up_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, clock=clock)
+        self.assertEqual(bucket.capacity, 2)
+        self.acquire_all(bucket, clock, 2)
+        clock.now += 60
+        self.assertEqual(self.acquire_all(bucket, clock, 3), [0.0, 0.0, 0.5])
+
+    def test_zero_rate_disables_limiting(self):
+        clock = FakeClock()
+        self.assertEqual(self.acquire_all(TokenBucket(rate=0, clock=clock), clock, 10), [0.0] * 10)
+        self.assertEqual(clock.sleeps, [])
+
+
+class LLMGatewayTest(unittest.TestCase):
+
+    def gateway(self, stub: StubLLM, **options) -> LLMGateway:
+        options = {"requests_per_second": 0, "backoff_base": 0, **options}
+        gateway = LLMGateway(ChatModelBackend(stub), **options)
+        self.addCleanup(gateway.close)
+        return gateway
+
+    def test_retries_until_an_attempt_succeeds(self):
+        def flaky(prompt: str) -> str:
+            if stub.calls <= 2:
+                raise ConnectionError("unavailable")
+            return f"answer to {prompt}"
+
+        stub = StubLLM(flaky)
+        with self.assertLogs("pdf_filler.llm_gateway", "WARNING") as logs:
+            self.assertEqual(self.gateway(stub, max_retries=2).invoke("question").content, "answer to question")
+        self.assertEqual(stub.calls, 3)
+        self.assertEqual(len(logs.output), 2)
+
+    def test_gives_up_after_the_last_retry(self):
+        stub = StubLLM(failure_rate=1.0)
+        with self.assertLogs("pdf_filler.llm_gateway", "WARNING"):
+            with self.assertRaises(ConnectionError):
+                self.gateway(stub, max_retries=1).invoke("question")
+        self.assertEqual(stub.calls, 2)
+
+    def test_slow_attempt_times_out(self):
+        stub = StubLLM("late", latency=5)
+        with self.assertRaises(asyncio.TimeoutError):
+            self.gateway(stub, timeout=0.05, max_retries=0).invoke("question")
+
+    def test_identical_prompts_in_flight_are_coalesced(self):
+        stub = StubLLM(lambda prompt: prompt.upper(), latency=0.2)
+        gateway = self.gateway(stub)
+
+        async def run():
+            prompts = ["same"] * 5 + ["other"]
+            return await asyncio.gather(*[gateway.ainvoke(prompt) for prompt in prompts])
+
+        responses = asyncio.run(run())
+        self.assertEqual([response.content for response in responses], ["SAME"] * 5 + ["OTHER"])
+        self.assertEqual(stub.calls, 2)
+        # Once answered, the same prompt is sent again rather than served from memory
+        self.assertEqual(gateway.invoke("same").content, "SAME")
+        self.assertEqual(stub.calls, 3)
+
+    def test_concurrency_limit(self):
+        stub = StubLLM(latency=0.05)
+        active = peak = 0
+        generate = ChatModelBackend.generate
+
+        async def counting(backend, prompt):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            try:
+                return await generate(backend, prompt)
+            finally:
+                active -= 1
+
+        gateway = self.gateway(stub, max_concurrency=2)
+        with mock.patch.object(ChatModelBackend, "generate", counting):
+            async def run():
+                await asyncio.gather(*[gateway.ainvoke(f"prompt {index}") for index in range(6)])
+
+            asyncio.run(run())
+        self.assertEqual(stub.calls, 6)
+        self.assertEqual(peak, 2)
+
+    def test_stream(self):
+        stub = StubLLM("streamed answer", stream_chunks=4)
+        gateway = self.gateway(stub)
+        chunks = [chunk.content for chunk in gateway.stream("question")]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), "streamed answer")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Round-trip tests: fill the bundled docs/ forms, then reopen the output with PyPDF2 and PyMuPDF
+"""
+
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict
+
+import fitz
+from PyPDF2 import PdfReader
+
+from tests import DOCS  # isort: split
+
+from merged_output import write_merged
+from pdf_writer import PDFWriter, fill_pdf_form, fill_pdf_form_to_bytes
+
+LICENSE_FORM = DOCS / "License-Transfer-Form_fillable.pdf"
+SAMPLE_FORM = DOCS / "Sample-Fillable-PDF.pdf"
+
+LICENSE_VALUES = {
+    "part1_license_number": "AB-12345",
+    "part1_licensee_first_name": "Jane",
+    "part2_licensee_city": "Springfield",
+}
+
+
+def pypdf2_values(data: bytes) -> Dict[str, Any]:
+    """Fully qualified field name -> /V, walking the AcroForm tree directly."""
+    root = PdfReader(BytesIO(data)).trailer["/Root"]
+    if "/AcroForm" not in root:
+        return {}
+    values = {}
+    stack = [(reference, "") for reference in root["/AcroForm"].get("/Fields", [])]
+    while stack:
+        reference, parent = stack.pop()
+        field = reference.get_object()
+        name = f"{parent}.{field['/T']}" if parent and "/T" in field else str(field.get("/T", parent))
+        kids = [kid for kid in field.get("/Kids", []) if "/T" in kid.get_object()]
+        if kids:
+            stack.extend((kid, name) for kid in kids)
+        else:
+            values[name] = field.get("/V")
+    return values
+
+
+def fitz_values(data: bytes) -> Dict[str, str]:
+    """Field name -> value as PyMuPDF reads the widgets."""
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return {widget.field_name: widget.field_value for page in doc for widget in page.widgets()}
+
+
+class FillRoundTripTest(unittest.TestCase):
+
+    def test_full_rewrite(self):
+        data = fill_pdf_form_to_bytes(LICENSE_FORM, LICENSE_VALUES)
+        self.assertIsNotNone(data)
+        values = pypdf2_values(data)
+        widgets = fitz_values(data)
+        for name, value in LICENSE_VALUES.items():
+            self.assertEqual(values[name], value)
+            self.assertEqual(widgets[name], value)
+
+    def test_incremental_update(self):
+        original = LICENSE_FORM.read_bytes()
+        data = fill_pdf_form_to_bytes(LICENSE_FORM, LICENSE_VALUES, incremental=True)
+        self.assertTrue(data.startswith(original))
+        values = pypdf2_values(data)
+        widgets = fitz_values(data)
+        for name, value in LICENSE_VALUES.items():
+            self.assertEqual(values[name], value)
+            self.assertEqual(widgets[name], value)
+
+    def test_incremental_update_without_changes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for field_values in ({"nonexistent": "A"}, {}):
+                output_path = Path(temp_dir) / "out.pdf"
+                self.assertTrue(fill_pdf_form(LICENSE_FORM, field_values, output_path, incremental=True))
+                data = output_path.read_bytes()
+                self.assertEqual(data, LICENSE_FORM.read_bytes())
+                self.assertEqual(len(pypdf2_values(data)), len(pypdf2_values(LICENSE_FORM.read_bytes())))
+
+    def test_buttons_and_choices(self):
+        field_values = {"Name": "Jane", "Option 2": "Yes", "Option 3": "false", "Dropdown2": "Choice 2"}
+        for incremental in (False, True):
+            data = fill_pdf_form_to_bytes(SAMPLE_FORM, field_values, incremental=incremental)
+            values = pypdf2_values(data)
+            self.assertEqual(values["Name"], "Jane")
+            self.assertEqual(values["Option 2"], "/On")
+            self.assertEqual(values["Option 3"], "/Off")
+            self.assertEqual(values["Dropdown2"], "Choice 2")
+            widgets = fitz_values(data)
+            self.assertEqual(widgets["Option 2"], "On")
+            self.assertEqual(widgets["Dropdown2"], "Choice 2")
+
+    def test_flattened(self):
+        data = fill_pdf_form_to_bytes(LICENSE_FORM, LICENSE_VALUES, flatten=True)
+        self.assertEqual(pypdf2_values(data), {})
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            self.assertEqual([widget for page in doc for widget in page.widgets()], [])
+            text = "".join(page.get_text() for page in doc)
+        for value in LICENSE_VALUES.values():
+            self.assertIn(value, text)
+
+    def test_flatten_refuses_undrawn_fields(self):
+        writer = PDFWriter(LICENSE_FORM)
+        self.assertTrue(writer.load_pdf())
+        self.assertTrue(writer.fill_multiple_fields({"part1_licensee_first_name": "Łukasz"}))
+        self.assertEqual(writer.undrawn_fields, {"part1_licensee_first_name"})
+        with self.assertLogs("pdf_filler.pdf_writer", "ERROR") as logs:
+            self.assertFalse(writer.flatten())
+        self.assertIn("part1_licensee_first_name", logs.output[0])
+
+    def test_accents_need_a_winansi_font(self):
+        # The License form's /Helv is WinAnsi; the Sample form's remaps codes 128-159
+        for form, name, undrawn in ((LICENSE_FORM, "part1_licensee_first_name", set()),
+                                    (SAMPLE_FORM, "Name", {"Name"})):
+            writer = PDFWriter(form)
+            self.assertTrue(writer.load_pdf())
+            self.assertTrue(writer.fill_multiple_fields({name: "José"}))
+            self.assertEqual(writer.undrawn_fields, undrawn)
+            self.assertEqual(pypdf2_values(writer.to_bytes())[name], "José")
+
+    def test_merged(self):
+        records = [{"part1_license_number": f"L-{index}", "part1_licensee_first_name": f"Name {index}"}
+                   for index in range(3)]
+        output = BytesIO()
+        stats = write_merged(LICENSE_FORM, records, output)
+        data = output.getvalue()
+        self.assertEqual(stats.copies, 3)
+        values = pypdf2_values(data)
+        widgets = fitz_values(data)
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            self.assertEqual(len(doc), 3 * len(PdfReader(LICENSE_FORM).pages))
+        for index, record in enumerate(records):
+            for name, value in record.items():
+                self.assertEqual(values[f"copy_{index}.{name}"], value)
+                self.assertEqual(widgets[f"copy_{index}.{name}"], value)
+        # Each filled widget is drawn with its own copy's value, without asking the viewer to redraw
+        reader = PdfReader(BytesIO(data))
+        self.assertNotIn("/NeedAppearances", reader.trailer["/Root"]["/AcroForm"])
+        drawn = {}
+        for page in reader.pages:
+            for annotation in page.get("/Annots", []):
+                widget = annotation.get_object()
+                if "/T" in widget and "/Parent" in widget and "/V" in widget:
+                    name = f"{widget['/Parent']['/T']}.{widget['/T']}"
+                    drawn[name] = widget["/AP"]["/N"].get_data()
+        for index, record in enumerate(records):
+            for name, value in record.items():
+                self.assertIn(f"({value})".encode(), drawn[f"copy_{index}.{name}"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+SchemaIndex tests: incremental updates of a template directory and field lookups
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests import DOCS  # isort: split
+
+from schema_index import IndexStats, SchemaIndex
+
+LICENSE_FORM = DOCS / "License-Transfer-Form_fillable.pdf"
+SAMPLE_FORM = DOCS / "Sample-Fillable-PDF.pdf"
+
+
+class SchemaIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = Path(temp_dir.name).resolve()
+        shutil.copyfile(LICENSE_FORM, self.dir / "license.pdf")
+        (self.dir / "nested").mkdir()
+        shutil.copyfile(SAMPLE_FORM, self.dir / "nested" / "sample.pdf")
+        self.index = SchemaIndex(":memory:")
+        self.addCleanup(self.index.close)
+        self.assertEqual(self.index.update(str(self.dir)), IndexStats(added=2))
+
+    def touch(self, path: Path) -> None:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_templates_and_schemas(self):
+        records = {Path(record.path).name: record for record in self.index.templates()}
+        self.assertEqual(sorted(records), ["license.pdf", "sample.pdf"])
+        schema = self.index.schema(str(self.dir / "nested" / "sample.pdf"))
+        self.assertEqual(records["sample.pdf"].field_count, len(schema))
+        self.assertIn("Dropdown2", schema)
+        self.assertIsNone(self.index.schema(str(self.dir / "missing.pdf")))
+
+    def test_find_fields(self):
+        sample = str(self.dir / "nested" / "sample.pdf")
+        matches = self.index.find_fields("name")
+        self.assertEqual([(match.path, match.name, match.type) for match in matches], [(sample, "Name", "/Tx")])
+        self.assertEqual(self.index.find_fields("Name", field_type="/Btn"), [])
+        self.assertEqual(self.index.templates_with_field("Option _", pattern=True), [sample])
+        self.assertEqual(self.index.templates_with_field("part1\\_%", pattern=True),
+                         [str(self.dir / "license.pdf")])
+        self.assertEqual(self.index.find_fields("part1_%"), [])
+
+    def test_unchanged_touched_changed_and_removed(self):
+        self.assertEqual(self.index.update(str(self.dir)), IndexStats(unchanged=2))
+
+        self.touch(self.dir / "license.pdf")
+        self.assertEqual(self.index.update(str(self.dir)), IndexStats(unchanged=2))
+
+        shutil.copyfile(SAMPLE_FORM, self.dir / "license.pdf")
+        self.touch(self.dir / "license.pdf")
+        self.assertEqual(self.index.update(str(self.dir)), IndexStats(updated=1, unchanged=1))
+        self.assertEqual(len(self.index.templates_with_field("Name")), 2)
+        self.assertEqual(self.index.templates_with_field("part1\\_%", pattern=True), [])
+
+        (self.dir / "nested" / "sample.pdf").unlink()
+        self.assertEqual(self.index.update(str(self.dir)), IndexStats(unchanged=1, removed=1))
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.templates_with_field("Name"), [str(self.dir / "license.pdf")])
+
+    def test_unreadable_file_is_counted_as_failed(self):
+        (self.dir / "broken.pdf").write_bytes(b"not a pdf")
+        with self.assertLogs("pdf_filler.schema_index", "ERROR"):
+            self.assertEqual(self.index.update(str(self.dir)), IndexStats(unchanged=2, failed=1))
+
+    def test_other_directories_are_left_alone(self):
+        with tempfile.TemporaryDirectory() as other:
+            shutil.copyfile(SAMPLE_FORM, Path(other) / "other.pdf")
+            self.assertEqual(self.index.update(other), IndexStats(added=1))
+        self.assertEqual(self.index.update(str(self.dir)), IndexStats(unchanged=2))
+        self.assertEqual(len(self.index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+TemplateCache tests: hits, invalidation by modification time and content, eviction
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests import DOCS  # isort: split
+
+from pdf_writer import fill_pdf_form_to_bytes
+from template_cache import TemplateCache
+from tests.test_round_trip import pypdf2_values
+
+LICENSE_FORM = DOCS / "License-Transfer-Form_fillable.pdf"
+SAMPLE_FORM = DOCS / "Sample-Fillable-PDF.pdf"
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = Path(self.temp_dir.name) / "template.pdf"
+        shutil.copyfile(LICENSE_FORM, self.path)
+
+    def test_hit_returns_the_same_template(self):
+        cache = TemplateCache()
+        first = cache.get(self.path)
+        self.assertIs(cache.get(str(self.path)), first)
+        self.assertEqual(len(cache), 1)
+
+    def test_touched_file_is_recompiled(self):
+        cache = TemplateCache()
+        first = cache.get(self.path)
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        second = cache.get(self.path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.content_hash, first.content_hash)
+
+    def test_changed_content_is_recompiled(self):
+        cache = TemplateCache()
+        first = cache.get(self.path)
+        shutil.copyfile(SAMPLE_FORM, self.path)
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        second = cache.get(self.path)
+        self.assertNotEqual(second.content_hash, first.content_hash)
+        self.assertIn("Name", second.fields)
+        self.assertNotIn("Name", first.fields)
+
+    def test_in_memory_sources_are_keyed_by_content(self):
+        cache = TemplateCache()
+        data = LICENSE_FORM.read_bytes()
+        first = cache.get(data)
+        self.assertIs(cache.get(bytearray(data)), first)
+        self.assertIsNone(first.path)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TemplateCache(max_size=2)
+        other = Path(self.temp_dir.name) / "other.pdf"
+        shutil.copyfile(SAMPLE_FORM, other)
+        first = cache.get(self.path)
+        cache.get(other)
+        cache.get(self.path)  # Now the most recently used
+        cache.get(LICENSE_FORM)
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(self.path), first)
+
+    def test_fills_do_not_leak_into_the_template(self):
+        template = TemplateCache().get(self.path)
+        first = pypdf2_values(fill_pdf_form_to_bytes(template, {"part1_license_number": "A-1"}))
+        second = pypdf2_values(fill_pdf_form_to_bytes(template, {"part1_licensee_first_name": "Jane"}))
+        self.assertEqual(first["part1_license_number"], "A-1")
+        self.assertNotEqual(second.get("part1_license_number"), "A-1")
+        self.assertEqual(second["part1_licensee_first_name"], "Jane")
+
+
+if __name__ == "__main__":
+    unittest.main()